@@ -0,0 +1,369 @@
+"""
+A self-contained static pipeline, on with ``FIRMSITE_STATIC_PIPELINE``.
+
+``vendor_static`` downloads the pinned third-party CSS, JS and fonts that
+``base.html`` otherwise loads from CDNs into ``static/vendor/``, once to
+commit with the code or as a build step. Every download, including the
+fonts the stylesheets refer to, must match its hash in ``LOCK_FILE``, so
+a build never ships a file that changed upstream. ``build_static``
+concatenates them with the site's own files into one stylesheet and one
+script (``BUNDLES``) and runs ``collectstatic``, whose
+``CompressedManifestStorage`` fingerprints every file through a manifest
+and writes gzip and, if the ``brotli`` package is installed, Brotli
+variants next to it. ``StaticFilesMiddleware`` then serves ``STATIC_ROOT``
+from the app with the best encoding the client accepts and far-future
+immutable caching of the fingerprinted names.
+Nothing needs the network after vendoring.
+"""
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import urllib.request
+from urllib.parse import urljoin, urlsplit
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, staticfiles_storage)
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # gzip only.
+    brotli = None
+
+
+# Local name: URL.
+VENDOR_ASSETS = {
+    'vendor/bootstrap/bootstrap.min.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.0.1/dist/css/'
+        'bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.0.1/dist/js/'
+        'bootstrap.bundle.min.js',
+    'vendor/fontawesome/css/all.min.css':
+        'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.3/css/'
+        'all.min.css',
+    'vendor/fonts/fonts.css':
+        'https://fonts.googleapis.com/css2?family=Lato:wght@300;700'
+        '&family=Roboto:wght@300&display=swap',
+}
+# URL: Subresource Integrity hash of every file vendor() downloads.
+LOCK_FILE = os.path.join(os.path.dirname(__file__), 'vendor.lock.json')
+LOCK_ALGORITHM = 'sha384'
+
+BUNDLES = {
+    'bundles/site.css': [
+        'vendor/bootstrap/bootstrap.min.css',
+        'vendor/fontawesome/css/all.min.css',
+        'vendor/fonts/fonts.css',
+        'css/style.css',
+    ],
+    'bundles/site.js': ['vendor/bootstrap/bootstrap.bundle.min.js'],
+}
+
+# Google Fonts only serves WOFF2 to browsers it recognises.
+USER_AGENT = (
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/120.0 Safari/537.36')
+
+COMPRESSIBLE = (
+    '.css', '.js', '.svg', '.json', '.txt', '.xml', '.eot', '.ttf', '.map')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Slow (seconds for the admin's files) but only paid at build time.
+BROTLI_QUALITY = 11
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+CHARSET_RE = re.compile(r'@charset\s+"[^"]*";')
+SOURCE_MAP_RE = re.compile(
+    r'/\*# sourceMappingURL=[^*]*\*/|^//# sourceMappingURL=.*$', re.M)
+
+
+def source_root():
+    """Where vendored files and bundles go: the first STATICFILES_DIRS."""
+    return settings.STATICFILES_DIRS[0]
+
+
+def read_lock():
+    try:
+        with open(LOCK_FILE, encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_lock(lock):
+    with open(LOCK_FILE, 'w', encoding='utf-8') as file:
+        json.dump(lock, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def integrity(data, algorithm=LOCK_ALGORITHM):
+    digest = base64.b64encode(hashlib.new(algorithm, data).digest())
+    return f'{algorithm}-{digest.decode()}'
+
+
+def _fetch(url, lock, pin=False):
+    """
+    Download ``url`` and check it against its hash in ``lock``. A URL not
+    in ``lock`` is refused, or pinned to what was downloaded with ``pin``.
+    """
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        data = response.read()
+    expected = lock.get(url)
+    if expected is None:
+        if not pin:
+            raise ValueError(
+                f"{url} is not pinned in {LOCK_FILE}; check it and run "
+                f"vendor_static --pin")
+        lock[url] = integrity(data)
+    elif integrity(data, expected.partition('-')[0]) != expected:
+        raise ValueError(f"{url} does not match its pinned hash")
+    return data
+
+
+def _is_local(ref):
+    return not (ref.startswith(('data:', '#', '/')) or urlsplit(ref).scheme)
+
+
+def _write(name, data):
+    path = os.path.join(source_root(), *name.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+def vendor(pin=False):
+    """
+    Download ``VENDOR_ASSETS`` and what their CSS refers to. With ``pin``,
+    files not in the lock yet are added to it once all downloads succeed.
+    """
+    lock = read_lock()
+    written = []
+    for name, url in VENDOR_ASSETS.items():
+        data = _fetch(url, lock, pin)
+        if name.endswith('.css'):
+            data, files = _localize(name, url, data.decode())
+            for file_name, file_url in files.items():
+                _write(file_name, _fetch(file_url, lock, pin))
+                written.append(file_name)
+            data = data.encode()
+        _write(name, data)
+        written.append(name)
+    if pin:
+        write_lock(lock)
+    return written
+
+
+def _localize(name, url, css):
+    """
+    Point the absolute ``url()``s of a stylesheet at local copies next to
+    it and return the CSS and the files to download for it.
+    """
+    directory = posixpath.dirname(name)
+    files = {}
+
+    def replace(match):
+        ref = match.group(2).strip()
+        if ref.startswith('data:'):
+            return match.group(0)
+        if _is_local(ref):
+            local = posixpath.normpath(posixpath.join(
+                directory, urlsplit(ref).path))
+            files[local] = urljoin(url, ref)
+            return match.group(0)
+        path = urlsplit(ref).path
+        local = posixpath.join(directory, posixpath.basename(path))
+        files[local] = ref
+        return f'url({posixpath.basename(path)})'
+
+    return URL_RE.sub(replace, css), files
+
+
+def _rebase(css, source, target):
+    """Rewrite the relative ``url()``s of ``source`` for use in ``target``."""
+    def replace(match):
+        ref = match.group(2).strip()
+        if not _is_local(ref):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', ref).groups()
+        absolute = posixpath.normpath(
+            posixpath.join(posixpath.dirname(source), path))
+        relative = posixpath.relpath(absolute, posixpath.dirname(target))
+        return f'url("{relative}{suffix}")'
+
+    return URL_RE.sub(replace, css)
+
+
+def bundle(name, sources):
+    parts = []
+    for source in sources:
+        path = finders.find(source)
+        if path is None:
+            raise FileNotFoundError(
+                f"{source} not found; run the vendor_static command")
+        with open(path, encoding='utf-8') as file:
+            content = SOURCE_MAP_RE.sub('', file.read())
+        if name.endswith('.css'):
+            content = _rebase(CHARSET_RE.sub('', content), source, name)
+        parts.append(f'/* {source} */\n{content.strip()}\n')
+    if name.endswith('.css'):
+        data = '@charset "UTF-8";\n' + ''.join(parts)
+    else:
+        data = ';\n'.join(parts)
+    _write(name, data.encode())
+    return name
+
+
+def build_bundles():
+    return [bundle(name, sources) for name, sources in BUNDLES.items()]
+
+
+def compress(path):
+    """Write the gzip and Brotli variants of ``path`` that save space."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    variants = {'.gz': gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=BROTLI_QUALITY)
+    written = []
+    for extension, compressed in variants.items():
+        if len(compressed) < len(data) * 0.95:
+            with open(path + extension, 'wb') as file:
+                file.write(compressed)
+            written.append(path + extension)
+    return written
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    """Fingerprinted names plus precompressed variants of text files."""
+
+    def post_process(self, *args, **kwargs):
+        yield from super().post_process(*args, **kwargs)
+        if kwargs.get('dry_run'):
+            return
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE):
+                compress(self.path(name))
+
+
+class StaticFile:
+
+    def __init__(self, path):
+        self.path = path
+        self.variants = {
+            encoding: path + extension for encoding, extension in ENCODINGS
+            if os.path.isfile(path + extension)}
+        self.mtime = os.stat(path).st_mtime
+        content_type, _ = mimetypes.guess_type(path)
+        self.content_type = content_type or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in (
+                'application/javascript', 'image/svg+xml'):
+            self.content_type += '; charset=utf-8'
+
+    def pick(self, accept_encoding):
+        """The ``(encoding, path)`` to send for an Accept-Encoding."""
+        accepted = set()
+        for part in accept_encoding.split(','):
+            coding, _, params = part.partition(';')
+            if params.replace(' ', '').rstrip('0.') == 'q=':
+                continue  # q=0 refuses the coding.
+            accepted.add(coding.strip().lower())
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and encoding in accepted:
+                return encoding, self.variants[encoding]
+        return None, self.path
+
+
+def index(root):
+    """The servable files under ``root`` by name, without their variants."""
+    files = {}
+    for directory, _, names in os.walk(root):
+        for file_name in names:
+            if file_name.endswith(tuple(ext for _, ext in ENCODINGS)):
+                continue
+            path = os.path.join(directory, file_name)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            files[name] = StaticFile(path)
+    return files
+
+
+class StaticFilesMiddleware:
+    """
+    Serve ``STATIC_ROOT`` before sessions and auth run. The files are
+    indexed once at startup, so run ``build_static`` before starting.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'FIRMSITE_STATIC_PIPELINE', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL
+        self.files = index(settings.STATIC_ROOT)
+        self.immutable = set(
+            getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.match(request)
+        if response is None:
+            response = self.get_response(request)
+        return response
+
+    async def __acall__(self, request):
+        # Only opens the file; the server streams it.
+        response = self.match(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+    def match(self, request):
+        """The response for a static file, or None for other requests."""
+        path = request.path_info
+        if request.method in ('GET', 'HEAD') and path.startswith(self.prefix):
+            name = path[len(self.prefix):]
+            if name in self.files:
+                return self.serve(request, name, self.files[name])
+        return None
+
+    def serve(self, request, name, file):
+        immutable = name in self.immutable
+        if not immutable and not was_modified_since(
+                request.META.get('HTTP_IF_MODIFIED_SINCE'), file.mtime):
+            return HttpResponseNotModified()
+        encoding, path = file.pick(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        response = FileResponse(
+            open(path, 'rb'), content_type=file.content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if file.variants:
+            response['Vary'] = 'Accept-Encoding'
+        response['Last-Modified'] = http_date(file.mtime)
+        response['Cache-Control'] = (
+            IMMUTABLE if immutable else 'public, max-age=60')
+        return response
+
+
+def pipeline(request):
+    """Context processor: whether ``base.html`` links the bundles."""
+    enabled = getattr(settings, 'FIRMSITE_STATIC_PIPELINE', False)
+    return {'static_pipeline': enabled}
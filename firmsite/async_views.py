@@ -0,0 +1,100 @@
+"""
+Coroutine versions of the blog views for ASGI deployments.
+
+Django 3.2 has no async ORM or cache API, so each view still runs its ORM
+work and template rendering as sync code. The difference is where: an
+ASGI server would otherwise serialize every sync view onto one shared
+thread. These views instead hand each request to a bounded pool of
+database threads (``FIRMSITE_ASYNC_DB_THREADS``), so the event loop keeps
+accepting requests while others wait on the database.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import profiling
+from . import views
+from .signals import check_connections, mark_connections_idle
+
+
+_executors = {}
+
+
+def get_executor():
+    """The pool, sized no larger than the database's connection budget."""
+    size = getattr(settings, 'FIRMSITE_ASYNC_DB_THREADS', 8)
+    if size not in _executors:
+        _executors[size] = ThreadPoolExecutor(
+            max_workers=size, thread_name_prefix='firmsite-db')
+    return _executors[size]
+
+
+def database_sync_to_async(func):
+    """
+    ``sync_to_async`` on the database pool. Each thread holds its own
+    connection, so it is checked before and released after every call,
+    just as the request signals do for WSGI workers.
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        check_connections()
+        try:
+            with profiling.profiled_connections():
+                return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+            mark_connections_idle()
+
+    async def call(*args, **kwargs):
+        return await sync_to_async(
+            run, thread_sensitive=False, executor=get_executor(),
+        )(*args, **kwargs)
+    return call
+
+
+class AsyncView:
+    """Expose ``view_class`` as a coroutine view via ``as_view()``."""
+
+    view_class = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = cls.view_class.as_view(**initkwargs)
+
+        def respond(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            # Render here rather than on the handler's shared thread.
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            return response
+
+        run = database_sync_to_async(respond)
+
+        async def async_view(request, *args, **kwargs):
+            return await run(request, *args, **kwargs)
+
+        update_wrapper(async_view, view)
+        return async_view
+
+
+class PostList(AsyncView):
+    view_class = views.PostList
+
+
+class PostDetail(AsyncView):
+    view_class = views.PostDetail
+
+
+class PostComments(AsyncView):
+    view_class = views.PostComments
+
+
+class PostLike(AsyncView):
+    view_class = views.PostLike
+
+
+class PostLikeAPI(AsyncView):
+    view_class = views.PostLikeAPI
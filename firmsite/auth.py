@@ -0,0 +1,75 @@
+"""
+Signed-in users verified from the cache between requests.
+
+``CachedAuthenticationMiddleware`` replaces Django's
+``AuthenticationMiddleware``. For ``FIRMSITE_USER_CACHE_TIMEOUT`` seconds
+the cache keeps the pk of the user a session points at and that user's
+session auth hash - never the user row or its password hash. A request
+whose session hash matches is signed in without a ``SELECT`` on
+``auth_user``; the row is only read, in one query, once the request uses
+more of the user than its pk. A password change still logs other
+sessions out as before, and saving or deleting a user drops the entry.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from . import cache as page_cache
+
+
+USER_KEY = 'firmsite:user:{}'
+
+
+def user_timeout():
+    return getattr(settings, 'FIRMSITE_USER_CACHE_TIMEOUT', 60)
+
+
+class VerifiedUser(SimpleLazyObject):
+    """A signed-in user whose row is fetched on first use beyond its pk."""
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, pk):
+        model = auth.get_user_model()
+        super().__init__(lambda: model._default_manager.get(pk=pk))
+        self.__dict__['pk'] = self.__dict__['id'] = pk
+
+
+def get_user(request):
+    """``django.contrib.auth.get_user()``, checked against the cache first."""
+    session = request.session
+    user_id = session.get(auth.SESSION_KEY)
+    if user_id is None or not user_timeout():
+        return auth.get_user(request)
+    key = USER_KEY.format(user_id)
+    cache = page_cache.get_cache()
+    verified = cache.get(key)
+    if verified is not None and session.get(
+            auth.BACKEND_SESSION_KEY) in settings.AUTHENTICATION_BACKENDS:
+        session_hash = session.get(auth.HASH_SESSION_KEY)
+        if session_hash and constant_time_compare(
+                session_hash, verified['session_hash']):
+            return VerifiedUser(verified['pk'])
+    # Not cached, or stale: Django verifies the session (and flushes it if
+    # it no longer matches the user).
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        cache.set(key, {
+            'pk': user.pk,
+            'session_hash': user.get_session_auth_hash(),
+        }, user_timeout())
+    return user
+
+
+def forget_user(user_id):
+    page_cache.get_cache().delete(USER_KEY.format(user_id))
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
@@ -0,0 +1,274 @@
+"""
+Page and fragment caching for the blog views.
+
+Cache keys embed generation counters rather than being deleted one by one:
+bumping a scope makes every page built from it unreachable at once.
+
+* ``posts`` - any post saved or deleted (all list and detail pages)
+* ``list`` - anything shown on the post cards, e.g. like counts
+* ``post:<slug>`` - a single detail page (likes, approved comments)
+* ``feeds`` - the RSS/Atom feeds and the sitemap index
+* ``sitemap`` / ``sitemap:<n>`` - all sitemap sections / one of them
+
+``ConditionalGetMixin`` adds weak ETags and a ``Cache-Control`` policy on
+top, so browsers and proxies can revalidate without a render.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.messages.storage.session import SessionStorage
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers)
+
+from .routers import use_primary
+
+
+POSTS = 'posts'
+LIST = 'list'
+POPULAR = 'popular'
+RELATED = 'related'
+FEEDS = 'feeds'
+SITEMAP = 'sitemap'
+
+
+def post_scope(slug):
+    return f'post:{slug}'
+
+
+def sitemap_scope(section):
+    return f'sitemap:{section}'
+
+
+def get_cache():
+    return caches[getattr(settings, 'FIRMSITE_CACHE_ALIAS', 'default')]
+
+
+def page_timeout():
+    return getattr(settings, 'FIRMSITE_PAGE_CACHE_TIMEOUT', 300)
+
+
+def _generation_key(scope):
+    return f'firmsite:gen:{scope}'
+
+
+def version(*scopes):
+    """Return a token that changes whenever one of ``scopes`` is bumped."""
+    cache = get_cache()
+    keys = [_generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    generations = []
+    for key in keys:
+        if key not in found:
+            # Seed from the clock so an evicted counter never reuses keys.
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+        generations.append(str(found[key]))
+    return '.'.join(generations)
+
+
+def invalidate(*scopes):
+    cache = get_cache()
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def invalidate_posts(slugs, listed=False):
+    """Invalidate the detail pages of ``slugs`` and optionally the list."""
+    scopes = [post_scope(slug) for slug in slugs]
+    if listed:
+        scopes.append(LIST)
+    invalidate(*scopes)
+
+
+def get_or_build(key, build, timeout=None):
+    """
+    Return the cached value for ``key``, calling ``build`` on a miss.
+
+    Entries have a soft expiry: once it passes, one caller takes a lock and
+    rebuilds while everyone else keeps serving the stale value. With nothing
+    cached yet, callers wait for the lock holder rather than all querying
+    the database at once. ``build`` may return ``None`` to skip caching.
+    It reads from the primary: what it returns is served to everyone, so
+    it must not come from a lagging read replica.
+    """
+    cache = get_cache()
+    timeout = page_timeout() if timeout is None else timeout
+    lock_timeout = getattr(settings, 'FIRMSITE_PAGE_CACHE_LOCK_TIMEOUT', 10)
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + lock_timeout
+
+    while True:
+        entry = cache.get(key)
+        if entry is not None and entry['expires'] > time.time():
+            return entry['value']
+        if cache.add(lock_key, 1, lock_timeout):
+            try:
+                with use_primary():
+                    value = build()
+                if value is not None:
+                    cache.set(key, {
+                        'value': value,
+                        'expires': time.time() + timeout,
+                    }, timeout * 2)
+                return value
+            finally:
+                cache.delete(lock_key)
+        if entry is not None:
+            return entry['value']
+        if time.monotonic() > deadline:
+            return build()
+        time.sleep(0.05)
+
+
+def has_pending_messages(request):
+    if CookieStorage.cookie_name in request.COOKIES:
+        return True
+    session = getattr(request, 'session', None)
+    return session is not None and SessionStorage.session_key in session
+
+
+def is_cacheable(request):
+    """Only anonymous GETs without pending messages share a page."""
+    if not getattr(settings, 'FIRMSITE_PAGE_CACHE', True):
+        return False
+    if request.method != 'GET' or has_pending_messages(request):
+        return False
+    return not request.user.is_authenticated
+
+
+# Response headers stored with a cached page and replayed on hits.
+CACHED_HEADERS = ('ETag', 'Cache-Control')
+
+
+def page_key(request, scopes):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'firmsite:page:{version(*scopes)}:{path}'
+
+
+def fragment_context(*scopes):
+    """Context for ``{% cache %}`` fragments shared by all users."""
+    return {
+        'alias': getattr(settings, 'FIRMSITE_CACHE_ALIAS', 'default'),
+        'timeout': page_timeout(),
+        'version': version(*scopes),
+    }
+
+
+class CachedPageMixin:
+    """Serve whole pages from the cache for anonymous readers."""
+
+    cache_scopes = ()
+
+    def get_cache_scopes(self):
+        return self.cache_scopes
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        rendered = []
+        dispatch = super().dispatch
+
+        def build():
+            response = dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            rendered.append(response)
+            if response.status_code != 200 or response.cookies:
+                return None
+            return {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'headers': {
+                    name: response[name] for name in CACHED_HEADERS
+                    if response.has_header(name)
+                },
+            }
+
+        page = get_or_build(page_key(request, self.get_cache_scopes()), build)
+        if rendered:
+            return rendered[0]
+        response = HttpResponse(
+            page['content'], content_type=page['content_type'])
+        for name, value in page.get('headers', {}).items():
+            response[name] = value
+        return get_conditional_response(
+            request, etag=response.get('ETag'), response=response)
+
+
+def make_etag(request, state):
+    """
+    A weak ETag for ``state`` as seen by this user. The CSRF cookie is part
+    of it because a 304 keeps the page's embedded token.
+    """
+    if state is None:
+        return None
+    seed = repr((
+        getattr(settings, 'FIRMSITE_ETAG_SALT', ''),
+        request.user.pk,
+        request.META.get('CSRF_COOKIE'),
+        state,
+    ))
+    return f'W/"{hashlib.md5(seed.encode()).hexdigest()}"'
+
+
+def patch_cache_policy(request, response):
+    """Shared caches may keep anonymous pages; the rest must revalidate."""
+    if (request.user.is_authenticated or response.cookies
+            or has_pending_messages(request)):
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(
+            response, public=True,
+            max_age=getattr(settings, 'FIRMSITE_HTTP_MAX_AGE', 0),
+            s_maxage=getattr(settings, 'FIRMSITE_HTTP_S_MAXAGE', 60))
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer ``If-None-Match`` with a 304 before rendering anything.
+
+    ``get_etag_state()`` should be one cheap query for everything the page
+    shows. Views may set ``etag_state`` while rendering to skip it.
+    """
+
+    etag_state = None
+
+    def get_etag_state(self):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        validate = not has_pending_messages(request)
+        state = None
+        if validate and 'HTTP_IF_NONE_MATCH' in request.META:
+            state = self.get_etag_state()
+            etag = make_etag(request, state)
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                response['ETag'] = etag
+                return patch_cache_policy(request, response)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if validate and response.status_code == 200:
+            # Rendering may have issued a new CSRF cookie, so the ETag is
+            # made afterwards.
+            if self.etag_state is not None:
+                state = self.etag_state
+            elif state is None:
+                state = self.get_etag_state()
+            etag = make_etag(request, state)
+            if etag:
+                response['ETag'] = etag
+        return patch_cache_policy(request, response)
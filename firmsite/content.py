@@ -0,0 +1,117 @@
+"""
+Save-time processing of post bodies.
+
+``render()`` turns the Summernote HTML of a post into everything the blog
+pages show: sanitized and minified HTML with anchors on its headings, a
+table of contents, a summary for the cards and a word count with reading
+time. ``Post.save()`` stores the results so reads do no processing.
+"""
+import html
+import math
+import re
+
+import bleach
+from django.utils.html import strip_tags
+from django.utils.text import Truncator, slugify
+
+
+ALLOWED_TAGS = frozenset({
+    'a', 'b', 'blockquote', 'br', 'code', 'em', 'h1', 'h2', 'h3', 'h4',
+    'h5', 'h6', 'hr', 'i', 'img', 'li', 'ol', 'p', 'pre', 's', 'span',
+    'strike', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'th', 'thead',
+    'tr', 'u', 'ul',
+})
+ALLOWED_PROTOCOLS = frozenset({'http', 'https', 'mailto', 'tel', 'data'})
+
+
+def _allow_link(tag, name, value):
+    return name == 'title' or (
+        name == 'href' and not value.lower().startswith('data:'))
+
+
+def _allow_image(tag, name, value):
+    if name == 'src':
+        # Summernote inlines pasted images as data URIs.
+        return value.lower().startswith(('http:', 'https:', 'data:image/'))
+    return name in ('alt', 'title', 'width', 'height')
+
+
+ALLOWED_ATTRIBUTES = {
+    'a': _allow_link,
+    'img': _allow_image,
+    'td': ['colspan', 'rowspan'],
+    'th': ['colspan', 'rowspan'],
+}
+
+BLOCK_TAGS = (
+    'blockquote|br|h[1-6]|hr|li|ol|p|pre|table|tbody|td|th|thead|tr|ul')
+BLOCK_TAG_RE = re.compile(rf'\s*(</?(?:{BLOCK_TAGS})\b[^>]*>)\s*')
+# Stripping keeps the text of disallowed tags, which these should not have.
+SCRIPT_RE = re.compile(r'<(script|style)\b.*?</\1\s*>', re.S | re.I)
+PRE_RE = re.compile(r'(<pre\b.*?</pre>)', re.S)
+HEADING_RE = re.compile(r'<(h[23])>(.*?)</\1>', re.S)
+
+SUMMARY_WORDS = 30
+WORDS_PER_MINUTE = 200
+
+RENDERED_FIELDS = (
+    'content_html', 'toc', 'summary', 'word_count', 'reading_time')
+
+
+def sanitize(content):
+    content = SCRIPT_RE.sub('', content)
+    return bleach.clean(
+        content, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES,
+        protocols=ALLOWED_PROTOCOLS, strip=True, strip_comments=True)
+
+
+def minify(content):
+    """Collapse whitespace, except inside ``<pre>`` blocks."""
+    parts = PRE_RE.split(content)
+    for i in range(0, len(parts), 2):
+        part = re.sub(r'\s+', ' ', parts[i])
+        parts[i] = BLOCK_TAG_RE.sub(r'\1', part)
+    return ''.join(parts).strip()
+
+
+def add_heading_anchors(content):
+    """Give ``h2``/``h3`` headings unique ids; return the html and TOC."""
+    toc = []
+    seen = set()
+
+    def anchor(match):
+        tag, inner = match.groups()
+        title = html.unescape(strip_tags(inner)).strip()
+        slug = base = slugify(title) or 'section'
+        n = 1
+        while slug in seen:
+            n += 1
+            slug = f'{base}-{n}'
+        seen.add(slug)
+        toc.append({'level': int(tag[1]), 'id': slug, 'title': title})
+        return f'<{tag} id="{slug}">{inner}</{tag}>'
+
+    return HEADING_RE.sub(anchor, content), toc
+
+
+def render(content, excerpt=''):
+    """The stored derivatives of a post body, keyed by field name."""
+    sanitized = sanitize(content)
+    content_html, toc = add_heading_anchors(minify(sanitized))
+    # Block tags separate words even where the source has no whitespace.
+    text = html.unescape(strip_tags(BLOCK_TAG_RE.sub(r' \1 ', sanitized)))
+    text = ' '.join(text.split())
+    word_count = len(text.split())
+    summary = excerpt.strip() or Truncator(text).words(SUMMARY_WORDS)
+    return {
+        'content_html': content_html,
+        'toc': toc,
+        'summary': summary,
+        'word_count': word_count,
+        'reading_time': max(1, math.ceil(word_count / WORDS_PER_MINUTE)),
+    }
+
+
+def apply(post):
+    for name, value in render(post.content, post.excerpt).items():
+        setattr(post, name, value)
@@ -0,0 +1,187 @@
+"""
+The sitemap and the RSS/Atom feeds of published posts, kept as pre-built
+documents in the page cache.
+
+The sitemap is split into sections of ``FIRMSITE_SITEMAP_SECTION_SIZE``
+post ids, listed by ``/sitemap.xml``. A saved or deleted post invalidates
+the feeds, the index and its own section only (``posts_changed()``), so
+the next request rebuilds each of them with one query and every other
+section stays cached. Documents carry an ETag and a Last-Modified date;
+hits and 304s are answered from the cache without a query. Their links
+start with ``FIRMSITE_SITE_URL``, or the requested host if it is unset.
+"""
+import hashlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, IntegerField, Max
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils import feedgenerator
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import cache as page_cache
+from .models import Post
+
+
+FEED_TITLE = "De Jure Law Firm"
+FEED_DESCRIPTION = "The latest posts from De Jure Law Firm."
+FEED_LENGTH = 20
+FEED_TYPES = {
+    'rss': feedgenerator.Rss201rev2Feed,
+    'atom': feedgenerator.Atom1Feed,
+}
+SITEMAP_CONTENT_TYPE = 'application/xml; charset=utf-8'
+SITEMAP_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<{} xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+# Keys change with every invalidation, so entries only expire to free space.
+DOCUMENT_TIMEOUT = 24 * 3600
+
+
+def section_size():
+    # Search engines accept at most 50,000 URLs per sitemap.
+    return getattr(settings, 'FIRMSITE_SITEMAP_SECTION_SIZE', 10000)
+
+
+def site_url(request=None):
+    url = getattr(settings, 'FIRMSITE_SITE_URL', '').rstrip('/')
+    if url or request is None:
+        return url
+    return request.build_absolute_uri('/')[:-1]
+
+
+def section(post_id):
+    return (post_id - 1) // section_size() + 1
+
+
+def posts_changed(post_ids=None):
+    """Invalidate the documents listing ``post_ids``; None means all posts."""
+    if post_ids is None:
+        page_cache.invalidate(page_cache.FEEDS, page_cache.SITEMAP)
+    else:
+        page_cache.invalidate(page_cache.FEEDS, *{
+            page_cache.sitemap_scope(section(pk)) for pk in post_ids})
+
+
+def _w3c(value):
+    return value.replace(microsecond=0).isoformat()
+
+
+def _document(content, content_type, last_modified):
+    return {
+        'content': content,
+        'content_type': content_type,
+        'etag': f'"{hashlib.md5(content).hexdigest()}"',
+        'last_modified': last_modified and int(last_modified.timestamp()),
+    }
+
+
+def _sitemap(root, entries):
+    """A sitemap or index of ``(tag, URL, lastmod)`` entries."""
+    parts = [SITEMAP_HEADER.format(root)]
+    for tag, url, lastmod in entries:
+        parts.append(f'<{tag}><loc>{escape(url)}</loc>'
+                     f'<lastmod>{_w3c(lastmod)}</lastmod></{tag}>\n')
+    parts.append(f'</{root}>\n')
+    return ''.join(parts).encode()
+
+
+def build_index(base):
+    """The sitemap index, from one grouped query over published posts."""
+    sections = list(Post.objects.filter(status=1).annotate(
+        section=ExpressionWrapper(
+            (F('pk') - 1) / section_size() + 1, output_field=IntegerField()),
+    ).order_by().values('section').annotate(
+        lastmod=Max('updated_on')).order_by('section'))
+    content = _sitemap('sitemapindex', [
+        ('sitemap', base + reverse('sitemap_section', args=[entry['section']]),
+         entry['lastmod'])
+        for entry in sections])
+    return _document(content, SITEMAP_CONTENT_TYPE, max(
+        (entry['lastmod'] for entry in sections), default=None))
+
+
+def build_section(base, number):
+    """One section of the sitemap, or None if it lists no post."""
+    size = section_size()
+    posts = list(Post.objects.filter(
+        status=1, pk__gt=(number - 1) * size, pk__lte=number * size,
+    ).order_by('pk').values_list('slug', 'updated_on'))
+    if not posts:
+        return None
+    content = _sitemap('urlset', [
+        ('url', base + reverse('post_detail', args=[slug]), updated_on)
+        for slug, updated_on in posts])
+    return _document(content, SITEMAP_CONTENT_TYPE,
+                     max(updated_on for _, updated_on in posts))
+
+
+def build_feed(base, feed_type):
+    """The latest posts as an RSS or Atom feed."""
+    feed = FEED_TYPES[feed_type](
+        title=FEED_TITLE,
+        link=base + reverse('home'),
+        description=FEED_DESCRIPTION,
+        feed_url=base + reverse(f'{feed_type}_feed'),
+        language=settings.LANGUAGE_CODE,
+    )
+    posts = Post.objects.filter(status=1).for_cards().order_by(
+        '-created_on', '-id')[:FEED_LENGTH]
+    for post in posts:
+        link = base + reverse('post_detail', args=[post.slug])
+        feed.add_item(
+            title=post.title,
+            link=link,
+            unique_id=link,
+            description=post.excerpt or post.summary,
+            author_name=post.author.username,
+            pubdate=post.created_on,
+            updateddate=post.updated_on,
+        )
+    return _document(feed.writeString('utf-8').encode(), feed.content_type,
+                     feed.latest_post_date() if posts else None)
+
+
+class DocumentMixin:
+    """
+    Serve the document from ``build_document(base)``, cached under
+    ``get_cache_scopes()``, with conditional GET. Documents are the same
+    for every reader, signed in or not.
+    """
+
+    cache_scopes = (page_cache.FEEDS,)
+
+    def get_cache_scopes(self):
+        return self.cache_scopes
+
+    def build_document(self, base):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        base = site_url(request)
+        if getattr(settings, 'FIRMSITE_PAGE_CACHE', True):
+            url = hashlib.md5((base + request.path).encode()).hexdigest()
+            version = page_cache.version(*self.get_cache_scopes())
+            document = page_cache.get_or_build(
+                f'firmsite:document:{version}:{url}',
+                lambda: self.build_document(base), DOCUMENT_TIMEOUT)
+        else:
+            document = self.build_document(base)
+        if document is None:
+            raise Http404
+        last_modified = document['last_modified']
+        response = get_conditional_response(
+            request, etag=document['etag'], last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(
+                document['content'], content_type=document['content_type'])
+        response['ETag'] = document['etag']
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(
+            response, public=True,
+            max_age=getattr(settings, 'FIRMSITE_HTTP_MAX_AGE', 0),
+            s_maxage=getattr(settings, 'FIRMSITE_HTTP_S_MAXAGE', 60))
+        return response
@@ -0,0 +1,184 @@
+"""
+Responsive width variants of ``Post.featured_image``.
+
+Each named variant is a set of widths rendered into a ``srcset``. With the
+``cloudinary`` backend the variants are Cloudinary transformations; the
+``local`` backend resizes originals with Pillow into the filesystem, which
+also works offline. URL building is memoized per image and variant.
+"""
+import logging
+import os
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+try:
+    from PIL import Image
+except ImportError:  # Only the local backend needs Pillow.
+    Image = None
+
+
+logger = logging.getLogger('firmsite.images')
+
+DEFAULT_IMAGE = (
+    'https://codeinstitute.s3.amazonaws.com/fullstack/blog/default.jpg')
+PLACEHOLDER = 'placeholder'
+
+VARIANTS = {
+    'card': {
+        'widths': (320, 480, 640),
+        'sizes': '(min-width: 768px) 33vw, 100vw',
+    },
+    'detail': {
+        'widths': (640, 960, 1280),
+        'sizes': '(min-width: 768px) 50vw, 100vw',
+    },
+}
+
+JPEG_QUALITY = 82
+
+
+def image_key(image):
+    """``(public_id, format)`` of a ``CloudinaryField`` value or string."""
+    if not image:
+        return PLACEHOLDER, ''
+    public_id = getattr(image, 'public_id', None) or str(image)
+    return public_id, getattr(image, 'format', None) or ''
+
+
+def is_placeholder(image):
+    return image_key(image)[0] == PLACEHOLDER
+
+
+class CloudinaryBackend:
+    generates_on_save = False
+
+    def transformation(self, width):
+        return {'width': width, 'crop': 'limit', 'quality': 'auto'}
+
+    def url(self, public_id, fmt, width):
+        import cloudinary
+        return cloudinary.CloudinaryImage(public_id, format=fmt).build_url(
+            secure=True, **self.transformation(width))
+
+    def generate(self, public_id, fmt, widths, force=False):
+        """Ask Cloudinary to build the derivatives ahead of the first view."""
+        import cloudinary.uploader
+        cloudinary.uploader.explicit(
+            public_id, type='upload', eager_async=True,
+            eager=[self.transformation(width) for width in widths])
+        return len(widths)
+
+
+class LocalBackend:
+    """
+    Originals are read from ``<root>/originals/<public_id>.<format>`` and
+    derivatives written to ``<root>/derivatives/``.
+    """
+    generates_on_save = True
+
+    def __init__(self, root, base_url):
+        self.storage = FileSystemStorage(location=root, base_url=base_url)
+
+    def source_name(self, public_id, fmt):
+        return f'originals/{public_id}.{fmt}' if fmt else (
+            f'originals/{public_id}')
+
+    def name(self, public_id, width):
+        return f'derivatives/{public_id}-{width}w.jpg'
+
+    def url(self, public_id, fmt, width):
+        return self.storage.url(self.name(public_id, width))
+
+    def generate(self, public_id, fmt, widths, force=False):
+        if Image is None:
+            raise ImproperlyConfigured(
+                "The local image backend requires Pillow.")
+        names = {width: self.name(public_id, width) for width in widths}
+        if not force:
+            names = {
+                width: name for width, name in names.items()
+                if not self.storage.exists(name)
+            }
+        if not names:
+            return 0
+        with self.storage.open(self.source_name(public_id, fmt)) as source:
+            original = Image.open(source)
+            original.load()
+        if original.mode != 'RGB':
+            original = original.convert('RGB')
+        for width, name in names.items():
+            image = original
+            # Never upscale: small originals are stored at their own size.
+            if original.width > width:
+                height = round(original.height * width / original.width)
+                image = original.resize(
+                    (width, height), Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True,
+                       progressive=True)
+            self.storage.delete(name)
+            self.storage.save(name, ContentFile(buffer.getvalue()))
+        return len(names)
+
+
+_backends = {}
+
+
+def get_backend():
+    name = getattr(settings, 'FIRMSITE_IMAGE_BACKEND', 'cloudinary')
+    if name == 'cloudinary':
+        key = (name,)
+    elif name == 'local':
+        root = getattr(settings, 'FIRMSITE_IMAGE_ROOT', None) or (
+            os.path.join(settings.BASE_DIR, 'media'))
+        key = (name, str(root), settings.MEDIA_URL)
+    else:
+        raise ImproperlyConfigured(f"Unknown image backend {name!r}")
+    if key not in _backends:
+        _backends[key] = (
+            CloudinaryBackend() if name == 'cloudinary'
+            else LocalBackend(key[1], key[2]))
+    return _backends[key]
+
+
+@lru_cache(maxsize=4096)
+def _sources(backend, public_id, fmt, variant):
+    widths = VARIANTS[variant]['widths']
+    urls = [(width, backend.url(public_id, fmt, width)) for width in widths]
+    srcset = ', '.join(f'{url} {width}w' for width, url in urls)
+    return urls[0][1], srcset
+
+
+def image_sources(image, variant):
+    """``(src, srcset, sizes)`` for ``image`` at the named variant."""
+    if is_placeholder(image):
+        return DEFAULT_IMAGE, '', ''
+    src, srcset = _sources(get_backend(), *image_key(image), variant)
+    return src, srcset, VARIANTS[variant]['sizes']
+
+
+def generate_derivatives(image, variants=None, force=False):
+    """Build every width of ``variants`` (all by default) for ``image``."""
+    if is_placeholder(image):
+        return 0
+    widths = sorted({
+        width for variant in (variants or VARIANTS)
+        for width in VARIANTS[variant]['widths']
+    })
+    return get_backend().generate(*image_key(image), widths, force=force)
+
+
+def generate_on_save(image):
+    """Build derivatives after a save, if the backend does that eagerly."""
+    if not get_backend().generates_on_save:
+        return
+    try:
+        generate_derivatives(image)
+    except (OSError, ImproperlyConfigured):
+        logger.warning("Could not build derivatives of %s",
+                       image_key(image)[0], exc_info=True)
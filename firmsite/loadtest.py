@@ -0,0 +1,281 @@
+"""
+Load tests for the blog endpoints.
+
+Virtual users replay a weighted mix of scenarios - paging through ``home``,
+reading posts, posting comments and toggling likes - against the site in
+process (Django's test client, through the WSGI handler) or a running
+server over HTTP. The report has latency percentiles, throughput and
+queries per request; query counts come from the ``Server-Timing`` header,
+so the server needs ``FIRMSITE_PROFILING`` on.
+"""
+import html
+import http.cookiejar
+import math
+import random
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.test import Client
+from django.urls import include, path, reverse
+
+from .urls import blog_patterns
+
+
+# base.html links to pages that are not part of this app yet.
+PLACEHOLDER_PAGES = ('about', 'services', 'book', 'contact', 'dashboard')
+
+
+def placeholder(request):
+    return HttpResponse()
+
+
+def urlconf(blog_views):
+    """The project URLconf with the blog routes served by ``blog_views``."""
+    module = ModuleType(f'{blog_views.__name__}_loadtest_urls')
+    module.urlpatterns = [
+        path(f'__{name}/', placeholder, name=name)
+        for name in PLACEHOLDER_PAGES
+    ] + [
+        path('', include(blog_patterns(blog_views))),
+        path('', include(settings.ROOT_URLCONF)),
+    ]
+    return module
+
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+NEXT_PAGE_RE = re.compile(r'href="(\?[^"]+)" class="page-link"> NEXT')
+
+
+def percentile(timings, pct):
+    """Nearest-rank percentile of the sorted ``timings``."""
+    return timings[max(0, math.ceil(len(timings) * pct / 100) - 1)]
+
+
+def summary(name, timings, elapsed, queries=()):
+    timings = sorted(timings)
+    line = (
+        f"{name:<12} {len(timings):6d} req {len(timings) / elapsed:8.1f} "
+        f"req/s   p50 {percentile(timings, 50):7.1f} ms   "
+        f"p95 {percentile(timings, 95):7.1f} ms   "
+        f"p99 {percentile(timings, 99):7.1f} ms"
+    )
+    if queries:
+        line += f"   {statistics.mean(queries):5.1f} queries/req"
+    return line
+
+
+class Report:
+    """Latencies, query counts and errors per request name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.elapsed = 0.0
+
+    def record(self, name, timing, status, queries):
+        with self._lock:
+            self.timings[name].append(timing)
+            if queries is not None:
+                self.queries[name].append(queries)
+            if status >= 400:
+                self.errors[name] += 1
+
+    def requests(self):
+        return sum(len(timings) for timings in self.timings.values())
+
+    def lines(self):
+        for name in sorted(self.timings):
+            yield summary(name, self.timings[name], self.elapsed,
+                          self.queries[name])
+        yield summary(
+            'total', [t for ts in self.timings.values() for t in ts],
+            self.elapsed, [q for qs in self.queries.values() for q in qs])
+        for name, count in sorted(self.errors.items()):
+            yield f"{name}: {count} error response(s)"
+
+
+class Session:
+    """
+    One virtual user. ``request()`` sends through ``client``, a
+    ``InProcessClient`` or ``HTTPClient``, and times it into the report.
+    """
+
+    def __init__(self, report, client):
+        self.report = report
+        self.client = client
+
+    def request(self, name, method, url, data=None):
+        started = time.perf_counter()
+        status, server_timing, body = self.client.send(method, url, data)
+        timing = (time.perf_counter() - started) * 1000
+        match = QUERIES_RE.search(server_timing)
+        self.report.record(
+            name, timing, status, int(match.group(1)) if match else None)
+        return body
+
+
+class InProcessClient:
+    """Requests to the site in process, through Django's test client."""
+
+    def __init__(self, user=None):
+        self.client = Client()
+        if user is not None:
+            self.client.force_login(user)
+
+    def send(self, method, url, data=None):
+        """Return the status, ``Server-Timing`` header and body."""
+        response = getattr(self.client, method)(url, data)
+        return (response.status_code, response.get('Server-Timing', ''),
+                response.content.decode())
+
+
+class LoginFailed(Exception):
+    pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Redirects are timed as the responses they are, not followed.
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient:
+    """Requests to a running server, with its own cookies."""
+
+    def __init__(self, base_url, credentials=None):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+        if credentials:
+            self.login(*credentials)
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                return cookie.value
+        return ''
+
+    def send(self, method, url, data=None):
+        """Return the status, ``Server-Timing`` header and body."""
+        url = self.base_url + url
+        body = None
+        if method == 'post':
+            data = {**(data or {}), 'csrfmiddlewaretoken': self.csrf_token()}
+            body = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(
+            url, data=body, method=method.upper(), headers={'Referer': url})
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                return (response.status,
+                        response.headers.get('Server-Timing', ''),
+                        response.read().decode())
+        except urllib.error.HTTPError as error:
+            return (error.code, error.headers.get('Server-Timing', ''),
+                    error.read().decode(errors='replace'))
+
+    def login(self, email, password):
+        url = reverse('account_login')
+        self.send('get', url)
+        status, _, _ = self.send(
+            'post', url, {'login': email, 'password': password})
+        if status != 302:
+            raise LoginFailed(f"Could not log in as {email} ({status})")
+
+
+Fixture = namedtuple('Fixture', 'slugs users')
+
+
+def browse(session, fixture, rng):
+    """The home page and up to two more pages of the feed."""
+    url = reverse('home')
+    for _ in range(3):
+        match = NEXT_PAGE_RE.search(session.request('home', 'get', url))
+        if not match:
+            break
+        url = reverse('home') + html.unescape(match.group(1))
+
+
+def read(session, fixture, rng):
+    slug = rng.choice(fixture.slugs)
+    session.request('post_detail', 'get', reverse('post_detail', args=[slug]))
+
+
+def comment(session, fixture, rng):
+    """Read a post, then comment on it (the comment awaits moderation)."""
+    url = reverse('post_detail', args=[rng.choice(fixture.slugs)])
+    session.request('post_detail', 'get', url)
+    session.request('comment', 'post', url, {
+        'body': f"Load test comment {rng.randrange(10 ** 6)}"})
+
+
+def like(session, fixture, rng):
+    """Like and unlike a post, leaving its likes as they were."""
+    url = reverse('post_like', args=[rng.choice(fixture.slugs)])
+    session.request('like', 'post', url)
+    session.request('like', 'post', url)
+
+
+Scenario = namedtuple('Scenario', 'run login')
+
+SCENARIOS = {
+    'browse': Scenario(browse, login=False),
+    'read': Scenario(read, login=False),
+    'comment': Scenario(comment, login=True),
+    'like': Scenario(like, login=True),
+}
+DEFAULT_MIX = {'browse': 4, 'read': 4, 'comment': 1, 'like': 1}
+
+
+def run(make_client, fixture, mix=None, iterations=200, workers=4,
+        random_seed=0):
+    """
+    Run ``iterations`` scenarios picked by the weights in ``mix`` across
+    ``workers`` threads. ``make_client(user)`` builds a client for a
+    session, logged in unless ``user`` is None.
+    """
+    mix = mix or DEFAULT_MIX
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    needs_login = any(SCENARIOS[name].login for name in names)
+    if needs_login and not fixture.users:
+        raise ValueError("The scenarios need users to log in as.")
+
+    report = Report()
+    sessions = [
+        (Session(report, make_client(None)),
+         Session(report, make_client(fixture.users[n % len(fixture.users)]))
+         if needs_login else None)
+        for n in range(workers)
+    ]
+
+    def work(worker):
+        rng = random.Random(f'{random_seed}-{worker}')
+        anonymous, member = sessions[worker]
+        try:
+            for _ in range(worker, iterations, workers):
+                scenario = SCENARIOS[rng.choices(names, weights)[0]]
+                scenario.run(
+                    member if scenario.login else anonymous, fixture, rng)
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(work, range(workers)))
+    report.elapsed = time.perf_counter() - started
+    return report
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from firmsite import async_views, views
+from firmsite.loadtest import summary, urlconf
+from firmsite.models import Post
+
+
+class QueryLatency:
+    """Execute wrapper that sleeps before every query, like a remote DB."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare sync (WSGI) and async (ASGI) views under concurrent load "
+        "with simulated database latency, in process. Needs published "
+        "posts, e.g. from benchmark_queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Sync worker threads, like gunicorn's sync workers.")
+        parser.add_argument(
+            '--concurrency', type=int, default=64,
+            help="Requests in flight against the async views.")
+        parser.add_argument(
+            '--db-threads', type=int,
+            help="Override ASYNC_DB_THREADS for the async run.")
+        parser.add_argument(
+            '--latency-ms', type=float, default=20.0,
+            help="Simulated round-trip time added to every query.")
+        parser.add_argument(
+            '--page-cache', action='store_true',
+            help="Keep the page cache on (it hides the database).")
+
+    def handle(self, *args, **options):
+        slugs = list(Post.objects.filter(status=1).values_list(
+            'slug', flat=True)[:50])
+        if not slugs:
+            raise CommandError("No published posts to request.")
+        urls = [
+            '/' if n % 2 else f'/{slugs[n // 2 % len(slugs)]}/'
+            for n in range(options['requests'])
+        ]
+
+        latency = QueryLatency(options['latency_ms'] / 1000)
+        connection_created.connect(latency.install)
+        for connection in connections.all():
+            latency.install(connection)
+        overrides = {
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+            'FIRMSITE_PAGE_CACHE': options['page_cache'],
+            'FIRMSITE_PROFILING': False,
+        }
+        if options['db_threads']:
+            overrides['FIRMSITE_ASYNC_DB_THREADS'] = options['db_threads']
+        try:
+            with override_settings(ROOT_URLCONF=urlconf(views), **overrides):
+                sync = self.run_sync(urls, options['workers'])
+            with override_settings(ROOT_URLCONF=urlconf(async_views),
+                                   **overrides):
+                asgi = asyncio.run(
+                    self.run_async(urls, options['concurrency']))
+        finally:
+            connection_created.disconnect(latency.install)
+
+        self.stdout.write(
+            f"{len(urls)} requests, {options['latency_ms']:g} ms per query")
+        self.stdout.write(summary('wsgi', *sync))
+        self.stdout.write(summary('asgi', *asgi))
+
+    def check_response(self, url, response):
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
+
+    def run_sync(self, urls, workers):
+        def work(chunk):
+            client = Client()
+            timings = []
+            try:
+                for url in chunk:
+                    started = time.perf_counter()
+                    self.check_response(url, client.get(url))
+                    timings.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections.close_all()
+            return timings
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(workers) as pool:
+            chunks = pool.map(work, [urls[n::workers] for n in range(workers)])
+            timings = [timing for chunk in chunks for timing in chunk]
+        return timings, time.perf_counter() - started
+
+    async def run_async(self, urls, concurrency):
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def fetch(url):
+            async with slots:
+                started = time.perf_counter()
+                self.check_response(url, await client.get(url))
+                return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(fetch(url) for url in urls))
+        return timings, time.perf_counter() - started
@@ -0,0 +1,117 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from firmsite.models import Post, Comment
+from firmsite.seed import seed
+
+
+LIKES_INDEX_SQL = (
+    'CREATE INDEX firmsite_post_likes_user_post_idx '
+    'ON firmsite_post_likes (user_id, post_id);'
+)
+LIKES_INDEX_DROP_SQL = 'DROP INDEX firmsite_post_likes_user_post_idx;'
+
+
+def hot_queries(post_id, user_id):
+    PostLikes = Post.likes.through
+    return [
+        ('published feed',
+         Post.objects.filter(status=1).order_by('-created_on', '-id')[:7]),
+        ('approved comments',
+         Comment.objects.filter(post_id=post_id, approved=True)
+         .order_by('-created_on')),
+        ('liked by user',
+         PostLikes.objects.filter(post_id=post_id, user_id=user_id)[:1]),
+        ('posts liked by user',
+         PostLikes.objects.filter(user_id=user_id).values('post_id')),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic posts/comments/likes and time the hot firmsite "
+        "queries with and without their indexes. Destructive: use a "
+        "throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=1000000)
+        parser.add_argument('--likes', type=int, default=200000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--no-seed', action='store_true',
+            help="Reuse rows seeded by a previous run.")
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--noinput', '--no-input', action='store_false',
+            dest='interactive')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if options['interactive']:
+            answer = input(
+                f"This writes benchmark data to {connection.settings_dict['NAME']}"
+                " and drops/recreates indexes. Type 'yes' to continue: ")
+            if answer != 'yes':
+                raise CommandError("Benchmark cancelled.")
+
+        if not options['no_seed']:
+            started = time.perf_counter()
+            seed(options['users'], options['posts'], options['comments'],
+                 options['likes'])
+            self.stdout.write(
+                f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        # Benchmark the busiest post and its most active liker.
+        post = Post.objects.filter(status=1).order_by(
+            '-approved_comment_count').values_list('pk', flat=True).first()
+        if post is None:
+            raise CommandError("No published posts to benchmark.")
+        user = Post.likes.through.objects.filter(post_id=post).values_list(
+            'user_id', flat=True).first() or 0
+
+        self.set_indexes(connection, enabled=False)
+        try:
+            before = self.measure(post, user, options['repeat'])
+        finally:
+            self.set_indexes(connection, enabled=True)
+        after = self.measure(post, user, options['repeat'])
+
+        for name, timing, plan in before:
+            _, after_timing, after_plan = next(
+                row for row in after if row[0] == name)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(
+                f"  without indexes: {timing:.3f} ms\n  {plan}")
+            self.stdout.write(
+                f"  with indexes:    {after_timing:.3f} ms\n  {after_plan}")
+
+    def set_indexes(self, connection, enabled):
+        with connection.schema_editor() as schema_editor:
+            for model in (Post, Comment):
+                for index in model._meta.indexes:
+                    if enabled:
+                        schema_editor.add_index(model, index)
+                    else:
+                        schema_editor.remove_index(model, index)
+            schema_editor.execute(
+                LIKES_INDEX_SQL if enabled else LIKES_INDEX_DROP_SQL)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def measure(self, post, user, repeat):
+        results = []
+        for name, queryset in hot_queries(post, user):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            plan = queryset.explain().replace('\n', '\n  ')
+            results.append((name, statistics.median(timings), plan))
+        return results
@@ -0,0 +1,122 @@
+import statistics
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from firmsite import views
+from firmsite.cache import get_cache
+from firmsite.loadtest import urlconf
+from firmsite.models import Post
+
+
+DJANGO_AUTH = 'django.contrib.auth.middleware.AuthenticationMiddleware'
+CACHED_AUTH = 'firmsite.auth.CachedAuthenticationMiddleware'
+
+
+def configurations():
+    """Django's defaults first, then the session engines with a user cache."""
+    django_middleware = [
+        DJANGO_AUTH if name == CACHED_AUTH else name
+        for name in settings.MIDDLEWARE]
+    cached_middleware = [
+        CACHED_AUTH if name == DJANGO_AUTH else name
+        for name in settings.MIDDLEWARE]
+    # On whatever the deployment's default, to measure what it saves.
+    user_cache = {'MIDDLEWARE': cached_middleware,
+                  'FIRMSITE_USER_CACHE_TIMEOUT': 60}
+    engine = 'django.contrib.sessions.backends.'
+    return {
+        'django defaults': {
+            'SESSION_ENGINE': engine + 'db',
+            'MIDDLEWARE': django_middleware,
+            'MESSAGE_STORAGE':
+                'django.contrib.messages.storage.fallback.FallbackStorage',
+        },
+        'db + user cache': {
+            'SESSION_ENGINE': engine + 'db', **user_cache},
+        'cached_db + user cache': {
+            'SESSION_ENGINE': engine + 'cached_db', **user_cache},
+        'signed_cookies + user cache': {
+            'SESSION_ENGINE': engine + 'signed_cookies', **user_cache},
+    }
+
+
+def kind(sql):
+    if 'django_session' in sql:
+        return 'session'
+    if ' FROM "auth_user" ' in sql or ' FROM `auth_user` ' in sql:
+        return 'user'
+    return 'other'
+
+
+class Command(BaseCommand):
+    help = (
+        "Count the session and user queries per request on home and "
+        "post_detail, anonymous and signed in, with Django's session and "
+        "auth defaults and with each session engine plus the user cache. "
+        "Needs seed users and posts from seed_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100)
+
+    def handle(self, *args, **options):
+        slugs = list(Post.objects.filter(status=1).values_list(
+            'slug', flat=True)[:50])
+        user = User.objects.filter(
+            username__startswith='seed-', is_active=True).first()
+        if not slugs or user is None:
+            raise CommandError("No seed posts or users; run seed_data first.")
+        urls = [
+            '/' if n % 2 else f'/{slugs[n // 2 % len(slugs)]}/'
+            for n in range(options['requests'])
+        ]
+        self.stdout.write(
+            f"{'':<28} {'':<10} {'queries/req':>11} {'session':>8} "
+            f"{'user':>6} {'other':>6} {'ms/req':>7}")
+        for name, overrides in configurations().items():
+            with override_settings(
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                    ROOT_URLCONF=urlconf(views),
+                    FIRMSITE_PAGE_CACHE=False,
+                    FIRMSITE_PROFILING=False,
+                    **overrides):
+                for signed_in in (False, True):
+                    get_cache().clear()
+                    client = Client()
+                    if signed_in:
+                        client.force_login(user)
+                    # Warm up, like a returning reader.
+                    client.get(urls[0])
+                    counts, timings = self.measure(client, urls)
+                    self.stdout.write(
+                        f"{name:<28} "
+                        f"{'signed in' if signed_in else 'anonymous':<10} "
+                        f"{sum(counts.values()) / len(urls):11.2f} "
+                        f"{counts['session'] / len(urls):8.2f} "
+                        f"{counts['user'] / len(urls):6.2f} "
+                        f"{counts['other'] / len(urls):6.2f} "
+                        f"{statistics.mean(timings):7.2f}")
+
+    def measure(self, client, urls):
+        counts, timings = Counter(), []
+        for url in urls:
+            with ExitStack() as stack:
+                captured = [
+                    stack.enter_context(CaptureQueriesContext(connection))
+                    for connection in connections.all()]
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"GET {url}: {response.status_code}")
+            for context in captured:
+                counts.update(kind(query['sql']) for query in context)
+        return counts, timings
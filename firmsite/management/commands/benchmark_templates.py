@@ -0,0 +1,109 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from firmsite import prerender, views
+from firmsite.cache import get_cache
+from firmsite.forms import CommentForm
+from firmsite.loadtest import urlconf
+from firmsite.models import Post
+
+
+CACHED_LOADER = 'django.template.loaders.cached.Loader'
+
+
+def templates(cached_loader):
+    """``settings.TEMPLATES`` with or without the cached loader."""
+    engine = dict(settings.TEMPLATES[0])
+    options = dict(engine['OPTIONS'])
+    loaders = options['loaders']
+    if isinstance(loaders[0], (list, tuple)) and (
+            loaders[0][0] == CACHED_LOADER):
+        loaders = loaders[0][1]
+    options['loaders'] = (
+        [(CACHED_LOADER, loaders)] if cached_loader else loaders)
+    engine['OPTIONS'] = options
+    return [engine, *settings.TEMPLATES[1:]]
+
+
+def configurations():
+    return {
+        'no caching': {
+            'TEMPLATES': templates(False), 'FIRMSITE_TEMPLATE_CACHE': False},
+        'cached loader': {
+            'TEMPLATES': templates(True), 'FIRMSITE_TEMPLATE_CACHE': False},
+        'cached loader + prerendered': {
+            'TEMPLATES': templates(True), 'FIRMSITE_TEMPLATE_CACHE': True},
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Render index.html and post_detail.html (signed in, with the "
+        "comment form) repeatedly without the page cache, and compare "
+        "renders per second with no template caching, with the cached "
+        "loader, and with the static sections and the comment form "
+        "prerendered. Needs seed users and posts from seed_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renders', type=int, default=200)
+
+    def handle(self, *args, **options):
+        post = Post.objects.filter(status=1).first()
+        user = User.objects.filter(
+            username__startswith='seed-', is_active=True).first()
+        if post is None or user is None:
+            raise CommandError("No seed posts or users; run seed_data first.")
+        self.stdout.write(
+            f"{'':<28} {'':<12} {'renders/s':>10} {'ms/render':>10}")
+        for name, overrides in configurations().items():
+            with override_settings(
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                    ROOT_URLCONF=urlconf(views),
+                    FIRMSITE_PAGE_CACHE=False,
+                    FIRMSITE_PROFILING=False,
+                    **overrides):
+                get_cache().clear()
+                prerender.clear()
+                for page, render in self.pages(post, user).items():
+                    # The first render loads and compiles the templates.
+                    render()
+                    timings = []
+                    for _ in range(options['renders']):
+                        started = time.perf_counter()
+                        render()
+                        timings.append(time.perf_counter() - started)
+                    self.stdout.write(
+                        f"{name:<28} {page:<12} "
+                        f"{len(timings) / sum(timings):10.0f} "
+                        f"{statistics.mean(timings) * 1000:10.2f}")
+
+    def pages(self, post, user):
+        """Renders of each page's template with a context built once."""
+        factory = RequestFactory()
+
+        home_request = factory.get('/')
+        home_request.user = user
+        home = views.PostList.as_view()(home_request)
+        home_context = home.context_data
+
+        detail_request = factory.get(f'/{post.slug}/')
+        detail_request.user = user
+        detail = views.PostDetail()
+        detail.setup(detail_request, slug=post.slug)
+        detail_context = detail.get_detail_context(
+            detail.get_post(post.slug), CommentForm(), commented=False)
+
+        return {
+            'home': lambda: render_to_string(
+                'index.html', home_context, home_request),
+            'post_detail': lambda: render_to_string(
+                'post_detail.html', detail_context, detail_request),
+        }
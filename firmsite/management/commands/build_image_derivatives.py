@@ -0,0 +1,34 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from firmsite import images
+from firmsite.models import Post
+
+
+class Command(BaseCommand):
+    help = "Build the responsive width variants of every featured image."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--variant', action='append', choices=sorted(images.VARIANTS),
+            help="Only build this variant (repeatable). Defaults to all.")
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Rebuild derivatives that already exist.")
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(
+            featured_image=images.PLACEHOLDER
+        ).order_by('pk').values_list('slug', 'featured_image')
+        built = failed = 0
+        for slug, image in posts.iterator():
+            try:
+                built += images.generate_derivatives(
+                    image, options['variant'], force=options['force'])
+            except ImproperlyConfigured as exc:
+                raise CommandError(exc)
+            except OSError as exc:
+                failed += 1
+                self.stderr.write(f"{slug}: {exc}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {built} derivative(s); {failed} image(s) failed."))
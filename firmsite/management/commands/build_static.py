@@ -0,0 +1,39 @@
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.management.commands.collectstatic import (
+    Command as CollectStatic)
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from firmsite import assets
+
+
+class Command(BaseCommand):
+    help = (
+        "Bundle the vendored and site CSS and JS, then collectstatic with "
+        "fingerprinted names and gzip/Brotli variants. Run it before "
+        "starting the server with STATIC_PIPELINE=1."
+    )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'FIRMSITE_STATIC_PIPELINE', False):
+            raise CommandError("Set STATIC_PIPELINE=1 to build static files.")
+        try:
+            bundles = assets.build_bundles()
+        except FileNotFoundError as error:
+            raise CommandError(error)
+        # Django's own collectstatic: cloudinary_storage overrides it to
+        # skip copying files for any storage other than its own.
+        call_command(CollectStatic(), interactive=False, verbosity=0)
+        for name in bundles:
+            path = staticfiles_storage.path(
+                staticfiles_storage.stored_name(name))
+            sizes = [
+                f"{extension or 'raw'} {os.path.getsize(path + extension):,}"
+                for extension in ('', '.gz', '.br')
+                if os.path.exists(path + extension)]
+            self.stdout.write(f"{os.path.basename(path)}: {', '.join(sizes)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {len(bundles)} bundle(s) into {settings.STATIC_ROOT}."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from firmsite import transfer
+from firmsite.models import Post, Comment
+
+
+MODELS = {'posts': Post, 'comments': Comment}
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream every post (with likes) or comment as CSV or JSON Lines, "
+        "in constant memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=MODELS)
+        parser.add_argument(
+            '--format', choices=transfer.FORMATS, default='csv')
+        parser.add_argument(
+            '--output', '-o', help="File to write; stdout by default.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=transfer.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunks = transfer.export(
+            MODELS[options['model']], fmt=options['format'],
+            size=options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='',
+                  encoding='utf-8') as output:
+            for chunk in chunks:
+                output.write(chunk)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from firmsite import popularity
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the post views buffered in the shared cache to the database. "
+        "The local buffer can only be flushed by the worker holding it."
+    )
+
+    def handle(self, *args, **options):
+        views = popularity.flush()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {views} view(s)."))
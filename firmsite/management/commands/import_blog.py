@@ -0,0 +1,54 @@
+import sys
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+
+from firmsite import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Import posts or comments exported by export_blog, validating each "
+        "row and inserting in batches, one transaction per batch. Rows that "
+        "already exist are skipped. Import posts before their comments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=('posts', 'comments'))
+        parser.add_argument('file', help="File to read, or - for stdin.")
+        parser.add_argument(
+            '--format', choices=transfer.FORMATS,
+            help="Defaults to the file's extension, else csv.")
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.CHUNK_SIZE)
+        parser.add_argument(
+            '--no-skip-existing', action='store_false', dest='skip_existing',
+            help="Comments only: do not look for rows already stored. Much "
+                 "faster into an empty table; duplicates rows otherwise.")
+        parser.add_argument(
+            '--max-errors', type=int, default=20,
+            help="Invalid rows to list (all are counted).")
+
+    def handle(self, *args, **options):
+        path = options['file']
+        fmt = options['format'] or (
+            'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        if options['model'] == 'posts':
+            load = transfer.import_posts
+        else:
+            load = partial(transfer.import_comments,
+                           skip_existing=options['skip_existing'])
+        try:
+            source = sys.stdin if path == '-' else open(
+                path, newline='', encoding='utf-8')
+        except OSError as error:
+            raise CommandError(error)
+        with source:
+            result = load(
+                transfer.read_rows(source, fmt), options['batch_size'])
+
+        for line, message in result.errors[:options['max_errors']]:
+            self.stderr.write(f"Row {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.created} {options['model']}, skipped "
+            f"{result.skipped} existing, {len(result.errors)} invalid."))
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from firmsite import loadtest, views
+from firmsite.models import Post
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in loadtest.SCENARIOS:
+            raise CommandError(
+                f"Unknown scenario {name!r}; choose from "
+                f"{', '.join(loadtest.SCENARIOS)}.")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight for {name!r}: {weight!r}")
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test home, post_detail, comments and likes in process or "
+        "against a running server (--url), reporting p50/p95/p99 latency, "
+        "throughput and queries per request. Logs in as the users from "
+        "seed_data; comments are left pending moderation. Rate limits are "
+        "off in process; start a server under test with RATE_LIMITING=0. "
+        "Over HTTP the seed users log in with --password, which only "
+        "--reset-passwords sets on them, overwriting their passwords."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--mix', default='browse=4,read=4,comment=1,like=1',
+            help="Scenario weights, e.g. read=1 or browse=2,like=1.")
+        parser.add_argument(
+            '--url',
+            help="Base URL of a running server sharing this database, "
+                 "e.g. http://127.0.0.1:8000. In process by default.")
+        parser.add_argument(
+            '--password',
+            help="Password the seed users log in with over HTTP.")
+        parser.add_argument(
+            '--reset-passwords', action='store_true',
+            help="Set --password on the seed users first. Overwrites their "
+                 "passwords in the database the server uses.")
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        workers = options['workers']
+        slugs = list(Post.objects.filter(status=1).order_by(
+            '-created_on').values_list('slug', flat=True)[:200])
+        if not slugs:
+            raise CommandError("No published posts; run seed_data first.")
+        users = []
+        if any(loadtest.SCENARIOS[name].login for name in mix):
+            users = list(User.objects.filter(
+                username__startswith='seed-', is_active=True
+            ).order_by('pk')[:workers])
+            if not users:
+                raise CommandError("No seed users; run seed_data first.")
+        fixture = loadtest.Fixture(slugs, users)
+        run_options = {
+            'mix': mix, 'iterations': options['iterations'],
+            'workers': workers, 'random_seed': options['random_seed'],
+        }
+
+        if options['url']:
+            if users and not options['password']:
+                raise CommandError("--password is needed to log in over HTTP.")
+            if users and options['reset_passwords']:
+                User.objects.filter(pk__in=[user.pk for user in users]).update(
+                    password=make_password(options['password']))
+
+            def make_client(user):
+                credentials = user and (user.email, options['password'])
+                return loadtest.HTTPClient(options['url'], credentials)
+
+            try:
+                report = loadtest.run(make_client, fixture, **run_options)
+            except loadtest.LoginFailed as error:
+                hint = "" if options['reset_passwords'] else (
+                    "; pass --reset-passwords to set --password on the "
+                    "seed users")
+                raise CommandError(f"{error}{hint}")
+        else:
+            with override_settings(
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                    ROOT_URLCONF=loadtest.urlconf(views),
+                    FIRMSITE_PROFILING=True,
+                    FIRMSITE_QUERY_BUDGET_STRICT=False,
+                    FIRMSITE_RATE_LIMITING=False):
+                report = loadtest.run(
+                    loadtest.InProcessClient, fixture, **run_options)
+
+        self.stdout.write(
+            f"{report.requests()} requests in {report.elapsed:.2f} s "
+            f"with {workers} worker(s)")
+        for line in report.lines():
+            self.stdout.write(line)
@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+
+from firmsite import moderation
+from firmsite.models import Comment, PendingComment
+
+
+DONE = {
+    moderation.APPROVE: 'approved',
+    moderation.REJECT: 'rejected',
+    moderation.DELETE: 'deleted',
+}
+
+
+class Command(BaseCommand):
+    help = "Bulk-moderate the pending comment queue by rule."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--approve-known', action='store_true',
+            help="Approve comments from emails with approved comments.")
+        parser.add_argument(
+            '--min-approved', type=int, default=1,
+            help="Approved comments needed to count as known (default 1).")
+        parser.add_argument(
+            '--approve-registered', action='store_true',
+            help="Approve comments from emails of active user accounts.")
+        parser.add_argument(
+            '--reject-older-than', type=int, metavar='DAYS',
+            help="Reject comments pending for more than DAYS days.")
+        parser.add_argument(
+            '--batch-size', type=int, default=moderation.BATCH_SIZE)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report how many comments each rule matches.")
+
+    def handle(self, *args, **options):
+        rules = []
+        if options['approve_known']:
+            known = Comment.objects.filter(approved=True).values(
+                'email').annotate(total=Count('pk')).filter(
+                total__gte=options['min_approved']).values('email')
+            rules.append(('known commenters', moderation.APPROVE,
+                          PendingComment.objects.filter(email__in=known)))
+        if options['approve_registered']:
+            registered = User.objects.filter(is_active=True).values('email')
+            rules.append(('registered users', moderation.APPROVE,
+                          PendingComment.objects.filter(
+                              email__in=registered)))
+        if options['reject_older_than'] is not None:
+            cutoff = timezone.now() - timedelta(
+                days=options['reject_older_than'])
+            rules.append(('stale comments', moderation.REJECT,
+                          PendingComment.objects.filter(
+                              created_on__lt=cutoff)))
+        if not rules:
+            raise CommandError(
+                "Choose at least one rule, e.g. --approve-known.")
+
+        for name, action, queryset in rules:
+            if options['dry_run']:
+                self.stdout.write(
+                    f"{name}: {queryset.count()} comment(s) to {action}")
+                continue
+            count = moderation.moderate(
+                queryset, action, options['batch_size'])
+            self.stdout.write(f"{name}: {DONE[action]} {count} comment(s)")
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from firmsite import publishing
+
+
+class Command(BaseCommand):
+    help = (
+        "Publish the scheduled posts that are due and render the home page "
+        "and their pages into the page cache. Run it from cron, or with "
+        "--loop as a worker: posts go live within --interval seconds. "
+        "Readers see a post only once this has published it, whatever "
+        "its publish_at, so the cached pages never disagree."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=publishing.BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--interval', type=float, default=30)
+        parser.add_argument(
+            '--no-warm', action='store_false', dest='warm',
+            help="Leave the pages to be rendered by their first reader.")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                self.publish(options)
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def publish(self, options):
+        slugs = publishing.publish_due(options['batch_size'])
+        if not slugs:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {len(slugs)} post(s): {', '.join(slugs)}"))
+        if options['warm']:
+            for path in publishing.warm(publishing.warm_paths(slugs)):
+                self.stderr.write(f"Could not warm {path}")
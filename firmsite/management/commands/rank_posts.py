@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from firmsite import popularity
+
+
+class Command(BaseCommand):
+    help = (
+        "Flush buffered post views, then recompute the popularity ranking "
+        "shown on the home page. Run it periodically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=popularity.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        views = popularity.flush()
+        ranked = popularity.rank(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Flushed {views} view(s) and ranked {ranked} post(s)."))
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from firmsite import related
+from firmsite.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the related posts shown on each post page from like "
+        "co-occurrence, falling back to text similarity. Needs numpy and "
+        "scipy. Run it periodically; --since limits it to recent changes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', type=int, metavar='MINUTES',
+            help="Only rank posts updated or liked or unliked in the "
+                 "last MINUTES, and posts not ranked yet.")
+        parser.add_argument('--top-k', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not related.available():
+            raise CommandError("numpy and scipy are needed: "
+                               "pip install numpy scipy")
+        post_ids = None
+        if options['since'] is not None:
+            since = timezone.now() - timedelta(minutes=options['since'])
+            post_ids = list(Post.objects.filter(status=1).filter(
+                Q(updated_on__gte=since) | Q(likes_changed_on__gte=since)
+                | Q(related_entries__isnull=True)
+            ).distinct().values_list('pk', flat=True))
+        ranked = related.build(
+            post_ids, k=options['top_k'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Ranked related posts for {ranked} post(s)."))
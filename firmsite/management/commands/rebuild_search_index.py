@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from firmsite.models import Post
+from firmsite.search import get_backend, update_documents
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search documents for every post."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        post_ids = Post.objects.order_by('pk').values_list('pk', flat=True)
+        last_pk, indexed = 0, 0
+        while True:
+            batch = list(post_ids.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            update_documents(batch)
+            indexed += len(batch)
+            last_pk = batch[-1]
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} post(s) with "
+            f"{type(get_backend()).__name__}."))
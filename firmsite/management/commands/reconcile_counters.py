@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from firmsite import cache as page_cache
+from firmsite.models import Post
+
+
+class Command(BaseCommand):
+    help = "Recount Post.like_count and Post.approved_comment_count."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of posts recounted per UPDATE.")
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report posts whose counters have drifted.")
+
+    def handle(self, *args, **options):
+        drifted = list(
+            Post.objects.with_counter_drift()
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        self.stdout.write(f"{len(drifted)} post(s) with drifted counters.")
+        if options['dry_run'] or not drifted:
+            return
+
+        batch_size = options['batch_size']
+        for start in range(0, len(drifted), batch_size):
+            batch = drifted[start:start + batch_size]
+            Post.objects.filter(pk__in=batch).refresh_counters()
+        # The UPDATEs bypass the signals that invalidate cached pages.
+        page_cache.invalidate(page_cache.POSTS)
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {len(drifted)} post(s)."))
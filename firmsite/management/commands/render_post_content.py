@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from firmsite import cache as page_cache
+from firmsite import content as post_content
+from firmsite import feeds
+from firmsite.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-render the stored HTML, table of contents, summary and reading "
+        "time of posts, e.g. after the sanitizer rules change."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument(
+            '--missing', action='store_true',
+            help="Only posts that have never been rendered.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.objects.order_by('pk').only('pk', 'content', 'excerpt')
+        if options['missing']:
+            posts = posts.filter(content_html='')
+        # Bumping updated_on changes the ETags of the re-rendered pages.
+        fields = [*post_content.RENDERED_FIELDS, 'updated_on']
+        last_pk, rendered = 0, 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            now = timezone.now()
+            for post in batch:
+                post_content.apply(post)
+                post.updated_on = now
+            Post.objects.bulk_update(batch, fields)
+            rendered += len(batch)
+            last_pk = batch[-1].pk
+        if rendered:
+            page_cache.invalidate(page_cache.POSTS)
+            feeds.posts_changed()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {rendered} post(s)."))
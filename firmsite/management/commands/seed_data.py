@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from firmsite.seed import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert synthetic users, posts, comments and likes for load tests "
+        "and benchmarks. Use a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument('--likes', type=int, default=10000)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument(
+            '--noinput', '--no-input', action='store_false',
+            dest='interactive')
+
+    def handle(self, *args, **options):
+        if options['interactive']:
+            answer = input(
+                f"This writes seed data to {connection.settings_dict['NAME']}."
+                " Type 'yes' to continue: ")
+            if answer != 'yes':
+                raise CommandError("Seeding cancelled.")
+        started = time.perf_counter()
+        user_ids, post_ids = seed(
+            options['users'], options['posts'], options['comments'],
+            options['likes'], random_seed=options['random_seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(user_ids)} seed user(s) and {len(post_ids)} seed post(s) "
+            f"after {time.perf_counter() - started:.1f}s."))
@@ -0,0 +1,31 @@
+from urllib.error import URLError
+
+from django.core.management.base import BaseCommand, CommandError
+
+from firmsite import assets
+
+
+class Command(BaseCommand):
+    help = (
+        "Download the Bootstrap, Font Awesome and Google Fonts files "
+        "base.html uses into static/vendor/, to commit with the code or as "
+        "a build step before build_static. Every file must match its hash "
+        "in firmsite/vendor.lock.json; --pin adds the files not in it yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pin', action='store_true',
+            help="Pin the downloads not in the lock file to what was "
+                 "downloaded, after checking them. Changed pins are still "
+                 "refused; delete their line to re-pin them.")
+
+    def handle(self, *args, **options):
+        try:
+            written = assets.vendor(pin=options['pin'])
+        except (URLError, ValueError) as error:
+            raise CommandError(f"Vendoring failed: {error}")
+        for name in written:
+            self.stdout.write(f"  {name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Vendored {len(written)} file(s) into {assets.source_root()}."))
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.18 on 2026-10-18 06:47
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('firmsite', 'Post')
+    Comment = apps.get_model('firmsite', 'Comment')
+    likes = Post.likes.through.objects.filter(
+        post=OuterRef('pk')
+    ).order_by().values('post').annotate(total=Count('pk')).values('total')
+    comments = Comment.objects.filter(
+        post=OuterRef('pk'), approved=True
+    ).order_by().values('post').annotate(total=Count('pk')).values('total')
+    Post.objects.update(
+        like_count=Coalesce(Subquery(likes), 0),
+        approved_comment_count=Coalesce(Subquery(comments), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('firmsite', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='approved_comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='likes',
+            field=models.ManyToManyField(blank=True, related_name='blogpost_like', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
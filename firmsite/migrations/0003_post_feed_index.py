@@ -0,0 +1,17 @@
+# Generated by Django 3.2.18 on 2026-10-18 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firmsite', '0002_post_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', '-created_on', '-id'], name='post_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.18 on 2026-10-18 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firmsite', '0003_post_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('approved', True)), fields=['post', '-created_on'], name='comment_approved_post_idx'),
+        ),
+        # The auto-created likes table only has (post_id, user_id) unique
+        # and single-column indexes; cover lookups starting from the user.
+        migrations.RunSQL(
+            'CREATE INDEX firmsite_post_likes_user_post_idx '
+            'ON firmsite_post_likes (user_id, post_id);',
+            'DROP INDEX firmsite_post_likes_user_post_idx;',
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.18 on 2026-10-18 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firmsite', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingComment',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'pending comment',
+                'ordering': ['created_on'],
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('firmsite.comment',),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='rejected',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('approved', False), ('rejected', False)), fields=['created_on'], name='comment_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 3.2.18 on 2026-10-18 06:55
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+from django.utils.html import strip_tags
+import django.db.models.deletion
+
+
+# Must match firmsite.search.PG_VECTOR for the planner to use the index.
+PG_VECTOR = (
+    "setweight(to_tsvector('english'::regconfig, title), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, body), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, comments), 'C')"
+)
+
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE firmsite_searchdocument_fts USING fts5("
+    "title, body, comments, content='firmsite_searchdocument', "
+    "content_rowid='post_id', tokenize='porter unicode61')",
+    "CREATE TRIGGER firmsite_searchdocument_ai "
+    "AFTER INSERT ON firmsite_searchdocument BEGIN "
+    "INSERT INTO firmsite_searchdocument_fts(rowid, title, body, comments) "
+    "VALUES (new.post_id, new.title, new.body, new.comments); END",
+    "CREATE TRIGGER firmsite_searchdocument_ad "
+    "AFTER DELETE ON firmsite_searchdocument BEGIN "
+    "INSERT INTO firmsite_searchdocument_fts"
+    "(firmsite_searchdocument_fts, rowid, title, body, comments) "
+    "VALUES ('delete', old.post_id, old.title, old.body, old.comments); END",
+    "CREATE TRIGGER firmsite_searchdocument_au "
+    "AFTER UPDATE ON firmsite_searchdocument BEGIN "
+    "INSERT INTO firmsite_searchdocument_fts"
+    "(firmsite_searchdocument_fts, rowid, title, body, comments) "
+    "VALUES ('delete', old.post_id, old.title, old.body, old.comments); "
+    "INSERT INTO firmsite_searchdocument_fts(rowid, title, body, comments) "
+    "VALUES (new.post_id, new.title, new.body, new.comments); END",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX firmsite_searchdocument_gin "
+            f"ON firmsite_searchdocument USING GIN (({PG_VECTOR}))")
+    elif vendor == 'sqlite':
+        try:
+            for statement in SQLITE_FTS:
+                schema_editor.execute(statement)
+        except OperationalError:
+            # No FTS5 in this SQLite build: search uses the Python backend.
+            pass
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "DROP INDEX IF EXISTS firmsite_searchdocument_gin")
+    elif vendor == 'sqlite':
+        for name in ('ai', 'ad', 'au'):
+            schema_editor.execute(
+                f"DROP TRIGGER IF EXISTS firmsite_searchdocument_{name}")
+        schema_editor.execute(
+            "DROP TABLE IF EXISTS firmsite_searchdocument_fts")
+
+
+def index_existing_posts(apps, schema_editor):
+    Post = apps.get_model('firmsite', 'Post')
+    Comment = apps.get_model('firmsite', 'Comment')
+    SearchDocument = apps.get_model('firmsite', 'SearchDocument')
+    posts = Post.objects.order_by('pk').values_list('pk', 'title', 'content')
+    batch = []
+    for post in posts.iterator():
+        batch.append(post)
+        if len(batch) == 500:
+            index_posts(Comment, SearchDocument, batch)
+            batch = []
+    index_posts(Comment, SearchDocument, batch)
+
+
+def index_posts(Comment, SearchDocument, posts):
+    # One comment query per batch, as in firmsite.search.build_documents.
+    comments = defaultdict(list)
+    approved = Comment.objects.filter(
+        post_id__in=[pk for pk, _, _ in posts], approved=True
+    ).order_by('-created_on').values_list('post_id', 'body')
+    for post_id, body in approved.iterator():
+        comments[post_id].append(body)
+    SearchDocument.objects.bulk_create(
+        SearchDocument(
+            post_id=pk, title=title, body=strip_tags(content),
+            comments='\n'.join(comments[pk])[:50000],
+        )
+        for pk, title, content in posts
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firmsite', '0005_comment_moderation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='firmsite.post')),
+                ('title', models.CharField(max_length=200)),
+                ('body', models.TextField(blank=True)),
+                ('comments', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(index_existing_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.18 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firmsite', '0009_related_posts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='publish_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'Draft'), (1, 'Published'), (2, 'Scheduled')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'publish_at'], name='post_status_publish_at_idx'),
+        ),
+    ]
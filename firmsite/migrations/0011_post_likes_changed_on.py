@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firmsite', '0010_scheduled_publishing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='likes_changed_on',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
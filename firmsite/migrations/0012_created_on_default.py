@@ -0,0 +1,24 @@
+# Generated by Django 3.2.18 on 2026-10-18 13:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firmsite', '0011_post_likes_changed_on'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='created_on',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='created_on',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.18 on 2026-10-18 14:20
+
+from django.db import migrations
+
+
+# The admin's '=email' and '^name' searches compile to
+# UPPER(col::text) = UPPER(%s) and UPPER(col::text) LIKE UPPER(%s) on
+# PostgreSQL; text_pattern_ops lets one B-tree serve both whatever the
+# database collation. SQLite's LIKE ... ESCAPE cannot use an index.
+INDEXES = {
+    'comment_email_upper_idx': 'email',
+    'comment_name_upper_idx': 'name',
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX {name} ON firmsite_comment "
+            f"((UPPER({column}::text)) text_pattern_ops)")
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firmsite', '0012_created_on_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
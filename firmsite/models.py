@@ -1,9 +1,80 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import (
+    BooleanField, Count, Exists, F, OuterRef, Q, Subquery, Value)
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from cloudinary.models import CloudinaryField
+from . import content as post_content
 
 
-STATUS = ((0, "Draft"), (1, "Published"))
+STATUS = ((0, "Draft"), (1, "Published"), (2, "Scheduled"))
+SCHEDULED = 2
+
+
+def _like_total():
+    likes = Post.likes.through.objects.filter(post=OuterRef('pk'))
+    return Coalesce(Subquery(
+        likes.order_by().values('post')
+        .annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def _approved_comment_total():
+    comments = Comment.objects.filter(post=OuterRef('pk'), approved=True)
+    return Coalesce(Subquery(
+        comments.order_by().values('post')
+        .annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class PostQuerySet(models.QuerySet):
+
+    def with_actual_counts(self):
+        """Annotate the counts recomputed from the likes and comments tables."""
+        return self.annotate(
+            actual_like_count=_like_total(),
+            actual_comment_count=_approved_comment_total(),
+        )
+
+    def with_counter_drift(self):
+        return self.with_actual_counts().filter(
+            ~Q(like_count=F('actual_like_count'))
+            | ~Q(approved_comment_count=F('actual_comment_count'))
+        )
+
+    def with_liked(self, user):
+        """Annotate ``liked``: whether ``user`` likes each post."""
+        if not user.is_authenticated:
+            return self.annotate(liked=Value(False, output_field=BooleanField()))
+        return self.annotate(liked=Exists(Post.likes.through.objects.filter(
+            post=OuterRef('pk'), user_id=user.pk)))
+
+    def for_cards(self):
+        """Posts with what the cards show, without the heavy body fields."""
+        return self.select_related('author').defer(
+            'content', 'content_html', 'toc')
+
+    def for_detail(self, user):
+        """Published posts with everything the detail page shows."""
+        return self.filter(status=1).select_related('author').with_liked(user)
+
+    def refresh_counters(self, touch=False, liked=False):
+        """
+        Recount likes and approved comments in a single UPDATE. ``touch``
+        also bumps ``updated_on``, for changes that alter the post's page,
+        and ``liked`` bumps ``likes_changed_on``, for changed likes.
+        """
+        updates = {
+            'like_count': _like_total(),
+            'approved_comment_count': _approved_comment_total(),
+        }
+        if touch:
+            updates['updated_on'] = timezone.now()
+        if liked:
+            updates['likes_changed_on'] = timezone.now()
+        return self.update(**updates)
 
 
 class Post(models.Model):
@@ -16,19 +87,120 @@ class Post(models.Model):
     excerpt = models.TextField(blank=True)
     updated_on = models.DateTimeField(auto_now=True)
     content = models.TextField()
-    created_on = models.DateTimeField(auto_now_add=True)
+    # Set on creation like auto_now_add, but bulk imports and seeds can
+    # pass their own.
+    created_on = models.DateTimeField(
+        default=timezone.now, blank=True, editable=False)
     status = models.IntegerField(choices=STATUS, default=0)
+    # When a Scheduled post goes live, see firmsite/publishing.py.
+    publish_at = models.DateTimeField(null=True, blank=True)
     likes = models.ManyToManyField(
         User, related_name='blogpost_like', blank=True)
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    # Likes leave updated_on alone; rank_related_posts --since reads this.
+    likes_changed_on = models.DateTimeField(
+        null=True, blank=True, editable=False)
+    approved_comment_count = models.PositiveIntegerField(
+        default=0, editable=False)
+    # Derived from content and excerpt on save, see firmsite/content.py.
+    content_html = models.TextField(blank=True, editable=False)
+    toc = models.JSONField(default=list, blank=True, editable=False)
+    summary = models.TextField(blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveSmallIntegerField(
+        default=0, editable=False)
+    # Flushed from a buffer and ranked by firmsite/popularity.py.
+    view_count = models.PositiveIntegerField(default=0, editable=False)
+    popularity = models.FloatField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ["-created_on"]
+        indexes = [
+            # Backs the keyset-paginated feed of published posts.
+            models.Index(fields=["status", "-created_on", "-id"],
+                         name="post_status_created_idx"),
+            # The home page's most popular posts.
+            models.Index(fields=["status", "-popularity"],
+                         name="post_status_popularity_idx"),
+            # Scheduled posts that are due.
+            models.Index(fields=["status", "publish_at"],
+                         name="post_status_publish_at_idx"),
+        ]
 
     def __str__(self):
         return self.title
 
+    def clean(self):
+        if self.status == SCHEDULED and self.publish_at is None:
+            raise ValidationError(
+                {"publish_at": "Scheduled posts need a publication time."})
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'content', 'excerpt'} & set(
+                update_fields):
+            post_content.apply(self)
+            if update_fields is not None:
+                kwargs['update_fields'] = {
+                    *update_fields, *post_content.RENDERED_FIELDS}
+        super().save(*args, **kwargs)
+
+    def body_html(self):
+        """
+        The sanitized body. Rows saved before content_html existed are
+        sanitized on the fly; the raw content is never shown.
+        """
+        if self.content_html or not self.content:
+            return self.content_html
+        return post_content.render(self.content, self.excerpt)['content_html']
+
     def number_of_likes(self):
-        return self.likes.count()
+        return self.like_count
+
+    def approved_comments(self):
+        return self.comments.filter(approved=True).order_by("-created_on")
+
+    def related_posts(self):
+        """The precomputed related posts, best first, in one query."""
+        entries = RelatedPost.objects.filter(
+            post=self, related__status=1).select_related("related").only(
+            "related", "related__slug", "related__title",
+            "related__summary").order_by("rank")
+        return [entry.related for entry in entries]
+
+    def toggle_like(self, user):
+        """
+        Like or unlike the post for ``user`` and return ``(liked, count)``.
+
+        One conditional DELETE decides the direction. The INSERT relies on
+        the unique (post, user) constraint, and the counter moves by an
+        F() expression, so concurrent clicks cannot double count.
+        """
+        PostLikes = Post.likes.through
+        posts = Post.objects.filter(pk=self.pk)
+        with transaction.atomic():
+            removed, _ = PostLikes.objects.filter(
+                post_id=self.pk, user_id=user.pk).delete()
+            liked = not removed
+            if removed:
+                posts.update(like_count=F('like_count') - removed,
+                             likes_changed_on=timezone.now())
+            else:
+                try:
+                    with transaction.atomic():
+                        PostLikes.objects.create(
+                            post_id=self.pk, user_id=user.pk)
+                except IntegrityError:
+                    # A concurrent request liked it first.
+                    pass
+                else:
+                    posts.update(like_count=F('like_count') + 1,
+                                 likes_changed_on=timezone.now())
+            self.like_count = posts.values_list(
+                'like_count', flat=True).get()
+        return liked, self.like_count
 
 
 class Comment(models.Model):
@@ -37,11 +209,72 @@ class Comment(models.Model):
     name = models.CharField(max_length=80)
     email = models.EmailField()
     body = models.TextField()
-    created_on = models.DateTimeField(auto_now_add=True)
+    created_on = models.DateTimeField(
+        default=timezone.now, blank=True, editable=False)
     approved = models.BooleanField(default=False)
+    rejected = models.BooleanField(default=False)
 
     class Meta:
         ordering = ["created_on"]
+        indexes = [
+            # Approved comments of a post, newest first.
+            models.Index(fields=["post", "-created_on"],
+                         condition=Q(approved=True),
+                         name="comment_approved_post_idx"),
+            # The moderation queue, oldest first.
+            models.Index(fields=["created_on"],
+                         condition=Q(approved=False, rejected=False),
+                         name="comment_pending_idx"),
+        ]
 
     def __str__(self):
-        return f"Comment {self.body} by {self.name}"
\ No newline at end of file
+        return f"Comment {self.body} by {self.name}"
+
+
+class PendingCommentManager(models.Manager):
+
+    def get_queryset(self):
+        return super().get_queryset().filter(approved=False, rejected=False)
+
+
+class PendingComment(Comment):
+    """Comments still waiting for a moderator."""
+
+    objects = PendingCommentManager()
+
+    class Meta:
+        proxy = True
+        ordering = ["created_on"]
+        verbose_name = "pending comment"
+
+
+class SearchDocument(models.Model):
+    """Plain text of a post and its approved comments, for full-text search."""
+
+    post = models.OneToOneField(
+        Post, on_delete=models.CASCADE, primary_key=True,
+        related_name="search_document")
+    title = models.CharField(max_length=200)
+    body = models.TextField(blank=True)
+    comments = models.TextField(blank=True)
+
+
+class RelatedPost(models.Model):
+    """Precomputed recommendations, see firmsite/related.py."""
+
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="related_entries")
+    related = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="+")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    # 'likes' for like co-occurrence, 'text' for the TF-IDF fallback.
+    source = models.CharField(max_length=5)
+
+    class Meta:
+        ordering = ["post", "rank"]
+        constraints = [
+            # Also the index the detail page reads through.
+            models.UniqueConstraint(fields=["post", "rank"],
+                                    name="relatedpost_post_rank_uniq"),
+        ]
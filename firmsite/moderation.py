@@ -0,0 +1,54 @@
+"""
+Batched comment moderation.
+
+Comments are processed in primary-key order, ``batch_size`` rows per
+transaction, so huge queues never load into memory at once. Post counters
+and page caches are refreshed once per batch.
+"""
+from django.db import transaction
+
+from .models import Comment
+from .signals import batched_counters, comments_changed
+
+
+APPROVE = 'approve'
+REJECT = 'reject'
+DELETE = 'delete'
+BATCH_SIZE = 500
+
+
+def pk_batches(queryset, batch_size=BATCH_SIZE):
+    """Yield lists of ``(pk, post_id)`` from ``queryset`` in pk order."""
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        batch_qs = queryset
+        if last_pk is not None:
+            batch_qs = queryset.filter(pk__gt=last_pk)
+        batch = list(batch_qs.values_list('pk', 'post_id')[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1][0]
+
+
+def moderate(queryset, action, batch_size=BATCH_SIZE):
+    """Apply ``action`` to every comment in ``queryset``; return the count."""
+    if action not in (APPROVE, REJECT, DELETE):
+        raise ValueError(f"Unknown moderation action: {action}")
+
+    processed = 0
+    for batch in pk_batches(queryset, batch_size):
+        pks = [pk for pk, _ in batch]
+        post_ids = {post_id for _, post_id in batch}
+        comments = Comment.objects.filter(pk__in=pks)
+        with transaction.atomic(), batched_counters():
+            if action == APPROVE:
+                processed += comments.update(approved=True, rejected=False)
+            elif action == REJECT:
+                processed += comments.update(approved=False, rejected=True)
+            else:
+                processed += comments.delete()[1].get(
+                    Comment._meta.label, 0)
+            comments_changed(post_ids)
+    return processed
@@ -0,0 +1,252 @@
+"""
+Post view counts and popularity ranking.
+
+Detail page views are counted in a buffer - in process (``local``) or in
+the shared cache (``cache``) - rather than with an UPDATE per request, and
+written to ``Post.view_count`` in batches once per
+``FIRMSITE_VIEW_FLUSH_INTERVAL`` or by the ``rank_posts`` command. That
+command also recomputes ``Post.popularity``, a score decayed by the age of
+the post, which the home page orders by through an index.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import cache as page_cache
+from .models import Post
+from .routers import use_primary
+
+
+logger = logging.getLogger('firmsite.popularity')
+
+VIEW_KEY = 'firmsite:views:{}'
+SEEN_KEY = 'firmsite:viewed:{}:{}'
+FLUSH_LOCK_KEY = 'firmsite:views:flush'
+# Slugs whose count went up from zero, one per numbered slot.
+DIRTY_COUNT_KEY = 'firmsite:views:dirty'
+DIRTY_SLOT_KEY = 'firmsite:views:dirty:{}'
+# (slots drained, the slot found empty last time or None)
+DIRTY_CURSOR_KEY = 'firmsite:views:dirty:drained'
+BATCH_SIZE = 500
+
+# Points per interaction, divided by (age in hours + 2) ** GRAVITY.
+VIEW_POINTS = 1
+LIKE_POINTS = 5
+COMMENT_POINTS = 10
+GRAVITY = 1.5
+
+
+class LocalBuffer:
+    """Counts per process; views not yet flushed die with the worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._next_flush = 0.0
+
+    def add(self, slug, count=1):
+        with self._lock:
+            self._counts[slug] += count
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return counts
+
+    def due(self, interval):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_flush:
+                return False
+            self._next_flush = now + interval
+            return True
+
+
+class CacheBuffer:
+    """
+    Counts in the shared cache, so every worker's views add up.
+
+    The cache cannot list its keys, so a slug whose count goes up from zero
+    is also appended to a list of dirty slugs, one numbered slot each, and
+    ``drain()`` reads only the slots appended since it last ran.
+    """
+
+    def add(self, slug, count=1):
+        cache = page_cache.get_cache()
+        key = VIEW_KEY.format(slug)
+        if cache.add(key, count, None):
+            self.mark_dirty(cache, slug)
+            return
+        try:
+            total = cache.incr(key, count)
+        except ValueError:  # Evicted since the add().
+            cache.add(key, count, None)
+            total = count
+        if total == count:  # Drained to zero since it was last marked.
+            self.mark_dirty(cache, slug)
+
+    def mark_dirty(self, cache, slug):
+        cache.add(DIRTY_COUNT_KEY, 0, None)
+        try:
+            slot = cache.incr(DIRTY_COUNT_KEY)
+        except ValueError:  # Evicted since the add().
+            cache.add(DIRTY_COUNT_KEY, 0, None)
+            slot = cache.incr(DIRTY_COUNT_KEY)
+        cache.set(DIRTY_SLOT_KEY.format(slot), slug, None)
+
+    def dirty_slugs(self, cache):
+        """The slugs marked since the last drain; advances its cursor."""
+        total = cache.get(DIRTY_COUNT_KEY, 0)
+        drained, empty = cache.get(DIRTY_CURSOR_KEY, (0, None))
+        if total < drained:  # The count was evicted and started over.
+            drained, empty = 0, None
+        slugs, cursor = set(), drained
+        for start in range(drained + 1, total + 1, BATCH_SIZE):
+            slots = range(start, min(start + BATCH_SIZE, total + 1))
+            found = cache.get_many(
+                [DIRTY_SLOT_KEY.format(slot) for slot in slots])
+            for slot in slots:
+                slug = found.get(DIRTY_SLOT_KEY.format(slot))
+                # An add() may have taken the slot and not filled it in
+                # yet: stop there, and only skip it if still empty later.
+                if slug is None and slot != empty:
+                    cache.set(DIRTY_CURSOR_KEY, (cursor, slot), None)
+                    self.forget_slots(cache, drained, cursor)
+                    return slugs
+                if slug is not None:
+                    slugs.add(slug)
+                cursor = slot
+        cache.set(DIRTY_CURSOR_KEY, (cursor, None), None)
+        self.forget_slots(cache, drained, cursor)
+        return slugs
+
+    def forget_slots(self, cache, drained, cursor):
+        cache.delete_many([
+            DIRTY_SLOT_KEY.format(slot)
+            for slot in range(drained + 1, cursor + 1)])
+
+    def drain(self):
+        cache = page_cache.get_cache()
+        counts = Counter()
+        slugs = iter(self.dirty_slugs(cache))
+        while True:
+            batch = list(islice(slugs, BATCH_SIZE))
+            if not batch:
+                return counts
+            found = cache.get_many([VIEW_KEY.format(slug) for slug in batch])
+            for slug in batch:
+                count = found.get(VIEW_KEY.format(slug))
+                if count:
+                    # decr() rather than delete() keeps views added since,
+                    # which leave the count above zero: mark them again.
+                    if cache.decr(VIEW_KEY.format(slug), count):
+                        self.mark_dirty(cache, slug)
+                    counts[slug] = count
+
+    def due(self, interval):
+        return page_cache.get_cache().add(FLUSH_LOCK_KEY, 1, interval)
+
+
+_buffers = {'local': LocalBuffer(), 'cache': CacheBuffer()}
+
+
+def get_buffer():
+    name = getattr(settings, 'FIRMSITE_VIEW_BUFFER', 'local')
+    try:
+        return _buffers[name]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown view buffer {name!r}")
+
+
+def viewer(request):
+    """The session key if there is one, else a hash of the client."""
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return session.session_key
+    client = '{}|{}'.format(request.META.get('REMOTE_ADDR', ''),
+                            request.META.get('HTTP_USER_AGENT', ''))
+    return hashlib.md5(client.encode()).hexdigest()
+
+
+def record_view(request, slug):
+    """Count a view of ``slug``, once per viewer if deduplication is on."""
+    window = getattr(settings, 'FIRMSITE_VIEW_DEDUP_SECONDS', 0)
+    if window:
+        seen = SEEN_KEY.format(viewer(request), slug)
+        if not page_cache.get_cache().add(seen, 1, window):
+            return
+    get_buffer().add(slug)
+
+
+def flush():
+    """Add the buffered views to ``Post.view_count``; return how many."""
+    buffer = get_buffer()
+    items = list(buffer.drain().items())
+    for start in range(0, len(items), BATCH_SIZE):
+        batch = items[start:start + BATCH_SIZE]
+        increments = Case(
+            *[When(slug=slug, then=Value(count)) for slug, count in batch],
+            default=Value(0), output_field=IntegerField())
+        try:
+            Post.objects.filter(slug__in=[slug for slug, _ in batch]).update(
+                view_count=F('view_count') + increments)
+        except DatabaseError:
+            for slug, count in items[start:]:
+                buffer.add(slug, count)
+            raise
+    return sum(count for _, count in items)
+
+
+def flush_if_due():
+    interval = getattr(settings, 'FIRMSITE_VIEW_FLUSH_INTERVAL', 30)
+    if not interval or not get_buffer().due(interval):
+        return
+    try:
+        flush()
+    except DatabaseError:
+        # The views went back into the buffer for the next flush.
+        logger.warning("Could not flush view counts", exc_info=True)
+
+
+def score(post, now):
+    points = (post.view_count * VIEW_POINTS
+              + post.like_count * LIKE_POINTS
+              + post.approved_comment_count * COMMENT_POINTS)
+    hours = max(0.0, (now - post.created_on).total_seconds() / 3600)
+    return points / (hours + 2) ** GRAVITY
+
+
+def rank(batch_size=BATCH_SIZE):
+    """Recompute the popularity of every published post; return how many."""
+    now = timezone.now()
+    posts = Post.objects.filter(status=1).order_by('pk').only(
+        'pk', 'created_on', 'view_count', 'like_count',
+        'approved_comment_count')
+    last_pk, ranked = 0, 0
+    # Scored from the counts just flushed, not a lagging replica.
+    with use_primary():
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            for post in batch:
+                post.popularity = score(post, now)
+            Post.objects.bulk_update(batch, ['popularity'])
+            ranked += len(batch)
+            last_pk = batch[-1].pk
+    page_cache.invalidate(page_cache.LIST, page_cache.POPULAR)
+    return ranked
+
+
+def popular_posts(count=4):
+    posts = Post.objects.filter(status=1, popularity__gt=0).for_cards()
+    return list(posts.order_by('-popularity')[:count])
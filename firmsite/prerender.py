@@ -0,0 +1,49 @@
+"""
+Markup that is the same on every request, rendered once per process - so
+once per deploy - instead of on each render of the page around it.
+
+``section()`` renders templates under ``templates/sections/`` that take no
+context (static parts of ``index.html`` and ``base.html``), and ``form()``
+the crispy layout of unbound forms. With ``FIRMSITE_TEMPLATE_CACHE`` off,
+as in development, both render every time so template edits show at once.
+"""
+from crispy_forms.templatetags.crispy_forms_filters import as_crispy_form
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+
+_rendered = {}
+
+
+def enabled():
+    return getattr(settings, 'FIRMSITE_TEMPLATE_CACHE', True)
+
+
+def prerendered(key, render):
+    if not enabled():
+        return render()
+    # Two threads may both render on a miss; the results are identical.
+    if key not in _rendered:
+        _rendered[key] = render()
+    return _rendered[key]
+
+
+def clear():
+    _rendered.clear()
+
+
+def section(template_name):
+    return prerendered(('section', template_name), lambda: mark_safe(
+        render_to_string(template_name)))
+
+
+def form(form):
+    """
+    ``form | crispy``, rendered once per form class while unbound. Only for
+    forms whose unbound output does not vary, e.g. without initial values.
+    """
+    if form.is_bound:
+        return as_crispy_form(form)
+    key = ('form', type(form), form.prefix, form.auto_id)
+    return prerendered(key, lambda: as_crispy_form(form))
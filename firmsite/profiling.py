@@ -0,0 +1,230 @@
+"""
+Per-request profiling: SQL query count/time, template render time and total
+latency, reported as a ``Server-Timing`` header, a log line and aggregated
+per URL name, with the render time of each template loaded through the
+backend. Enable with ``FIRMSITE_PROFILING``.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+
+logger = logging.getLogger('firmsite.profiling')
+
+_current = contextvars.ContextVar('firmsite_profile', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.render_time = 0.0
+        # Template name: [renders, seconds], nested renders included.
+        self.templates = {}
+        self.total_time = 0.0
+        self._started = time.perf_counter()
+        self._render_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - start
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self._started
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.render_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+
+def current_profile():
+    return _current.get()
+
+
+@contextmanager
+def profiled_connections(profile=None):
+    """
+    Count queries on this thread's connections towards ``profile`` (the
+    current request's by default). Connections are per thread, so code
+    running the ORM in a worker thread enters this there.
+    """
+    profile = profile or current_profile()
+    with ExitStack() as stack:
+        if profile is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+        yield
+
+
+class RouteStats:
+    """Running totals per URL name, shared by all threads of a process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, name, profile):
+        with self._lock:
+            route = self._routes.setdefault(name, {
+                'requests': 0, 'queries': 0, 'max_queries': 0,
+                'db_ms': 0.0, 'render_ms': 0.0, 'total_ms': 0.0,
+                'templates': {},
+            })
+            route['requests'] += 1
+            route['queries'] += profile.queries
+            route['max_queries'] = max(route['max_queries'], profile.queries)
+            route['db_ms'] += profile.query_time * 1000
+            route['render_ms'] += profile.render_time * 1000
+            route['total_ms'] += profile.total_time * 1000
+            for template, (renders, seconds) in profile.templates.items():
+                totals = route['templates'].setdefault(template, [0, 0.0])
+                totals[0] += renders
+                totals[1] += seconds * 1000
+
+    def snapshot(self):
+        with self._lock:
+            routes = {
+                name: {**route, 'templates': {
+                    template: tuple(totals)
+                    for template, totals in route['templates'].items()}}
+                for name, route in self._routes.items()}
+        for route in routes.values():
+            count = route.pop('requests')
+            route.update({
+                'requests': count,
+                'avg_queries': round(route.pop('queries') / count, 2),
+                'avg_db_ms': round(route.pop('db_ms') / count, 2),
+                'avg_render_ms': round(route.pop('render_ms') / count, 2),
+                'avg_total_ms': round(route.pop('total_ms') / count, 2),
+                'templates': {
+                    template: {'renders': renders,
+                               'avg_ms': round(ms / renders, 2)}
+                    for template, (renders, ms) in
+                    route.pop('templates').items()},
+            })
+        return routes
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+stats = RouteStats()
+
+
+def check_budget(name, profile):
+    budget = getattr(settings, 'FIRMSITE_QUERY_BUDGETS', {}).get(name)
+    if budget is None or profile.queries <= budget:
+        return
+    message = f"{name} ran {profile.queries} queries (budget {budget})"
+    if getattr(settings, 'FIRMSITE_QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'FIRMSITE_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            with profiled_connections(profile):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        # Async views count their queries via profiled_connections() in the
+        # threads that run them.
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, profile)
+
+    def report(self, request, response, profile):
+        profile.finish()
+        match = request.resolver_match
+        name = match.url_name if match else None
+        stats.record(name, profile)
+        response['Server-Timing'] = profile.server_timing()
+        logger.info(
+            "%s %s queries=%d db=%.1fms render=%.1fms total=%.1fms",
+            name, request.path, profile.queries, profile.query_time * 1000,
+            profile.render_time * 1000, profile.total_time * 1000,
+        )
+        check_budget(name, profile)
+        return response
+
+
+class ProfiledTemplate(Template):
+
+    def render(self, context=None, request=None):
+        profile = current_profile()
+        if profile is None:
+            return super().render(context, request)
+        # Nested renders (e.g. crispy forms) are part of the outer one.
+        profile._render_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            elapsed = time.perf_counter() - start
+            profile._render_depth -= 1
+            if not profile._render_depth:
+                profile.render_time += elapsed
+            totals = profile.templates.setdefault(self.name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed
+
+    @property
+    def name(self):
+        return self.origin.template_name or self.origin.name
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """The stock Django backend with render timing for the profiler."""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(
+            super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return ProfiledTemplate(
+            super().get_template(template_name).template, self)
@@ -0,0 +1,114 @@
+"""
+Scheduled publishing.
+
+A post saved as Scheduled with a ``publish_at`` time stays out of every
+reader query, which all filter on the Published status, until
+``publish_due()`` promotes it. The ``publish_scheduled`` command does so in
+batches, once or in a loop. Promoted posts take ``publish_at`` as their
+``created_on`` so they top the feed, are indexed for search, and the pages,
+feeds and sitemap sections they change are rendered into the page cache by
+``warm()`` before readers ask for them.
+
+Reads deliberately do not also filter on ``publish_at <= now``. The page
+cache, the feeds, the sitemap, the search index and the per-post counters
+all change on a save, and a post crossing its time is no save: pages
+cached a minute before would keep hiding it, or a read filter would show
+it on the detail page while the cached list, feeds and search still left
+it out. Publishing is a write instead, so a post goes live everywhere at
+once, within one run of the command after its time. Run it often enough
+for that lag, e.g. every minute from cron or as a ``--loop`` worker.
+"""
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import F
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import cache as page_cache
+from . import feeds
+from . import search
+from .models import SCHEDULED, Post
+from .routers import use_primary
+
+
+logger = logging.getLogger('firmsite.publishing')
+
+BATCH_SIZE = 100
+
+
+def publish_due(batch_size=BATCH_SIZE, now=None):
+    """Publish the scheduled posts that are due; return their slugs."""
+    now = now or timezone.now()
+    due = Post.objects.filter(
+        status=SCHEDULED, publish_at__lte=now).order_by('publish_at', 'pk')
+    published = []
+    with use_primary():
+        while True:
+            # Locked rows are left to a concurrent publisher.
+            with transaction.atomic():
+                batch = list(due.select_for_update(skip_locked=True)
+                             .values_list('pk', 'slug')[:batch_size])
+                if not batch:
+                    break
+                post_ids = [pk for pk, _ in batch]
+                Post.objects.filter(pk__in=post_ids).update(
+                    status=1, created_on=F('publish_at'), updated_on=now)
+            search.update_documents(post_ids)
+            feeds.posts_changed(post_ids)
+            published.extend(slug for _, slug in batch)
+    if published:
+        page_cache.invalidate_posts(published, listed=True)
+    return published
+
+
+def warm_paths(slugs):
+    """
+    The pages publishing ``slugs`` changes, and the feeds and sitemap
+    sections if ``FIRMSITE_SITE_URL`` says which host they are cached for.
+    """
+    paths = [reverse('home'), *(
+        reverse('post_detail', args=[slug]) for slug in slugs)]
+    if feeds.site_url():
+        post_ids = Post.objects.filter(slug__in=slugs).values_list(
+            'pk', flat=True)
+        paths += [
+            reverse('rss_feed'), reverse('atom_feed'), reverse('sitemap'),
+            *(reverse('sitemap_section', args=[section]) for section in
+              sorted({feeds.section(pk) for pk in post_ids})),
+        ]
+    return paths
+
+
+def warm(paths):
+    """
+    Render ``paths`` as an anonymous reader would, which stores them in the
+    page cache. The views run without middleware, so warming counts no
+    post views. Return the paths that did not render.
+    """
+    factory = RequestFactory()
+    site = urlsplit(feeds.site_url())
+    extra = {'secure': site.scheme == 'https', 'HTTP_HOST': site.netloc} if (
+        site.netloc) else {}
+    failed = []
+    for path in paths:
+        request = factory.get(path, **extra)
+        request.user = AnonymousUser()
+        request.cache_warming = True
+        match = resolve(path)
+        view = match.func
+        if asyncio.iscoroutinefunction(view):
+            view = async_to_sync(view)
+        response = view(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        if response.status_code != 200:
+            logger.warning("Warming %s returned %s", path,
+                           response.status_code)
+            failed.append(path)
+    return failed
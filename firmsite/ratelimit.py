@@ -0,0 +1,158 @@
+"""
+Rate limits for comment and like writes.
+
+Each endpoint in ``FIRMSITE_RATE_LIMITS`` has rules of ``(key, limit,
+seconds)``: at most ``limit`` requests in any ``seconds`` for each value of
+the key - the signed-in user (the IP for anonymous clients), the client IP,
+the post, or a combination such as ``'user+post'``. Windows slide: the count
+is the current fixed window plus the share of the previous one that still
+overlaps. Counters live in the shared cache so every worker sees them.
+
+``RateLimitMixin`` answers over-limit POSTs with a 429 and ``Retry-After``
+before the view runs, so before any query of its own. The cache also counts
+allowed and throttled requests per endpoint for ``/stats/ratelimit/``.
+"""
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+
+from . import cache as page_cache
+
+
+logger = logging.getLogger('firmsite.ratelimit')
+
+COUNTER_KEY = 'firmsite:rl:{}:{}:{}:{}'
+STATS_KEY = 'firmsite:rl:stats:{}:{}'
+ALLOWED = 'allowed'
+
+
+def enabled():
+    return getattr(settings, 'FIRMSITE_RATE_LIMITING', True)
+
+
+def rules(endpoint):
+    return getattr(settings, 'FIRMSITE_RATE_LIMITS', {}).get(endpoint, ())
+
+
+def client_ip(request):
+    """
+    The client's address: ``REMOTE_ADDR``, or the ``X-Forwarded-For`` entry
+    added by the outermost of ``FIRMSITE_PROXY_COUNT`` trusted proxies.
+    """
+    proxies = getattr(settings, 'FIRMSITE_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [
+            address.strip() for address in
+            request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+            if address.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def key_value(key, request, kwargs):
+    values = []
+    for part in key.split('+'):
+        if part == 'user':
+            user = request.user
+            values.append(f'u{user.pk}' if user.is_authenticated
+                          else f'ip{client_ip(request)}')
+        elif part == 'ip':
+            values.append(client_ip(request))
+        elif part == 'post':
+            values.append(kwargs.get('slug', ''))
+        else:
+            raise ImproperlyConfigured(f"Unknown rate limit key {part!r}")
+    return ':'.join(values)
+
+
+def _incr(cache, key, timeout):
+    if cache.add(key, 1, timeout):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:  # Expired since the add().
+        cache.add(key, 1, timeout)
+        return 1
+
+
+def hit(endpoint, request, kwargs, now=None):
+    """
+    Count a request to ``endpoint``. Return the seconds to wait if it goes
+    over a limit, else None. Throttled requests count too, so a client
+    that keeps retrying stays throttled.
+    """
+    if not enabled():
+        return None
+    cache = page_cache.get_cache()
+    now = time.time() if now is None else now
+    counted = []
+    for key, limit, seconds in rules(endpoint):
+        window, elapsed = divmod(now, seconds)
+        window = int(window)
+        base = COUNTER_KEY.format(
+            endpoint, key, seconds, key_value(key, request, kwargs))
+        current = _incr(cache, f'{base}:{window}', seconds * 2)
+        counted.append((key, limit, seconds, elapsed, current,
+                        f'{base}:{window - 1}'))
+    previous = cache.get_many([entry[-1] for entry in counted])
+
+    retry_after = None
+    for key, limit, seconds, elapsed, current, previous_key in counted:
+        overlap = 1 - elapsed / seconds
+        if previous.get(previous_key, 0) * overlap + current > limit:
+            wait = math.ceil(seconds - elapsed)
+            if retry_after is None or wait > retry_after:
+                retry_after, throttled_by = wait, key
+    outcome = ALLOWED if retry_after is None else throttled_by
+    _incr(cache, STATS_KEY.format(endpoint, outcome), None)
+    if retry_after is not None:
+        logger.info("Throttled %s by %s for %ss", endpoint, throttled_by,
+                    retry_after)
+    return retry_after
+
+
+def snapshot():
+    """Allowed and throttled requests per endpoint and key."""
+    limits = getattr(settings, 'FIRMSITE_RATE_LIMITS', {})
+    keys = {
+        endpoint: [ALLOWED, *dict.fromkeys(rule[0] for rule in endpoint_rules)]
+        for endpoint, endpoint_rules in limits.items()}
+    found = page_cache.get_cache().get_many([
+        STATS_KEY.format(endpoint, key)
+        for endpoint, names in keys.items() for key in names])
+    stats = {}
+    for endpoint, names in keys.items():
+        counts = {key: found.get(STATS_KEY.format(endpoint, key), 0)
+                  for key in names}
+        allowed = counts.pop(ALLOWED)
+        stats[endpoint] = {
+            'allowed': allowed,
+            'throttled': sum(counts.values()),
+            'throttled_by': counts,
+        }
+    return stats
+
+
+class RateLimitMixin:
+    """Throttle POSTs to the ``rate_limit`` endpoint before the view runs."""
+
+    rate_limit = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method == 'POST' and self.rate_limit:
+            retry_after = hit(self.rate_limit, request, kwargs)
+            if retry_after is not None:
+                response = self.rate_limited(request)
+                response['Retry-After'] = retry_after
+                return response
+        return super().dispatch(request, *args, **kwargs)
+
+    def rate_limited(self, request):
+        return HttpResponse(
+            "Too many requests, please try again later.\n", status=429,
+            content_type='text/plain')
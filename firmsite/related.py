@@ -0,0 +1,162 @@
+"""
+Related posts from like co-occurrence.
+
+``build()`` turns the likes of published posts into a sparse user x post
+matrix and ranks, for each post, the posts whose likers overlap most
+(cosine similarity of the L2-normalised columns). Posts with fewer than
+``TOP_K`` such neighbours, e.g. without likes, are filled up by TF-IDF
+similarity of their title and text. The results go into ``RelatedPost``,
+which the detail page reads with one indexed query.
+
+Needs NumPy and SciPy, which only the ``rank_related_posts`` command uses;
+the site itself only reads the table.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils.html import strip_tags
+
+from . import cache as page_cache
+from .models import Post, RelatedPost
+from .search import tokenize
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+
+TOP_K = 4
+# Target posts per similarity block, which bounds memory.
+CHUNK_SIZE = 500
+TITLE_WEIGHT = 3
+# Words in more than this share of posts say nothing about similarity.
+MAX_DOCUMENT_FREQUENCY = 0.5
+
+LIKES = 'likes'
+TEXT = 'text'
+
+PostLikes = Post.likes.through
+
+
+def available():
+    return np is not None
+
+
+def _normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def like_matrix(column):
+    """Posts x users, one row per post in ``column``, L2-normalised."""
+    users = {}
+    rows, cols = [], []
+    likes = PostLikes.objects.filter(post__status=1).values_list(
+        'post_id', 'user_id')
+    for post_id, user_id in likes.iterator(chunk_size=10000):
+        if post_id in column:
+            rows.append(column[post_id])
+            cols.append(users.setdefault(user_id, len(users)))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(column), len(users)))
+    return _normalize_rows(matrix).tocsr()
+
+
+def text_matrix(column):
+    """Posts x terms TF-IDF, one row per post in ``column``."""
+    vocabulary = {}
+    rows, cols, data = [], [], []
+    posts = Post.objects.filter(status=1).values_list(
+        'pk', 'title', 'content')
+    for pk, title, content in posts.iterator(chunk_size=500):
+        if pk not in column:
+            continue
+        counts = Counter(tokenize(strip_tags(content)))
+        for token in tokenize(title):
+            counts[token] += TITLE_WEIGHT
+        for term, count in counts.items():
+            rows.append(column[pk])
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+            data.append(1 + np.log(count))
+    matrix = sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float32), (rows, cols)),
+        shape=(len(column), len(vocabulary)))
+    frequency = np.bincount(matrix.indices, minlength=len(vocabulary))
+    idf = np.log((1 + len(column)) / (1 + frequency)) + 1
+    # Words unique to one post cannot relate it to another.
+    idf[(frequency < 2)
+        | (frequency > MAX_DOCUMENT_FREQUENCY * len(column))] = 0
+    matrix = matrix @ sparse.diags(idf.astype(np.float32))
+    matrix.eliminate_zeros()
+    return _normalize_rows(matrix).tocsr()
+
+
+def _top(block, row, exclude, k):
+    """The ``k`` best ``(column, score)`` of a CSR ``block`` row."""
+    start, end = block.indptr[row], block.indptr[row + 1]
+    cols, scores = block.indices[start:end], block.data[start:end]
+    keep = (cols != exclude) & (scores > 0)
+    cols, scores = cols[keep], scores[keep]
+    if len(cols) > k:
+        best = np.argpartition(-scores, k)[:k]
+        cols, scores = cols[best], scores[best]
+    order = np.lexsort((cols, -scores))
+    return [(int(cols[i]), float(scores[i])) for i in order]
+
+
+def build(post_ids=None, k=TOP_K, chunk_size=CHUNK_SIZE):
+    """
+    Recompute the related posts of ``post_ids`` (all published posts by
+    default) and return how many were ranked. Similarity is always against
+    every published post, so the matrices are built in full.
+    """
+    published = list(Post.objects.filter(status=1).order_by(
+        'pk').values_list('pk', flat=True))
+    column = {pk: i for i, pk in enumerate(published)}
+    targets = [column[pk] for pk in (
+        published if post_ids is None else post_ids) if pk in column]
+    if not targets:
+        return 0
+
+    likes = like_matrix(column)
+    text = None
+    for start in range(0, len(targets), chunk_size):
+        chunk = targets[start:start + chunk_size]
+        block = (likes[chunk] @ likes.T).tocsr()
+        ranked = {}
+        fill = []
+        for i, col in enumerate(chunk):
+            ranked[col] = [
+                (other, score, LIKES)
+                for other, score in _top(block, i, col, k)]
+            if len(ranked[col]) < k:
+                fill.append(col)
+        if fill:
+            if text is None:
+                text = text_matrix(column)
+            block = (text[fill] @ text.T).tocsr()
+            for i, col in enumerate(fill):
+                taken = {other for other, _, _ in ranked[col]}
+                for other, score in _top(block, i, col, k):
+                    if other not in taken and len(ranked[col]) < k:
+                        ranked[col].append((other, score, TEXT))
+        _store(published, ranked)
+    page_cache.invalidate(page_cache.RELATED)
+    return len(targets)
+
+
+def _store(published, ranked):
+    with transaction.atomic():
+        RelatedPost.objects.filter(
+            post_id__in=[published[col] for col in ranked]).delete()
+        RelatedPost.objects.bulk_create([
+            RelatedPost(
+                post_id=published[col], related_id=published[other],
+                rank=rank, score=score, source=source)
+            for col, entries in ranked.items()
+            for rank, (other, score, source) in enumerate(entries, start=1)
+        ])
@@ -0,0 +1,103 @@
+"""
+Read-replica routing for the firmsite models.
+
+Reads go to the ``replica`` database unless the current context is pinned
+to the primary: inside a transaction, during a client's unsafe request and
+for ``FIRMSITE_REPLICA_STICKY_SECONDS`` afterwards, so people always see
+their own comments and likes. Pages and documents stored in the shared
+cache are built from the primary too (``cache.get_or_build()``), so a
+lagging replica never ends up in what everyone is served. Writes always go
+to the primary.
+"""
+import asyncio
+import contextvars
+from contextlib import contextmanager
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'firmsite_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_pinned = contextvars.ContextVar('firmsite_pinned', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Route every read in the block to the primary."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def pinned_to_primary():
+    return _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'firmsite' or pinned_to_primary():
+            return DEFAULT_DB_ALIAS
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica gets its schema from the primary.
+        return db != REPLICA
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pin unsafe requests to the primary and mark the client with a short
+    cookie that keeps its next reads there too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if REPLICA not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def is_sticky(self, request):
+        return (request.method not in SAFE_METHODS
+                or STICKY_COOKIE in request.COOKIES)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.is_sticky(request):
+            return self.get_response(request)
+        with use_primary():
+            response = self.get_response(request)
+        return self.mark(request, response)
+
+    async def __acall__(self, request):
+        if not self.is_sticky(request):
+            return await self.get_response(request)
+        with use_primary():
+            response = await self.get_response(request)
+        return self.mark(request, response)
+
+    def mark(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                STICKY_COOKIE, '1', httponly=True, samesite='Lax',
+                max_age=getattr(settings, 'FIRMSITE_REPLICA_STICKY_SECONDS',
+                                10))
+        return response
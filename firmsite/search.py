@@ -0,0 +1,259 @@
+"""
+Full-text search over posts and their approved comments.
+
+``SearchDocument`` keeps one plain-text row per post, refreshed whenever a
+post is saved or its approved comments change. The inverted index on top
+of it depends on the database:
+
+* PostgreSQL - a GIN index over a weighted ``tsvector`` expression
+* SQLite - an FTS5 table kept in sync by triggers
+* anything else - an in-process inverted index rebuilt when documents change
+"""
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.utils.functional import cached_property
+from django.utils.html import strip_tags
+
+from . import cache as page_cache
+from .models import Post, Comment, SearchDocument
+from .routers import use_primary
+
+
+# Longest comment text stored per post; the newest comments win.
+MAX_COMMENT_CHARS = 50000
+
+FTS_TABLE = 'firmsite_searchdocument_fts'
+
+PG_CONFIG = 'english'
+PG_VECTOR = (
+    "setweight(to_tsvector('english'::regconfig, title), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, body), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, comments), 'C')"
+)
+
+SEARCH_SCOPE = 'search'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text)]
+
+
+def build_documents(post_ids):
+    """Unsaved ``SearchDocument`` rows for ``post_ids``."""
+    comments = defaultdict(list)
+    approved = Comment.objects.filter(
+        post_id__in=post_ids, approved=True
+    ).order_by('-created_on').values_list('post_id', 'body')
+    for post_id, body in approved.iterator():
+        comments[post_id].append(body)
+
+    documents = []
+    posts = Post.objects.filter(pk__in=post_ids).values_list(
+        'pk', 'title', 'content')
+    for pk, title, content in posts:
+        documents.append(SearchDocument(
+            post_id=pk,
+            title=title,
+            body=strip_tags(content),
+            comments='\n'.join(comments[pk])[:MAX_COMMENT_CHARS],
+        ))
+    return documents
+
+
+def update_documents(post_ids):
+    """Re-index the given posts; deleted posts simply drop out."""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    # Built from the rows just written, not a lagging replica.
+    with use_primary():
+        documents = build_documents(post_ids)
+    # Readers see the old documents or the new ones, never neither.
+    with transaction.atomic():
+        SearchDocument.objects.filter(post_id__in=post_ids).delete()
+        SearchDocument.objects.bulk_create(documents)
+    page_cache.invalidate(SEARCH_SCOPE)
+
+
+_fts5_tables = {}
+
+
+def fts5_available():
+    """Whether the migration could create the FTS5 table on this database."""
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts5_tables:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE name = %s",
+                [FTS_TABLE])
+            _fts5_tables[name] = bool(cursor.fetchone()[0])
+    return _fts5_tables[name]
+
+
+class PostgresBackend:
+
+    def _run(self, select, query, published_only, tail='', params=()):
+        status = 'AND p.status = 1' if published_only else ''
+        sql = (
+            f"SELECT {select} FROM firmsite_searchdocument d "
+            f"JOIN firmsite_post p ON p.id = d.post_id, "
+            f"plainto_tsquery(%s::regconfig, %s) q "
+            f"WHERE ({PG_VECTOR}) @@ q {status} {tail}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [PG_CONFIG, query, *params])
+            return cursor.fetchall()
+
+    def count(self, query, published_only=True):
+        return self._run('count(*)', query, published_only)[0][0]
+
+    def search(self, query, offset, limit, published_only=True):
+        rows = self._run(
+            'd.post_id', query, published_only,
+            tail=f'ORDER BY ts_rank({PG_VECTOR}, q) DESC, d.post_id DESC '
+                 'LIMIT %s OFFSET %s',
+            params=(limit, offset))
+        return [row[0] for row in rows]
+
+
+class SQLiteBackend:
+
+    def _match(self, query):
+        # Quote every term so user input cannot use FTS5 query syntax.
+        return ' '.join(f'"{token}"' for token in tokenize(query))
+
+    def _run(self, select, query, published_only, tail='', params=()):
+        match = self._match(query)
+        if not match:
+            return None
+        status = 'AND p.status = 1' if published_only else ''
+        sql = (
+            f"SELECT {select} FROM {FTS_TABLE} f "
+            f"JOIN firmsite_post p ON p.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s {status} {tail}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, *params])
+            return cursor.fetchall()
+
+    def count(self, query, published_only=True):
+        rows = self._run('count(*)', query, published_only)
+        return rows[0][0] if rows else 0
+
+    def search(self, query, offset, limit, published_only=True):
+        rows = self._run(
+            'f.rowid', query, published_only,
+            tail=f'ORDER BY bm25({FTS_TABLE}, 10.0, 4.0, 1.0), '
+                 'f.rowid DESC LIMIT %s OFFSET %s',
+            params=(limit, offset))
+        return [row[0] for row in rows or ()]
+
+
+class PythonBackend:
+    """TF-IDF over an in-memory inverted index, for local development."""
+
+    WEIGHTS = {'title': 3.0, 'body': 1.0, 'comments': 0.5}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._postings = {}
+        self._published = set()
+
+    def _index(self):
+        version = page_cache.version(page_cache.POSTS, SEARCH_SCOPE)
+        with self._lock:
+            if version != self._version:
+                postings = defaultdict(Counter)
+                documents = SearchDocument.objects.values_list(
+                    'post_id', 'title', 'body', 'comments')
+                for post_id, *fields in documents.iterator():
+                    for name, text in zip(self.WEIGHTS, fields):
+                        for token in tokenize(text):
+                            postings[token][post_id] += self.WEIGHTS[name]
+                self._postings = dict(postings)
+                self._published = set(Post.objects.filter(
+                    status=1).values_list('pk', flat=True))
+                self._version = version
+            return self._postings, self._published
+
+    def _ranked(self, query, published_only):
+        postings, published = self._index()
+        tokens = tokenize(query)
+        if not tokens or any(token not in postings for token in tokens):
+            return []
+        matches = set.intersection(*(set(postings[t]) for t in tokens))
+        if published_only:
+            matches &= published
+        total = len(published) or 1
+        scores = {
+            post_id: sum(
+                postings[t][post_id] * math.log(1 + total / len(postings[t]))
+                for t in tokens
+            )
+            for post_id in matches
+        }
+        return sorted(scores, key=lambda pk: (-scores[pk], -pk))
+
+    def count(self, query, published_only=True):
+        return len(self._ranked(query, published_only))
+
+    def search(self, query, offset, limit, published_only=True):
+        return self._ranked(query, published_only)[offset:offset + limit]
+
+
+_python_backend = PythonBackend()
+
+
+def get_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresBackend()
+    if fts5_available():
+        return SQLiteBackend()
+    return _python_backend
+
+
+class SearchResults:
+    """A lazy, sliceable result list that ``Paginator`` can page through."""
+
+    def __init__(self, query, published_only=True):
+        self.query = query
+        self.published_only = published_only
+        self.backend = get_backend()
+
+    @cached_property
+    def _count(self):
+        if not self.query.strip():
+            return 0
+        return self.backend.count(self.query, self.published_only)
+
+    def count(self):
+        return self._count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self._count if index.stop is None else index.stop
+        if not self.query.strip() or stop <= start:
+            return []
+        post_ids = self.backend.search(
+            self.query, start, stop - start, self.published_only)
+        posts = Post.objects.for_cards().in_bulk(post_ids)
+        return [posts[pk] for pk in post_ids if pk in posts]
+
+    def ids(self, limit):
+        if not self.query.strip():
+            return []
+        return self.backend.search(self.query, 0, limit, self.published_only)
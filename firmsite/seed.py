@@ -0,0 +1,103 @@
+"""
+Synthetic data for benchmarks: users, posts, comments and likes inserted
+with ``bulk_create`` in batches. Never point this at a production database.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import content as post_content
+from .models import Post, Comment
+
+
+BATCH_SIZE = 5000
+
+
+def _batches(objects, size=BATCH_SIZE):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_users(count, prefix='seed'):
+    existing = User.objects.filter(username__startswith=f'{prefix}-').count()
+    users = (
+        User(username=f'{prefix}-{n}', email=f'{prefix}-{n}@example.com',
+             password='!')
+        for n in range(existing, existing + count)
+    )
+    for batch in _batches(users):
+        User.objects.bulk_create(batch)
+    return list(User.objects.filter(
+        username__startswith=f'{prefix}-').values_list('pk', flat=True))
+
+
+def seed_posts(count, author_ids, rng, prefix='seed', published=0.9):
+    start = Post.objects.filter(slug__startswith=f'{prefix}-').count()
+    now = timezone.now()
+    posts = (
+        Post(
+            title=f'{prefix.title()} post {n}', slug=f'{prefix}-{n}',
+            author_id=rng.choice(author_ids),
+            content=f'<p>Seeded content for post {n}.</p>' * 20,
+            excerpt=f'Seeded post {n}',
+            status=1 if rng.random() < published else 0,
+            created_on=now - timedelta(minutes=count - n + start),
+        )
+        for n in range(start, start + count)
+    )
+    for batch in _batches(posts):
+        # bulk_create skips Post.save(), which renders the content.
+        for post in batch:
+            post_content.apply(post)
+        Post.objects.bulk_create(batch)
+    return list(Post.objects.filter(
+        slug__startswith=f'{prefix}-').values_list('pk', flat=True))
+
+
+def seed_comments(count, post_ids, rng, approved=0.8):
+    now = timezone.now()
+    # A few hot posts collect most of the comments, like real traffic.
+    hot = post_ids[:max(1, len(post_ids) // 100)]
+    comments = (
+        Comment(
+            post_id=rng.choice(hot if rng.random() < 0.5 else post_ids),
+            name=f'reader-{n}', email=f'reader-{n % 1000}@example.com',
+            body=f'Seeded comment {n}',
+            approved=rng.random() < approved,
+            created_on=now - timedelta(seconds=count - n),
+        )
+        for n in range(count)
+    )
+    for batch in _batches(comments):
+        Comment.objects.bulk_create(batch)
+
+
+def seed_likes(count, user_ids, post_ids, rng):
+    PostLikes = Post.likes.through
+    pairs = {
+        (rng.choice(post_ids), rng.choice(user_ids)) for _ in range(count)
+    }
+    likes = (PostLikes(post_id=post, user_id=user) for post, user in pairs)
+    for batch in _batches(likes):
+        PostLikes.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def seed(users=100, posts=1000, comments=10000, likes=10000, random_seed=0):
+    """Create the given numbers of rows and bring the counters up to date."""
+    rng = random.Random(random_seed)
+    with transaction.atomic():
+        user_ids = seed_users(users)
+        post_ids = seed_posts(posts, user_ids, rng)
+        seed_comments(comments, post_ids, rng)
+        seed_likes(likes, user_ids, post_ids, rng)
+        Post.objects.filter(slug__startswith='seed-').refresh_counters()
+    return user_ids, post_ids
@@ -0,0 +1,192 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signals import (
+    request_finished, request_started, setting_changed)
+from django.db import connections, transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete)
+from django.dispatch import receiver
+from .models import Post, Comment, SearchDocument
+from . import cache as page_cache
+from . import feeds
+from . import images
+from . import popularity
+from . import prerender
+from . import search
+from .auth import forget_user
+from .routers import use_primary
+
+
+PostLikes = Post.likes.through
+
+_deferred = contextvars.ContextVar('firmsite_deferred_counters', default=None)
+
+
+@contextmanager
+def batched_counters():
+    """
+    Collect counter refreshes triggered inside the block and run them once
+    per post on exit, instead of once per deleted or saved row.
+    """
+    if _deferred.get() is not None:
+        yield
+        return
+    pending = {'likes': set(), 'comments': set()}
+    token = _deferred.set(pending)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+    likes_changed(pending['likes'])
+    comments_changed(pending['comments'])
+
+
+def likes_changed(post_ids):
+    pending = _deferred.get()
+    if pending is not None:
+        pending['likes'].update(post_ids)
+        return
+    if not post_ids:
+        return
+    posts = Post.objects.filter(pk__in=post_ids)
+    with use_primary():
+        posts.refresh_counters(liked=True)
+        page_cache.invalidate_posts(
+            posts.values_list('slug', flat=True), listed=True)
+
+
+def comments_changed(post_ids):
+    pending = _deferred.get()
+    if pending is not None:
+        pending['comments'].update(post_ids)
+        return
+    if not post_ids:
+        return
+    posts = Post.objects.filter(pk__in=post_ids)
+    with use_primary():
+        # Touched so the detail page's ETag changes with its comments.
+        posts.refresh_counters(touch=True)
+        page_cache.invalidate_posts(posts.values_list('slug', flat=True))
+        feeds.posts_changed(post_ids)
+        search.update_documents(post_ids)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    page_cache.invalidate(page_cache.POSTS)
+    feeds.posts_changed([instance.pk])
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.update_documents([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def drop_search_document(sender, instance, **kwargs):
+    # Deleting the post's approved comments re-indexed it on the way.
+    SearchDocument.objects.filter(post_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Post)
+def build_image_derivatives(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'featured_image' not in update_fields:
+        return
+    image = instance.featured_image
+    if images.is_placeholder(image):
+        return
+    transaction.on_commit(lambda: images.generate_on_save(image))
+
+
+@receiver(m2m_changed, sender=PostLikes)
+def update_like_count(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            likes_changed([instance.pk])
+        return
+
+    # Reverse side: ``instance`` is the user and ``pk_set`` holds posts.
+    if action == 'pre_clear':
+        instance._cleared_post_ids = list(
+            instance.blogpost_like.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        likes_changed(getattr(instance, '_cleared_post_ids', []))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        likes_changed(pk_set)
+
+
+@receiver(pre_delete, sender=User)
+def remember_liked_posts(sender, instance, **kwargs):
+    # Deleting a user cascades to the likes table without m2m_changed.
+    instance._liked_post_ids = list(
+        instance.blogpost_like.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def update_like_count_on_user_delete(sender, instance, **kwargs):
+    likes_changed(getattr(instance, '_liked_post_ids', []))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def update_comment_count(sender, instance, created, **kwargs):
+    if created and not instance.approved:
+        return
+    comments_changed([instance.post_id])
+
+
+@receiver(post_delete, sender=Comment)
+def update_comment_count_on_delete(sender, instance, **kwargs):
+    if instance.approved:
+        comments_changed([instance.post_id])
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """
+    Ping connections kept open by CONN_MAX_AGE before a request reuses
+    them, and drop any the server closed while they sat idle. Only those
+    idle for ``FIRMSITE_DB_HEALTH_CHECK_IDLE`` seconds are pinged, so busy
+    workers and cached pages pay no round trip.
+    """
+    if not getattr(settings, 'FIRMSITE_DB_HEALTH_CHECKS', True):
+        return
+    idle = getattr(settings, 'FIRMSITE_DB_HEALTH_CHECK_IDLE', 30)
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        idle_since = getattr(connection, 'firmsite_idle_since', None)
+        if idle_since is not None and now - idle_since < idle:
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+@receiver(request_finished)
+def mark_connections_idle(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.firmsite_idle_since = now
+
+
+@receiver(request_finished)
+def flush_view_counts(sender, **kwargs):
+    popularity.flush_if_due()
+
+
+@receiver(setting_changed)
+def reset_prerendered(setting, **kwargs):
+    if setting in ('TEMPLATES', 'FIRMSITE_TEMPLATE_CACHE'):
+        prerender.clear()
@@ -0,0 +1,22 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from firmsite.images import image_sources
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, variant, **attrs):
+    """
+    ``<img>`` with a ``srcset`` of the variant's widths, lazy-loaded unless
+    ``loading`` is given, e.g. ``loading="eager"`` above the fold.
+    """
+    src, srcset, sizes = image_sources(image, variant)
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    if srcset:
+        attrs.update(srcset=srcset, sizes=sizes)
+    return format_html('<img src="{}"{}>', src, flatatt(attrs))
@@ -0,0 +1,18 @@
+from django import template
+
+from firmsite import prerender
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def static_section(template_name):
+    """A template that takes no context, rendered once per process."""
+    return prerender.section(template_name)
+
+
+@register.filter
+def cached_crispy(form):
+    """Like ``crispy``, but renders an unbound form only once."""
+    return prerender.form(form)
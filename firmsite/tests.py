@@ -1,3 +1,1383 @@
-from django.test import TestCase
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from crispy_forms.templatetags.crispy_forms_filters import as_crispy_form
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.db import DatabaseError, connection, connections
+from django.db.models import QuerySet
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+from . import (
+    assets, async_views, auth, feeds, images, loadtest, moderation,
+    popularity, prerender, publishing, ratelimit, related, search,
+    transfer, views)
+from .models import SCHEDULED, Post, Comment, PendingComment, SearchDocument
+from .cache import get_cache, get_or_build, invalidate
+from .loadtest import PLACEHOLDER_PAGES, percentile, placeholder
+from .pagination import KeysetPaginator
+from .profiling import QueryBudgetExceeded, stats
+from .routers import (
+    STICKY_COOKIE, ReplicaRouter, ReplicaStickinessMiddleware, use_primary)
+from .search import SearchResults
+from .signals import check_connections, mark_connections_idle
+from .urls import blog_patterns
+
+
+urlpatterns = [
+    path(f'__{name}/', placeholder, name=name)
+    for name in PLACEHOLDER_PAGES
+] + [
+    path('async/', include((blog_patterns(async_views), 'async'))),
+    path('', include('lawfirm.urls')),
+]
+
+
+@override_settings(
+    ROOT_URLCONF='firmsite.tests',
+    FIRMSITE_PROFILING=True,
+    FIRMSITE_QUERY_BUDGET_STRICT=True,
+    FIRMSITE_VIEW_FLUSH_INTERVAL=0,
+    # One process, so the local-memory cache is shared by every request.
+    FIRMSITE_PAGE_CACHE=True,
+)
+class FirmsiteTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com')
+        cls.reader = User.objects.create_user('reader', 'reader@example.com')
+
+    def setUp(self):
+        get_cache().clear()
+        popularity.get_buffer().drain()
+
+    @classmethod
+    def create_post(cls, n, status=1):
+        return Post.objects.create(
+            title=f"Post {n}", slug=f"post-{n}", author=cls.author,
+            content=f"<p>Content {n}</p>", status=status,
+        )
+
+
+class CounterTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post = self.create_post(1)
+
+    def test_like_count_follows_likes(self):
+        fan = User.objects.create_user('fan', 'fan@example.com')
+        self.post.likes.add(self.reader, fan)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+
+        self.reader.blogpost_like.remove(self.post)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+        fan.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_approved_comment_count(self):
+        comment = Comment.objects.create(
+            post=self.post, name='reader', email='reader@example.com',
+            body='Hello')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 0)
+
+        comment.approved = True
+        comment.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 1)
+
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 0)
+
+    def test_reconcile_counters_fixes_drift(self):
+        self.post.likes.add(self.reader)
+        Post.objects.update(like_count=7, approved_comment_count=3)
+        self.assertContains(self.client.get('/post-1/'), 'like-count">7 ')
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('1 post(s) with drifted counters', out.getvalue())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.post.approved_comment_count, 0)
+        # The cached page is not served with the drifted count.
+        self.assertContains(self.client.get('/post-1/'), 'like-count">1 ')
+
+
+class PostListTests(FirmsiteTestCase):
+
+    def test_query_count_does_not_grow_with_likes(self):
+        for n in range(6):
+            post = self.create_post(n)
+            post.likes.add(self.reader, self.author)
+        # The page of posts and the popular posts.
+        with self.assertNumQueries(2):
+            response = self.client.get('/')
+        self.assertContains(response, 'Post 5')
+
+
+class PageCacheTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post = self.create_post(1)
+
+    def test_anonymous_pages_are_served_without_queries(self):
+        for url in ('/', '/post-1/'):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertContains(response, 'Post 1')
+
+    def test_like_invalidates_list_and_detail(self):
+        self.client.get('/')
+        self.client.get('/post-1/')
+        self.post.likes.add(self.reader)
+        with self.assertNumQueries(1):
+            self.client.get('/')
+        response = self.client.get('/post-1/')
+        self.assertContains(
+            response, '<span class="text-secondary" id="like-count">1 </span>')
+
+    def test_comment_approval_invalidates_detail(self):
+        comment = Comment.objects.create(
+            post=self.post, name='reader', email='reader@example.com',
+            body='First!')
+        self.assertNotContains(self.client.get('/post-1/'), 'First!')
+        comment.approved = True
+        comment.save()
+        self.assertContains(self.client.get('/post-1/'), 'First!')
+
+    def test_authenticated_users_bypass_page_cache(self):
+        self.client.force_login(self.reader)
+        self.client.get('/post-1/')
+        response = self.client.get('/post-1/')
+        self.assertContains(response, 'Leave a comment')
+
+
+class ProfilingTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        stats.reset()
+        self.post = self.create_post(1)
+
+    def test_server_timing_and_stats(self):
+        response = self.client.get('/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertEqual(stats.snapshot()['home']['requests'], 1)
+
+    def test_views_stay_within_query_budget(self):
+        self.client.force_login(self.reader)
+        self.client.get('/')
+        self.client.get('/post-1/')
+        self.client.post('/post-1/', {'body': 'Nice post'})
+        self.client.post('/like/post-1')
+
+    @override_settings(FIRMSITE_QUERY_BUDGETS={'home': 0})
+    def test_exceeding_budget_fails(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/')
+
+
+@override_settings(FIRMSITE_PAGE_CACHE=False)
+class TemplateRenderingTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        stats.reset()
+        prerender.clear()
+        self.create_post(1)
+
+    def test_static_sections_render_once(self):
+        with mock.patch('firmsite.prerender.render_to_string',
+                        wraps=render_to_string) as rendered:
+            response = self.client.get('/')
+            sections = rendered.call_count
+            self.client.get('/')
+        self.assertEqual(rendered.call_count, sections)
+        self.assertEqual(sections, 8)
+        for text in ('Our Team', 'Latest Statistics', 'Opening Hours',
+                     'Bootstrap carousel quotes', 'ABOUT US'):
+            self.assertContains(response, text)
+
+    @override_settings(FIRMSITE_TEMPLATE_CACHE=False)
+    def test_sections_rerender_without_template_cache(self):
+        with mock.patch('firmsite.prerender.render_to_string',
+                        wraps=render_to_string) as rendered:
+            self.client.get('/')
+            self.client.get('/')
+        self.assertEqual(rendered.call_count, 16)
+
+    def test_comment_form_renders_once(self):
+        self.client.force_login(self.reader)
+        with mock.patch('firmsite.prerender.as_crispy_form',
+                        wraps=as_crispy_form) as rendered:
+            self.client.get('/post-1/')
+            response = self.client.get('/post-1/')
+            self.client.post('/post-1/', {'body': ''})
+        self.assertContains(response, 'id="id_body"')
+        # The second page reuses it; the bound form is rendered afresh.
+        self.assertEqual(rendered.call_count, 1)
+
+    def test_render_time_per_template(self):
+        self.client.force_login(self.reader)
+        self.client.get('/post-1/')
+        templates = stats.snapshot()['post_detail']['templates']
+        self.assertEqual(templates['post_detail.html']['renders'], 1)
+        self.assertIn('sections/footer.html', templates)
+        self.assertIn('bootstrap4/uni_form.html', templates)
+
+
+class KeysetPaginationTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for n in range(14):
+            self.create_post(n)
+        # Ties on created_on must be broken by id.
+        Post.objects.filter(pk__in=Post.objects.order_by(
+            'pk').values('pk')[4:10]).update(
+            created_on=Post.objects.get(slug='post-4').created_on)
+        self.expected = list(
+            Post.objects.order_by('-created_on', '-id')
+            .values_list('slug', flat=True))
+
+    def slugs(self, page):
+        return [post.slug for post in page]
+
+    def test_walks_forward_and_back(self):
+        paginator = KeysetPaginator(Post.objects.all(), 6)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+        self.assertEqual(
+            self.slugs(first) + self.slugs(second) + self.slugs(third),
+            self.expected)
+        self.assertFalse(first.has_previous())
+        self.assertFalse(third.has_next())
+
+        back = paginator.page(third.previous_cursor)
+        self.assertEqual(self.slugs(back), self.slugs(second))
+        self.assertEqual(
+            self.slugs(paginator.page(back.previous_cursor)),
+            self.slugs(first))
+        self.assertFalse(paginator.page(back.previous_cursor).has_previous())
+
+    def test_deep_pages_skip_count_and_offset(self):
+        response = self.client.get('/')
+        cursor = response.context['page_obj'].next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/', {'cursor': cursor})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+        self.assertContains(response, '?cursor=')
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(
+            self.client.get('/', {'cursor': 'nonsense'}).status_code, 404)
+
+
+@override_settings(FIRMSITE_PAGE_CACHE=False)
+class PostDetailTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post = self.create_post(1)
+        self.post.likes.add(self.reader)
+        for n in range(5):
+            Comment.objects.create(
+                post=self.post, name='reader', email='reader@example.com',
+                body=f'Comment {n}', approved=True)
+
+    def test_anonymous_get_is_three_queries(self):
+        # The post, its related posts and its comments.
+        with self.assertNumQueries(3):
+            response = self.client.get('/post-1/')
+        self.assertFalse(response.context['liked'])
+        self.assertContains(response, 'Comment 4')
+
+    def test_authenticated_get_loads_like_state_with_post(self):
+        self.client.force_login(self.reader)
+        # Session and user, then the post, related posts and comments.
+        with self.assertNumQueries(5):
+            response = self.client.get('/post-1/')
+        self.assertTrue(response.context['liked'])
+        self.assertEqual(response.context['post'].approved_comment_count, 5)
+
+    @override_settings(FIRMSITE_PAGE_CACHE=False)
+    def test_comments_load_in_keyset_pages(self):
+        with mock.patch.object(views.PostDetail, 'comments_paginate_by', 2), \
+                mock.patch.object(
+                    views.PostComments, 'comments_paginate_by', 2):
+            response = self.client.get('/post-1/')
+            self.assertContains(response, 'Comment 4')
+            self.assertNotContains(response, 'Comment 2')
+            page = response.context['comments']
+            url = f'/post-1/comments/?cursor={page.next_page_number()}'
+            self.assertContains(response, url)
+
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertContains(response, 'Comment 2')
+            self.assertContains(response, 'Comment 1')
+            self.assertNotContains(response, 'Comment 3')
+            self.assertContains(response, 'load-comments')
+
+        response = self.client.get('/post-1/comments/?cursor=bogus')
+        self.assertEqual(response.status_code, 404)
+
+    def test_comment_post_shares_the_loader(self):
+        self.client.force_login(self.author)
+        with self.assertNumQueries(6):
+            response = self.client.post('/post-1/', {'body': 'Thanks'})
+        self.assertTrue(response.context['commented'])
+        self.assertFalse(response.context['liked'])
+        self.assertTrue(Comment.objects.filter(body='Thanks').exists())
+
+
+class PostLikeTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post = self.create_post(1)
+
+    def test_api_toggles_and_returns_count(self):
+        self.client.force_login(self.reader)
+        response = self.client.post('/api/like/post-1')
+        self.assertEqual(response.json(), {'liked': True, 'like_count': 1})
+        response = self.client.post('/api/like/post-1')
+        self.assertEqual(response.json(), {'liked': False, 'like_count': 0})
+        self.assertFalse(self.post.likes.exists())
+
+    def test_api_requires_login(self):
+        response = self.client.post('/api/like/post-1')
+        self.assertEqual(response.status_code, 403)
+
+    def test_toggle_after_concurrent_like_keeps_count_exact(self):
+        # Another request likes the post between our DELETE and INSERT:
+        # its like is committed, but our DELETE does not see it, so our
+        # INSERT hits the unique constraint.
+        PostLikes = Post.likes.through
+        PostLikes.objects.create(post=self.post, user=self.reader)
+        Post.objects.filter(pk=self.post.pk).update(like_count=1)
+        with mock.patch.object(QuerySet, 'delete', return_value=(0, {})), \
+                mock.patch.object(PostLikes.objects, 'create',
+                                  wraps=PostLikes.objects.create) as create:
+            self.assertEqual(self.post.toggle_like(self.reader), (True, 1))
+        create.assert_called_once()
+        self.assertEqual(self.post.toggle_like(self.reader), (False, 0))
+
+    def test_redirect_flow_for_non_js_clients(self):
+        self.client.force_login(self.reader)
+        response = self.client.post('/like/post-1')
+        self.assertRedirects(
+            response, '/post-1/', fetch_redirect_response=False)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+
+class ModerationTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post = self.create_post(1)
+        for n in range(7):
+            Comment.objects.create(
+                post=self.post, name='reader', email='reader@example.com',
+                body=f'Pending {n}')
+
+    def test_batched_approve_updates_counter(self):
+        count = moderation.moderate(
+            PendingComment.objects.all(), moderation.APPROVE, batch_size=3)
+        self.assertEqual(count, 7)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 7)
+        self.assertFalse(PendingComment.objects.exists())
+
+    def test_batched_delete_refreshes_counter_once_per_batch(self):
+        Comment.objects.update(approved=True)
+        Post.objects.refresh_counters()
+        # A fixed number of queries per batch (savepoints and the atomic
+        # search document refresh included), plus the final empty lookup.
+        with self.assertNumQueries(13 * 3 + 1):
+            count = moderation.moderate(
+                Comment.objects.all(), moderation.DELETE, batch_size=3)
+        self.assertEqual(count, 7)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 0)
+
+    def test_reject_leaves_the_queue(self):
+        moderation.moderate(Comment.objects.all(), moderation.REJECT)
+        self.assertFalse(PendingComment.objects.exists())
+        self.assertEqual(Comment.objects.filter(rejected=True).count(), 7)
+
+    def test_command_approves_known_commenters(self):
+        Comment.objects.create(
+            post=self.post, name='reader', email='reader@example.com',
+            body='Earlier', approved=True)
+        Comment.objects.create(
+            post=self.post, name='stranger', email='new@example.com',
+            body='Hi')
+        call_command('moderate_comments', '--approve-known', stdout=StringIO())
+        self.assertEqual(
+            list(PendingComment.objects.values_list('email', flat=True)),
+            ['new@example.com'])
+
+    def test_command_reports_rejections(self):
+        Comment.objects.update(created_on=timezone.now() - timedelta(days=30))
+        out = StringIO()
+        call_command('moderate_comments', '--reject-older-than=7', stdout=out)
+        self.assertEqual(
+            out.getvalue(), "stale comments: rejected 7 comment(s)\n")
+
+
+class PopularityTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.old = self.create_post(1)
+        self.new = self.create_post(2)
+        Post.objects.filter(pk=self.old.pk).update(
+            created_on=timezone.now() - timedelta(days=7))
+
+    def test_views_are_buffered_and_flushed_in_one_update(self):
+        for _ in range(3):
+            self.client.get('/post-2/')
+        self.client.get('/post-1/')
+        self.client.get('/missing/')
+        self.assertEqual(Post.objects.get(pk=self.new.pk).view_count, 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(popularity.flush(), 4)
+        self.assertEqual(
+            dict(Post.objects.values_list('slug', 'view_count')),
+            {'post-1': 1, 'post-2': 3})
+
+    @override_settings(FIRMSITE_VIEW_DEDUP_SECONDS=60)
+    def test_deduplicates_per_viewer(self):
+        self.client.get('/post-2/')
+        self.client.get('/post-2/')
+        self.client.get('/post-2/', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(popularity.get_buffer().drain(), {'post-2': 2})
+
+    @override_settings(FIRMSITE_VIEW_BUFFER='cache')
+    def test_cache_buffer_and_ranking(self):
+        self.client.get('/post-1/')
+        self.client.get('/post-1/')
+        self.client.get('/post-2/')
+        call_command('rank_posts', stdout=StringIO())
+        self.assertEqual(popularity.flush(), 0)
+        posts = Post.objects.order_by('-popularity')
+        # Newer posts outrank older ones with more views.
+        self.assertEqual([post.slug for post in posts], ['post-2', 'post-1'])
+        self.assertEqual(posts[1].view_count, 2)
+
+        response = self.client.get('/')
+        self.assertEqual(
+            [post.slug for post in response.context['popular_posts']],
+            ['post-2', 'post-1'])
+        self.assertContains(response, 'Popular right now')
+
+    def test_cache_buffer_drains_only_dirty_slugs(self):
+        buffer = popularity.CacheBuffer()
+        buffer.add('post-1', 2)
+        buffer.add('post-2')
+        buffer.add('post-1')
+        # No scan of the posts table.
+        with self.assertNumQueries(0):
+            self.assertEqual(buffer.drain(), {'post-1': 3, 'post-2': 1})
+        self.assertEqual(buffer.drain(), {})
+
+        # A slot taken by an add() that has not filled it in yet holds up
+        # the drain once, then is skipped.
+        get_cache().incr(popularity.DIRTY_COUNT_KEY)
+        buffer.add('post-2', 4)
+        self.assertEqual(buffer.drain(), {})
+        self.assertEqual(buffer.drain(), {'post-2': 4})
+
+
+class PublishingTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_post(1)
+        self.scheduled = self.create_post(2, status=SCHEDULED)
+        Post.objects.filter(pk=self.scheduled.pk).update(
+            publish_at=timezone.now() + timedelta(hours=1))
+
+    def test_scheduled_posts_need_a_time(self):
+        post = Post(title="Later", slug="later", author=self.author,
+                    content="<p>Later</p>", status=SCHEDULED)
+        with self.assertRaises(ValidationError):
+            post.full_clean()
+
+    def test_due_posts_are_published_and_warmed(self):
+        self.assertEqual(publishing.publish_due(), [])
+        self.assertEqual(self.client.get('/post-2/').status_code, 404)
+        self.assertNotContains(self.client.get('/'), 'Post 2')
+
+        publish_at = timezone.now() - timedelta(minutes=1)
+        Post.objects.filter(pk=self.scheduled.pk).update(
+            publish_at=publish_at)
+        out = StringIO()
+        call_command('publish_scheduled', stdout=out)
+        self.assertIn('Published 1 post(s): post-2', out.getvalue())
+        post = Post.objects.get(pk=self.scheduled.pk)
+        self.assertEqual((post.status, post.created_on), (1, publish_at))
+
+        # Rendered by the command, so the first readers hit the cache.
+        with self.assertNumQueries(0):
+            home = self.client.get('/')
+            detail = self.client.get('/post-2/')
+        self.assertContains(home, 'Post 2')
+        self.assertContains(detail, 'Content 2')
+        # Warming is not a view; the reader above is.
+        self.assertEqual(popularity.get_buffer().drain(), {'post-2': 1})
+        self.assertEqual(publishing.publish_due(), [])
+
+    @override_settings(FIRMSITE_SITE_URL='https://example.com')
+    def test_feeds_are_warmed_for_the_site_url(self):
+        Post.objects.filter(pk=self.scheduled.pk).update(
+            publish_at=timezone.now())
+        call_command('publish_scheduled', stdout=StringIO())
+        with self.assertNumQueries(0):
+            response = self.client.get('/feeds/rss.xml')
+        self.assertContains(response, 'https://example.com/post-2/')
+
+
+@override_settings(FIRMSITE_SITEMAP_SECTION_SIZE=2)
+class FeedTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.posts = [self.create_post(n) for n in (1, 2, 3)]
+        self.create_post(4, status=0)
+
+    def section_url(self, post):
+        return reverse('sitemap_section', args=[feeds.section(post.pk)])
+
+    def test_sitemap_sections_are_rebuilt_one_at_a_time(self):
+        index = self.client.get('/sitemap.xml')
+        self.assertEqual(index['Content-Type'], feeds.SITEMAP_CONTENT_TYPE)
+        for post in self.posts:
+            self.assertContains(
+                index, f'http://testserver{self.section_url(post)}')
+        first, last = self.section_url(self.posts[0]), self.section_url(
+            self.posts[2])
+        self.assertNotEqual(first, last)
+        self.assertContains(
+            self.client.get(last), 'http://testserver/post-3/</loc>')
+        self.assertNotContains(self.client.get(last), 'post-4')
+        self.assertContains(self.client.get(first), '/post-2/</loc>')
+        with self.assertNumQueries(0):
+            self.client.get('/sitemap.xml')
+            self.client.get(first)
+
+        self.posts[2].title = "Post 3, revised"
+        self.posts[2].save()
+        with self.assertNumQueries(0):
+            self.client.get(first)
+        with self.assertNumQueries(1):
+            self.client.get(last)
+        self.assertEqual(self.client.get('/sitemap-posts-99.xml').status_code,
+                         404)
+
+    def test_feeds_follow_published_posts(self):
+        for url, tag in (('/feeds/rss.xml', '<item>'),
+                         ('/feeds/atom.xml', '<entry>')):
+            response = self.client.get(url)
+            self.assertEqual(response.content.decode().count(tag), 3)
+            self.assertNotContains(response, 'Post 4')
+        self.create_post(5)
+        self.assertContains(self.client.get('/feeds/rss.xml'), 'Post 5')
+
+    def test_conditional_get_without_queries(self):
+        response = self.client.get('/feeds/atom.xml')
+        self.assertIn('public', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(
+                '/feeds/atom.xml', HTTP_IF_NONE_MATCH=response['ETag']
+            ).status_code, 304)
+            self.assertEqual(self.client.get(
+                '/feeds/atom.xml',
+                HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+            ).status_code, 304)
+
+    @override_settings(FIRMSITE_SITE_URL='https://example.com/')
+    def test_site_url(self):
+        self.assertContains(self.client.get('/feeds/rss.xml'),
+                            '<link>https://example.com/post-1/</link>')
+
+
+@unittest.skipIf(not related.available(), "numpy and scipy are not installed")
+class RelatedPostTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        topics = ['probate wills', 'probate estates', 'tenancy leases',
+                  'tenancy deposits', 'employment contracts']
+        self.posts = [self.create_post(n) for n in range(5)]
+        for post, topic in zip(self.posts, topics):
+            Post.objects.filter(pk=post.pk).update(content=f"<p>{topic}</p>")
+        likers = [User.objects.create_user(f'liker{n}') for n in range(3)]
+        # Posts 0 and 1 share two likers, 0 and 2 only one.
+        for liker, liked in zip(likers, [(0, 1, 2), (0, 1), (2, 3)]):
+            for n in liked:
+                self.posts[n].likes.add(liker)
+
+    def related_slugs(self, post):
+        return [other.slug for other in post.related_posts()]
+
+    def test_likes_first_then_text(self):
+        call_command('rank_related_posts', '--top-k=2', stdout=StringIO())
+        self.assertEqual(self.related_slugs(self.posts[0]),
+                         ['post-1', 'post-2'])
+        self.assertEqual(self.related_slugs(self.posts[3]), ['post-2'])
+        # No likes and no words in common with any other post.
+        self.assertEqual(self.related_slugs(self.posts[4]), [])
+        self.assertEqual(self.related_slugs(self.posts[1]),
+                         ['post-0', 'post-2'])
+        entry = self.posts[3].related_entries.get()
+        self.assertEqual(entry.source, related.LIKES)
+
+    def test_text_fallback_and_incremental_run(self):
+        self.posts[0].likes.clear()
+        related.build([self.posts[0].pk], k=2)
+        self.assertEqual(self.related_slugs(self.posts[0]), ['post-1'])
+        self.assertEqual(self.posts[0].related_entries.get().source,
+                         related.TEXT)
+
+        call_command('rank_related_posts', '--since=5', stdout=StringIO())
+        ranked = set(Post.objects.filter(
+            related_entries__isnull=False).values_list('slug', flat=True))
+        self.assertEqual(ranked, {f'post-{n}' for n in range(4)})
+
+    def test_incremental_run_reranks_liked_posts(self):
+        related.build(k=2)
+        self.assertEqual(self.related_slugs(self.posts[4]), [])
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Post.objects.update(
+            updated_on=an_hour_ago, likes_changed_on=an_hour_ago)
+
+        # Likes do not touch updated_on, but the run still sees them.
+        fan = User.objects.get(username='liker2')
+        self.posts[4].toggle_like(fan)
+        call_command('rank_related_posts', '--since=5', stdout=StringIO())
+        self.assertEqual(self.related_slugs(self.posts[4]),
+                         ['post-3', 'post-2'])
+
+    def test_detail_page_reads_one_query(self):
+        related.build()
+        Post.objects.filter(pk=self.posts[2].pk).update(status=0)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.related_slugs(self.posts[0]), ['post-1'])
+        response = self.client.get('/post-0/')
+        self.assertContains(response, 'Related posts')
+        self.assertContains(response, 'href="/post-1/"')
+
+
+@override_settings(FIRMSITE_RATE_LIMITS={
+    'comment': [('user', 2, 60)],
+    'like': [('user+post', 2, 60), ('ip', 100, 60)],
+})
+class RateLimitTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_post(1)
+        self.create_post(2)
+        self.client.force_login(self.reader)
+
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+        FIRMSITE_USER_CACHE_TIMEOUT=60)
+    def test_comments_are_throttled_before_database_work(self):
+        self.client.force_login(self.reader)
+        for n in range(2):
+            self.client.post('/post-1/', {'body': f'Comment {n}'})
+        with self.assertNumQueries(0):
+            response = self.client.post('/post-1/', {'body': 'Spam'})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(response['Retry-After'].isdigit())
+        self.assertEqual(Comment.objects.count(), 2)
+
+        self.client.force_login(User.objects.create_user(
+            'staff', 'staff@example.com', is_staff=True))
+        stats = self.client.get('/stats/ratelimit/').json()
+        self.assertEqual(stats['comment'], {
+            'allowed': 2, 'throttled': 1, 'throttled_by': {'user': 1}})
+
+    def test_likes_are_limited_per_post(self):
+        for _ in range(2):
+            self.client.post('/api/like/post-1')
+        response = self.client.post('/api/like/post-1')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {'error': 'too many requests'})
+        # The detail page's script shows the wait to the reader.
+        self.assertTrue(response['Retry-After'].isdigit())
+        self.assertEqual(self.client.post('/api/like/post-2').status_code, 200)
+
+    def test_window_slides(self):
+        request = RequestFactory().post('/like/post-1')
+        request.user = AnonymousUser()
+        limited = [ratelimit.hit('comment', request, {}, now=now)
+                   for now in (0, 1, 2)]
+        self.assertEqual(limited, [None, None, 58])
+        # A third of the previous window still counts: 3 / 3 + 1.
+        self.assertIsNone(ratelimit.hit('comment', request, {}, now=100))
+
+    @override_settings(FIRMSITE_PROXY_COUNT=1)
+    def test_client_ip_behind_proxy(self):
+        request = RequestFactory().post(
+            '/', HTTP_X_FORWARDED_FOR='6.6.6.6, 10.1.1.1',
+            REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(ratelimit.client_ip(request), '10.1.1.1')
+
+
+class SearchTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(
+            title="Tenancy disputes", slug="tenancy", author=self.author,
+            content="<p>What landlords must disclose.</p>", status=1)
+        self.create_post(2)
+
+    def search(self, query):
+        response = self.client.get(reverse('post_search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [post.slug for post in response.context['post_list']]
+
+    def test_matches_title_and_body(self):
+        self.assertEqual(self.search('tenancy'), ['tenancy'])
+        self.assertEqual(self.search('LANDLORDS disclose'), ['tenancy'])
+        self.assertEqual(self.search('tenancy "OR'), [])
+
+    def test_drafts_are_not_found(self):
+        Post.objects.create(
+            title="Draft tenancy notes", slug="draft", author=self.author,
+            content="<p>Unpublished.</p>", status=0)
+        self.assertEqual(self.search('tenancy'), ['tenancy'])
+        ids = SearchResults('tenancy', published_only=False).ids(10)
+        self.assertEqual(len(ids), 2)
+
+    def test_only_approved_comments_are_indexed(self):
+        comment = Comment.objects.create(
+            post=self.post, name='reader', email='reader@example.com',
+            body='Thanks for explaining deposits')
+        self.assertEqual(self.search('deposits'), [])
+        moderation.moderate(
+            Comment.objects.filter(pk=comment.pk), moderation.APPROVE)
+        self.assertEqual(self.search('deposits'), ['tenancy'])
+
+    def test_rebuild_command(self):
+        SearchDocument.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('tenancy'), ['tenancy'])
+
+    def test_failed_reindex_keeps_the_old_documents(self):
+        with mock.patch.object(SearchDocument.objects, 'bulk_create',
+                               side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                search.update_documents([self.post.pk])
+        self.assertEqual(self.search('landlords'), ['tenancy'])
+
+
+class RenderedContentTests(FirmsiteTestCase):
+
+    def test_save_stores_sanitized_html_and_toc(self):
+        post = Post.objects.create(
+            title="Leases", slug="leases", author=self.author, status=1,
+            content=(
+                '<h2>Notice</h2><p onclick="x()">Give   notice.</p>'
+                '<script>alert(1)</script><h2>Notice</h2>'
+                '<a href="javascript:x()">link</a>'))
+        self.assertEqual(post.content_html, (
+            '<h2 id="notice">Notice</h2><p>Give notice.</p>'
+            '<h2 id="notice-2">Notice</h2><a>link</a>'))
+        self.assertEqual(
+            [heading['id'] for heading in post.toc], ['notice', 'notice-2'])
+        self.assertEqual(post.summary, "Notice Give notice. Notice link")
+        self.assertEqual((post.word_count, post.reading_time), (5, 1))
+
+        response = self.client.get(reverse('post_detail', args=['leases']))
+        self.assertContains(response, '<a href="#notice-2">Notice</a>')
+        self.assertNotContains(response, 'alert(1)')
+
+    def test_unsafe_only_bodies_render_nothing_executable(self):
+        Post.objects.create(
+            title="Script", slug="script", author=self.author, status=1,
+            content='<script>alert(1)</script>')
+        Post.objects.create(
+            title="Frame", slug="frame", author=self.author, status=1,
+            content='<iframe src="javascript:alert(2)"></iframe>')
+        # Also as rows from before content_html was stored.
+        Post.objects.filter(slug='frame').update(content_html='')
+        for slug in ('script', 'frame'):
+            response = self.client.get(reverse('post_detail', args=[slug]))
+            self.assertEqual(response.status_code, 200)
+            self.assertNotContains(response, 'alert(')
+            self.assertNotContains(response, '<iframe')
+
+    def test_excerpt_is_the_summary(self):
+        post = self.create_post(1)
+        post.excerpt = "Short"
+        post.save(update_fields=['excerpt'])
+        post.refresh_from_db()
+        self.assertEqual(post.summary, "Short")
+
+    def test_render_command_backfills(self):
+        post = self.create_post(1)
+        Post.objects.update(content_html='', summary='', reading_time=0)
+        call_command('render_post_content', '--missing', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.content_html, '<p>Content 1</p>')
+        self.assertEqual(post.reading_time, 1)
+
+
+class TransferTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(
+            title="Wills, trusts", slug="wills", author=self.author,
+            content="<h2>Probate</h2><p>Dying intestate.</p>", status=1)
+        self.post.likes.add(self.reader)
+        Comment.objects.create(
+            post=self.post, name='reader', email='reader@example.com',
+            body='Multi\nline, "quoted"', approved=True)
+
+    def export(self, model, fmt):
+        path = os.path.join(self.tmp, f'{model}.{fmt}')
+        call_command('export_blog', model, '--format', fmt, '-o', path)
+        return path
+
+    def test_round_trip(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        for fmt in ('csv', 'jsonl'):
+            posts = self.export('posts', fmt)
+            comments = self.export('comments', fmt)
+            Post.objects.all().delete()
+            out = StringIO()
+            call_command('import_blog', 'posts', posts, stdout=out)
+            call_command('import_blog', 'comments', comments, stdout=out)
+            self.assertIn('Imported 1 comments', out.getvalue())
+
+            post = Post.objects.get(slug='wills')
+            self.assertEqual(post.toc[0]['id'], 'probate')
+            self.assertEqual(list(post.likes.all()), [self.reader])
+            self.assertEqual(
+                (post.like_count, post.approved_comment_count), (1, 1))
+            self.assertEqual(post.comments.get().body,
+                             'Multi\nline, "quoted"')
+            self.assertEqual(
+                SearchResults('intestate').ids(10), [post.pk])
+
+            # Importing again finds every row already there.
+            call_command('import_blog', 'posts', posts, stdout=out)
+            call_command('import_blog', 'comments', comments, stdout=out)
+            self.assertEqual(Comment.objects.count(), 1)
+
+    def test_scheduled_posts_keep_their_time(self):
+        publish_at = timezone.now() + timedelta(days=1)
+        Post.objects.create(
+            title="Later", slug="later", author=self.author,
+            content="<p>Later</p>", status=SCHEDULED, publish_at=publish_at)
+        for fmt in ('csv', 'jsonl'):
+            lines = ''.join(transfer.export(Post, fmt=fmt)).splitlines(True)
+            Post.objects.all().delete()
+            result = transfer.import_posts(transfer.read_rows(lines, fmt))
+            self.assertEqual((result.created, result.errors), (2, []))
+            self.assertEqual(
+                Post.objects.get(slug='later').publish_at, publish_at)
+            self.assertIsNone(Post.objects.get(slug='wills').publish_at)
+
+        rows = [{'slug': 'undated', 'title': "Undated", 'author': 'author',
+                 'content': '<p>x</p>', 'status': SCHEDULED}]
+        result = transfer.import_posts(rows)
+        self.assertEqual(result.created, 0)
+        self.assertIn('publish_at', result.errors[0][1])
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        rows = [
+            {'post': 'wills', 'name': 'a', 'email': 'not-an-email',
+             'body': 'x'},
+            {'post': 'missing', 'name': 'b', 'email': 'b@example.com',
+             'body': 'y'},
+            {'post': 'wills', 'name': 'c', 'email': 'c@example.com',
+             'body': 'z', 'approved': 'True'},
+        ]
+        result = transfer.import_comments(rows)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _ in result.errors], [1, 2])
+        self.assertIn('email', result.errors[0][1])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 2)
+
+    def test_export_to_stdout(self):
+        out = StringIO()
+        call_command('export_blog', 'comments', '--format', 'jsonl',
+                     stdout=out)
+        rows = list(transfer.read_rows(out.getvalue().splitlines(), 'jsonl'))
+        self.assertEqual([row['body'] for row in rows],
+                         ['Multi\nline, "quoted"'])
+
+    def test_admin_action_streams(self):
+        admin_user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin_user)
+        response = self.client.post('/admin/firmsite/comment/', {
+            'action': 'export_csv',
+            '_selected_action': list(
+                Comment.objects.values_list('pk', flat=True)),
+        })
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('post,name,email,body'))
+        self.assertIn('"Multi\nline, ""quoted"""', body)
+
+
+class StaticPipelineTests(FirmsiteTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        source = tempfile.mkdtemp()
+        root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, source)
+        cls.addClassCleanup(shutil.rmtree, root)
+        rule = '.rule{margin:0 auto;padding:1rem}' * 50
+        files = {
+            'vendor/bootstrap/bootstrap.min.css': '@charset "UTF-8";' + rule,
+            'vendor/bootstrap/bootstrap.bundle.min.js': 'var b=1;' * 200,
+            'vendor/fontawesome/css/all.min.css':
+                '@font-face{src:url(../webfonts/fa.woff2)}' + rule,
+            'vendor/fontawesome/webfonts/fa.woff2': 'font',
+            'vendor/fonts/fonts.css': rule,
+            'css/style.css': rule,
+        }
+        for name, content in files.items():
+            path = os.path.join(source, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as file:
+                file.write(content)
+        settings_override = override_settings(
+            STATICFILES_DIRS=[source], STATIC_ROOT=root,
+            STATICFILES_STORAGE='firmsite.assets.CompressedManifestStorage',
+            FIRMSITE_STATIC_PIPELINE=True)
+        settings_override.enable()
+        cls.addClassCleanup(settings_override.disable)
+        with mock.patch.object(assets, 'BROTLI_QUALITY', 1):
+            call_command('build_static', stdout=StringIO())
+
+    def test_bundles_are_fingerprinted_and_precompressed(self):
+        url = staticfiles_storage.url('bundles/site.css')
+        self.assertRegex(url, r'^/static/bundles/site\.[0-9a-f]{12}\.css$')
+        path = staticfiles_storage.path(
+            staticfiles_storage.stored_name('bundles/site.css'))
+        self.assertTrue(os.path.exists(path + '.gz'))
+        with open(path) as file:
+            css = file.read()
+        self.assertEqual(css.count('@charset'), 1)
+        # Rebased from vendor/fontawesome/css/ and then fingerprinted.
+        self.assertRegex(
+            css, r'url\("../vendor/fontawesome/webfonts/fa\.[0-9a-f]{12}'
+                 r'\.woff2"\)')
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)).decode(),
+            css)
+        response = self.client.get(url)
+        self.assertNotIn('Content-Encoding', response)
+        if assets.brotli is not None:
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response['Content-Encoding'], 'br')
+
+    def test_base_template_links_bundles_only(self):
+        self.create_post(1)
+        response = self.client.get('/')
+        self.assertContains(
+            response, staticfiles_storage.url('bundles/site.js'))
+        self.assertNotContains(response, 'cdn.jsdelivr.net')
+
+    def test_middleware_serves_async_requests(self):
+        async def view(request):
+            return HttpResponse('view')
+
+        middleware = assets.StaticFilesMiddleware(view)
+        url = staticfiles_storage.url('bundles/site.js')
+        factory = RequestFactory()
+        response = async_to_sync(middleware)(factory.get(url))
+        self.assertIn('immutable', response['Cache-Control'])
+        response = async_to_sync(middleware)(factory.get('/'))
+        self.assertEqual(response.content, b'view')
+
+    def test_downloads_must_match_the_lock(self):
+        lock_file = os.path.join(tempfile.mkdtemp(), 'vendor.lock.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(lock_file))
+        url = 'https://cdn.example/app.js'
+
+        def fetch(data):
+            response = mock.MagicMock()
+            response.__enter__.return_value.read.return_value = data
+            return mock.patch('urllib.request.urlopen', return_value=response)
+
+        with mock.patch.object(assets, 'LOCK_FILE', lock_file):
+            lock = assets.read_lock()
+            with fetch(b'v1'), self.assertRaisesRegex(ValueError, 'pinned'):
+                assets._fetch(url, lock)
+            with fetch(b'v1'):
+                self.assertEqual(assets._fetch(url, lock, pin=True), b'v1')
+            assets.write_lock(lock)
+            lock = assets.read_lock()
+            self.assertEqual(lock, {url: assets.integrity(b'v1')})
+            with fetch(b'v1'):
+                assets._fetch(url, lock)
+            # A changed file is refused even when pinning.
+            with fetch(b'v2'), self.assertRaisesRegex(ValueError, 'match'):
+                assets._fetch(url, lock, pin=True)
+
+    def test_vendored_css_points_at_local_fonts(self):
+        css, files = assets._localize(
+            'vendor/fonts/fonts.css', 'https://fonts.example/css2',
+            '@font-face{src:url(https://fonts.example/s/lato/v1/a.woff2)}'
+            '.fa{src:url(../webfonts/fa.woff2?v=1)}')
+        self.assertEqual(
+            css, '@font-face{src:url(a.woff2)}'
+                 '.fa{src:url(../webfonts/fa.woff2?v=1)}')
+        self.assertEqual(files, {
+            'vendor/fonts/a.woff2': 'https://fonts.example/s/lato/v1/a.woff2',
+            'vendor/webfonts/fa.woff2':
+                'https://fonts.example/webfonts/fa.woff2?v=1',
+        })
+
+
+class ImageTests(FirmsiteTestCase):
+
+    def test_cloudinary_srcset(self):
+        post = self.create_post(1)
+        post.featured_image = 'image/upload/v1/firm/office.jpg'
+        post.save()
+        response = self.client.get(reverse('home'))
+        self.assertContains(
+            response, 'c_limit,q_auto,w_320/v1/firm/office.jpg 320w')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(
+            response, 'sizes="(min-width: 768px) 33vw, 100vw"')
+
+    def test_placeholder_has_no_variants(self):
+        self.create_post(1)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, images.DEFAULT_IMAGE)
+        self.assertNotContains(response, 'srcset')
+
+    @unittest.skipIf(images.Image is None, "Pillow is not installed")
+    def test_local_backend_builds_derivatives(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with override_settings(FIRMSITE_IMAGE_BACKEND='local',
+                               FIRMSITE_IMAGE_ROOT=root):
+            backend = images.get_backend()
+            source = backend.storage.path('originals/office.png')
+            os.makedirs(os.path.dirname(source))
+            images.Image.new('RGBA', (800, 400)).save(source)
+            post = self.create_post(1)
+            Post.objects.filter(pk=post.pk).update(
+                featured_image='image/upload/v1/office.png')
+
+            call_command('build_image_derivatives', stdout=StringIO())
+            small = images.Image.open(
+                backend.storage.path('derivatives/office-320w.jpg'))
+            self.assertEqual(small.size, (320, 160))
+            # Never upscaled past the original's width.
+            large = images.Image.open(
+                backend.storage.path('derivatives/office-1280w.jpg'))
+            self.assertEqual(large.size, (800, 400))
+
+            response = self.client.get(
+                reverse('post_detail', args=['post-1']))
+            self.assertContains(
+                response, '/media/derivatives/office-960w.jpg 960w')
+
+
+# As with a shared CACHE_BACKEND, which turns the user cache on.
+@override_settings(FIRMSITE_PAGE_CACHE=False, FIRMSITE_USER_CACHE_TIMEOUT=60)
+class SessionTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_post(1)
+
+    def test_anonymous_readers_get_no_session(self):
+        for url in ('/', '/post-1/'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+            self.assertFalse(any(
+                'django_session' in query['sql'] for query in queries))
+
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_in_user_is_cached(self):
+        self.client.force_login(self.reader)
+        self.client.get('/')
+        cached = get_cache().get(auth.USER_KEY.format(self.reader.pk))
+        self.assertEqual(set(cached), {'pk', 'session_hash'})
+        # No session and no password check: the page of posts, and the
+        # user's row for the name in the header.
+        with self.assertNumQueries(2):
+            response = self.client.get('/')
+        self.assertEqual(response.context['user'], self.reader)
+        # The user row is only read when more than the pk is needed.
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/like/post-1')
+        self.assertFalse(any(
+            'FROM "auth_user"' in query['sql'] for query in queries))
+        self.assertTrue(Post.objects.get(slug='post-1').likes.filter(
+            pk=self.reader.pk).exists())
+
+        self.reader.first_name = 'Renamed'
+        self.reader.save()
+        response = self.client.get('/')
+        self.assertEqual(response.context['user'].first_name, 'Renamed')
+
+    def test_password_change_still_logs_out(self):
+        self.client.force_login(self.reader)
+        self.client.get('/')
+        User.objects.filter(pk=self.reader.pk).update(password='changed')
+        response = self.client.get('/')
+        # Served from the cache, whose hash still matches the session.
+        self.assertTrue(response.context['user'].is_authenticated)
+        auth.forget_user(self.reader.pk)
+        response = self.client.get('/')
+        self.assertFalse(response.context['user'].is_authenticated)
+
+
+@override_settings(FIRMSITE_PAGE_CACHE=False)
+class ConditionalGetTests(FirmsiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post = self.create_post(1)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_anonymous_revalidation_costs_one_query(self):
+        for url in ('/', '/post-1/'):
+            response = self.client.get(url)
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('Cookie', response['Vary'])
+            with self.assertNumQueries(1):
+                revalidated = self.revalidate(url, response['ETag'])
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_likes_and_comments_change_the_etag(self):
+        etags = {
+            url: self.client.get(url)['ETag'] for url in ('/', '/post-1/')}
+        self.post.likes.add(self.reader)
+        for url, etag in etags.items():
+            self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+        etag = self.client.get('/post-1/')['ETag']
+        Comment.objects.create(
+            post=self.post, name='reader', email='reader@example.com',
+            body='Hi', approved=True)
+        self.assertEqual(self.revalidate('/post-1/', etag).status_code, 200)
+
+    def test_signed_in_pages_are_private(self):
+        anonymous = self.client.get('/post-1/')['ETag']
+        self.client.force_login(self.reader)
+        response = self.client.get('/post-1/')
+        self.assertNotEqual(response['ETag'], anonymous)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(
+            self.revalidate('/post-1/', response['ETag']).status_code, 304)
+        self.client.post('/like/post-1')
+        self.assertEqual(
+            self.revalidate('/post-1/', response['ETag']).status_code, 200)
+
+    def test_pending_messages_skip_validators(self):
+        self.client.cookies['messages'] = 'pending'
+        self.assertFalse(self.client.get('/').has_header('ETag'))
+
+    @override_settings(FIRMSITE_PAGE_CACHE=True)
+    def test_cached_pages_revalidate_without_queries(self):
+        etag = self.client.get('/')['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate('/', etag).status_code, 304)
+
+
+class LoadTestTests(TransactionTestCase):
+    # Virtual users run on pool threads, like AsyncViewTests.
+    databases = '__all__'
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_percentiles(self):
+        timings = list(range(1, 101))
+        self.assertEqual(
+            [percentile(timings, p) for p in (50, 95, 99, 100)],
+            [50, 95, 99, 100])
+
+    def test_command_runs_every_scenario_in_process(self):
+        call_command('seed_data', '--users=2', '--posts=10', '--comments=20',
+                     '--likes=10', '--noinput', stdout=StringIO())
+        out = StringIO()
+        # One worker: the in-memory SQLite test database fails concurrent
+        # writers with "table is locked" instead of making them wait.
+        call_command('loadtest', '--iterations=20', '--workers=1',
+                     stdout=out)
+        report = out.getvalue()
+        for name in ('home', 'post_detail', 'comment', 'like', 'total'):
+            self.assertIn(f'{name} ', report)
+        self.assertIn('queries/req', report)
+        self.assertNotIn('error', report)
+
+    def test_remote_run_resets_passwords_only_when_asked(self):
+        call_command('seed_data', '--users=1', '--posts=1', '--comments=0',
+                     '--likes=0', '--noinput', stdout=StringIO())
+        user = User.objects.get(username__startswith='seed-')
+        options = ['--url=http://server.invalid', '--password=pw',
+                   '--mix=like', '--workers=1', '--iterations=1']
+        # The server turns the login down.
+        with mock.patch.object(loadtest.HTTPClient, 'send',
+                               return_value=(200, '', '')):
+            with self.assertRaisesRegex(CommandError, '--reset-passwords'):
+                call_command('loadtest', *options, stdout=StringIO())
+            user.refresh_from_db()
+            self.assertFalse(user.check_password('pw'))
+
+            with self.assertRaises(CommandError):
+                call_command('loadtest', *options, '--reset-passwords',
+                             stdout=StringIO())
+            user.refresh_from_db()
+            self.assertTrue(user.check_password('pw'))
+
+
+@override_settings(
+    ROOT_URLCONF='firmsite.tests',
+    FIRMSITE_PROFILING=True,
+    FIRMSITE_PAGE_CACHE=False,
+)
+class AsyncViewTests(TransactionTestCase):
+    # The async views query from pool threads, which only see committed
+    # rows, hence TransactionTestCase.
+    databases = '__all__'
+
+    def setUp(self):
+        get_cache().clear()
+        author = User.objects.create_user('author', 'author@example.com')
+        self.reader = User.objects.create_user('reader', 'reader@example.com')
+        Post.objects.create(
+            title="Post 1", slug="post-1", author=author,
+            content="<p>Content 1</p>", status=1)
+        self.async_client.force_login(self.reader)
+
+    async def test_detail_runs_queries_off_the_event_loop(self):
+        response = await self.async_client.get('/async/post-1/')
+        self.assertContains(response, 'Leave a comment')
+        self.assertNotIn('"0 queries"', response['Server-Timing'])
+
+    async def test_like_api(self):
+        response = await self.async_client.post('/async/api/like/post-1')
+        self.assertEqual(response.json(), {'liked': True, 'like_count': 1})
+
+
+class DatabaseRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.router = ReplicaRouter()
+
+    def test_firmsite_reads_go_to_the_replica(self):
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'firmsite'))
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_writers_stick_to_the_primary(self):
+        routed = []
+
+        def view(request):
+            routed.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        with mock.patch.dict(settings.DATABASES, {'replica': {}}):
+            middleware = ReplicaStickinessMiddleware(view)
+        factory = RequestFactory()
+        response = middleware(factory.post('/'))
+        middleware(factory.get('/'))
+        follow_up = factory.get('/')
+        follow_up.COOKIES[STICKY_COOKIE] = '1'
+        middleware(follow_up)
+        self.assertEqual(routed, ['default', 'replica', 'default'])
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], 10)
+
+        # Other clients keep reading from the replica after a change.
+        invalidate('posts')
+        middleware(factory.get('/'))
+        self.assertEqual(routed[-1], 'replica')
+
+    def test_shared_cache_entries_are_built_from_the_primary(self):
+        def build():
+            return self.router.db_for_read(Post)
+
+        self.assertEqual(get_or_build('firmsite:test', build), 'default')
+
+    def test_health_check_drops_dead_connections(self):
+        db = connections['default']
+        with mock.patch.object(db, 'connection', object()), \
+                mock.patch.object(db, 'firmsite_idle_since', None,
+                                  create=True), \
+                mock.patch.object(db, 'is_usable', return_value=False), \
+                mock.patch.object(db, 'close') as close:
+            check_connections()
+        close.assert_called_once_with()
+
+    def test_health_check_skips_recently_used_connections(self):
+        db = connections['default']
+        with mock.patch.object(db, 'connection', object()), \
+                mock.patch.object(db, 'firmsite_idle_since', None,
+                                  create=True), \
+                mock.patch.object(db, 'is_usable') as is_usable:
+            mark_connections_idle()
+            check_connections()
+            is_usable.assert_not_called()
+            db.firmsite_idle_since -= 31
+            check_connections()
+            is_usable.assert_called_once_with()
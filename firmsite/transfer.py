@@ -0,0 +1,301 @@
+"""
+Bulk export and import of posts (with their likes) and comments.
+
+Exports read the rows in primary-key chunks and yield one string per
+chunk of CSV or JSON Lines, so a ``StreamingHttpResponse`` or a file
+receives millions of rows in constant memory. Imports validate each row
+with ``clean_fields()`` and ``bulk_create`` one batch per transaction;
+invalid rows and rows already present are skipped and reported.
+Posts are matched by slug and title, authors and likers by username and
+comments by post, email and ``created_on``.
+"""
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import cache as page_cache
+from . import content as post_content
+from . import feeds
+from . import search
+from .models import Post, Comment
+
+
+CHUNK_SIZE = 2000
+POST_BATCH_SIZE = 100
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+POST_COLUMNS = (
+    'slug', 'title', 'author', 'featured_image', 'excerpt', 'content',
+    'status', 'publish_at', 'created_on', 'likes')
+COMMENT_COLUMNS = (
+    'post', 'name', 'email', 'body', 'created_on', 'approved', 'rejected')
+
+PostLikes = Post.likes.through
+
+
+def _chunks(queryset, size):
+    """``values()`` rows of ``queryset`` in pk order, ``size`` at a time."""
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(
+            pk__gt=last_pk)
+        chunk = list(page[:size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1]['pk']
+
+
+def post_chunks(queryset, size=CHUNK_SIZE):
+    image = Post._meta.get_field('featured_image')
+    rows = queryset.values(
+        'pk', 'slug', 'title', 'author__username', 'featured_image',
+        'excerpt', 'content', 'status', 'publish_at', 'created_on')
+    for chunk in _chunks(rows, size):
+        likes = defaultdict(list)
+        likers = PostLikes.objects.filter(
+            post_id__in=[row['pk'] for row in chunk]
+        ).order_by('pk').values_list('post_id', 'user__username')
+        for post_id, username in likers:
+            likes[post_id].append(username)
+        yield [{
+            'slug': row['slug'],
+            'title': row['title'],
+            'author': row['author__username'],
+            'featured_image': image.get_prep_value(row['featured_image']),
+            'excerpt': row['excerpt'],
+            'content': row['content'],
+            'status': row['status'],
+            'publish_at': row['publish_at'] and row['publish_at'].isoformat(),
+            'created_on': row['created_on'].isoformat(),
+            'likes': likes[row['pk']],
+        } for row in chunk]
+
+
+def comment_chunks(queryset, size=CHUNK_SIZE):
+    rows = queryset.values(
+        'pk', 'post__slug', 'name', 'email', 'body', 'created_on',
+        'approved', 'rejected')
+    for chunk in _chunks(rows, size):
+        yield [{
+            'post': row['post__slug'],
+            'name': row['name'],
+            'email': row['email'],
+            'body': row['body'],
+            'created_on': row['created_on'].isoformat(),
+            'approved': row['approved'],
+            'rejected': row['rejected'],
+        } for row in chunk]
+
+
+class _Echo:
+    """A file for ``csv.writer`` that hands back what is written."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    return ' '.join(value) if isinstance(value, list) else value
+
+
+def export(model, queryset=None, fmt='csv', size=CHUNK_SIZE):
+    """Yield ``queryset`` (every row by default) as CSV or JSON Lines."""
+    if model is Post:
+        columns, chunks = POST_COLUMNS, post_chunks
+    else:
+        columns, chunks = COMMENT_COLUMNS, comment_chunks
+    if queryset is None:
+        queryset = model._default_manager.all()
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for chunk in chunks(queryset, size):
+            yield ''.join(
+                writer.writerow([_csv_value(row[name]) for name in columns])
+                for row in chunk)
+    else:
+        for chunk in chunks(queryset, size):
+            yield ''.join(json.dumps(row) + '\n' for row in chunk)
+
+
+def read_rows(lines, fmt):
+    """Parse the lines of an export back into dicts."""
+    if fmt == 'csv':
+        # Post bodies easily exceed the default field limit of 128 KB.
+        csv.field_size_limit(2 ** 31 - 1)
+        yield from csv.DictReader(lines)
+    else:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+
+def _invalid(error):
+    if hasattr(error, 'message_dict'):
+        return '; '.join(
+            f"{field}: {' '.join(messages)}"
+            for field, messages in error.message_dict.items())
+    return ' '.join(error.messages)
+
+
+def _batches(rows, size):
+    rows = enumerate(rows, start=1)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _build(model, line, row, fields, result, parent, parent_id):
+    """
+    An unsaved, validated ``model`` from ``row``, or None. The ``parent``
+    foreign key was resolved in bulk and is not validated again.
+    """
+    obj = model(**{f'{parent}_id': parent_id})
+    for name in fields:
+        if row.get(name) not in (None, ''):
+            setattr(obj, name, row[name])
+    try:
+        obj.clean_fields(exclude=[parent])
+        obj.clean()
+    except ValidationError as error:
+        result.error(line, _invalid(error))
+        return None
+    return obj
+
+
+def import_posts(rows, size=CHUNK_SIZE):
+    result = ImportResult()
+    fields = ('slug', 'title', 'featured_image', 'excerpt', 'content',
+              'status', 'publish_at', 'created_on')
+    for batch in _batches(rows, size):
+        usernames = {row.get('author') for _, row in batch}
+        likers = {
+            name for _, row in batch for name in _likers(row.get('likes'))}
+        users = dict(User.objects.filter(
+            username__in=usernames | likers).values_list('username', 'pk'))
+        slugs = {row.get('slug') for _, row in batch}
+        titles = {row.get('title') for _, row in batch}
+        taken_slugs = set(Post.objects.filter(slug__in=slugs).values_list(
+            'slug', flat=True))
+        taken_titles = set(Post.objects.filter(
+            title__in=titles).values_list('title', flat=True))
+
+        posts, likes = [], {}
+        for line, row in batch:
+            author = row.get('author')
+            if author not in users:
+                result.error(line, f"author: unknown user {author!r}")
+                continue
+            post = _build(
+                Post, line, row, fields, result, 'author', users[author])
+            if post is None:
+                continue
+            if post.slug in taken_slugs or post.title in taken_titles:
+                result.skipped += 1
+                continue
+            taken_slugs.add(post.slug)
+            taken_titles.add(post.title)
+            # bulk_create skips Post.save(), which renders the content.
+            post_content.apply(post)
+            posts.append(post)
+            likes[post.slug] = [
+                users[name] for name in _likers(row.get('likes'))
+                if name in users]
+
+        with transaction.atomic():
+            Post.objects.bulk_create(posts)
+            ids = dict(Post.objects.filter(slug__in=likes).values_list(
+                'slug', 'pk'))
+            PostLikes.objects.bulk_create([
+                PostLikes(post_id=ids[slug], user_id=user_id)
+                for slug, user_ids in likes.items() for user_id in user_ids
+            ], ignore_conflicts=True)
+            Post.objects.filter(pk__in=ids.values()).refresh_counters()
+            search.update_documents(ids.values())
+        result.created += len(posts)
+    page_cache.invalidate(page_cache.POSTS)
+    feeds.posts_changed()
+    return result
+
+
+def _likers(value):
+    if not value:
+        return []
+    return value.split() if isinstance(value, str) else value
+
+
+def import_comments(rows, size=CHUNK_SIZE, skip_existing=True):
+    """
+    By default each batch looks up the comments its posts already store
+    so that re-running an import does not duplicate them.
+    ``skip_existing=False`` skips that lookup, at the risk of duplicates.
+    """
+    result = ImportResult()
+    fields = ('name', 'email', 'body', 'created_on', 'approved', 'rejected')
+    approved = set()
+    for batch in _batches(rows, size):
+        posts = dict(Post.objects.filter(
+            slug__in={row.get('post') for _, row in batch}
+        ).values_list('slug', 'pk'))
+
+        comments = []
+        for line, row in batch:
+            if row.get('post') not in posts:
+                result.error(line, f"post: unknown slug {row.get('post')!r}")
+                continue
+            comment = _build(
+                Comment, line, row, fields, result, 'post', posts[row['post']])
+            if comment is not None:
+                comments.append(comment)
+
+        existing = set()
+        if skip_existing and comments:
+            existing = set(Comment.objects.filter(
+                post_id__in={comment.post_id for comment in comments},
+                created_on__in={comment.created_on for comment in comments},
+            ).order_by().values_list('post_id', 'email', 'created_on'))
+        new = []
+        for comment in comments:
+            key = (comment.post_id, comment.email, comment.created_on)
+            if key in existing:
+                result.skipped += 1
+                continue
+            existing.add(key)
+            new.append(comment)
+
+        with transaction.atomic():
+            Comment.objects.bulk_create(new)
+        approved.update(comment.post_id for comment in new if comment.approved)
+        result.created += len(new)
+
+    # Once per post rather than per batch: recounting grows with the
+    # comments a post already has.
+    approved = sorted(approved)
+    for start in range(0, len(approved), POST_BATCH_SIZE):
+        post_ids = approved[start:start + POST_BATCH_SIZE]
+        Post.objects.filter(pk__in=post_ids).refresh_counters(touch=True)
+        search.update_documents(post_ids)
+    page_cache.invalidate(page_cache.POSTS)
+    feeds.posts_changed()
+    return result
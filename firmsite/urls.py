@@ -1,8 +1,32 @@
 from . import views
+from django.conf import settings
 from django.urls import path
 
+
+def blog_patterns(blog_views):
+    """The reader-facing routes, served by ``views`` or ``async_views``."""
+    return [
+        path('', blog_views.PostList.as_view(), name='home'),
+        path('<slug:slug>/', blog_views.PostDetail.as_view(),
+             name='post_detail'),
+        path('<slug:slug>/comments/', blog_views.PostComments.as_view(),
+             name='post_comments'),
+        path('like/<slug:slug>', blog_views.PostLike.as_view(),
+             name='post_like'),
+        path('api/like/<slug:slug>', blog_views.PostLikeAPI.as_view(),
+             name='post_like_api'),
+    ]
+
+
+if getattr(settings, 'FIRMSITE_ASYNC_VIEWS', False):
+    from . import async_views as blog_views
+else:
+    blog_views = views
+
 urlpatterns = [
-    path('', views.PostList.as_view(), name='home'),
-    path('<slug:slug>/', views.PostDetail.as_view(), name='post_detail'),
-    path('like/<slug:slug>', views.PostLike.as_view(), name='post_like'),
-]
\ No newline at end of file
+    path('search/', views.PostSearch.as_view(), name='post_search'),
+    path('stats/profiling/', views.ProfilingStats.as_view(),
+         name='profiling_stats'),
+    path('stats/ratelimit/', views.RateLimitStats.as_view(),
+         name='ratelimit_stats'),
+] + blog_patterns(blog_views)
@@ -1,48 +1,134 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, reverse
 from django.views import generic, View
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
 from .models import Post
 from .forms import CommentForm
+from . import cache as page_cache
+from . import feeds
+from . import popularity
+from . import profiling
+from . import ratelimit
+from .pagination import InvalidCursor, KeysetPaginationMixin, KeysetPaginator
+from .search import SearchResults
 
 
-class PostList(generic.ListView):
+class PostList(page_cache.CachedPageMixin, page_cache.ConditionalGetMixin,
+               KeysetPaginationMixin, generic.ListView):
     model = Post
-    queryset = Post.objects.filter(status=1).order_by("-created_on")
+    queryset = Post.objects.filter(status=1).for_cards().order_by(
+        "-created_on")
     template_name = "index.html"
     paginate_by = 6
+    cache_scopes = (page_cache.POSTS, page_cache.LIST)
 
+    def use_keyset(self):
+        mode = getattr(settings, "FIRMSITE_FEED_PAGINATION", "keyset")
+        return mode == "keyset"
 
-class PostDetail(View):
+    def page_state(self, page):
+        rows = tuple((post.pk, post.updated_on, post.like_count)
+                     for post in page)
+        return (rows, page.has_next(), page.has_previous(),
+                page_cache.version(page_cache.POPULAR))
 
-    def get(self, request, slug, *args, **kwargs):
-        queryset = Post.objects.filter(status=1)
-        post = get_object_or_404(queryset, slug=slug)
-        comments = post.comments.filter(approved=True).order_by("-created_on")
-        liked = False
-        if post.likes.filter(id=self.request.user.id).exists():
-            liked = True
-
-        return render(
-            request,
-            "post_detail.html",
-            {
-                "post": post,
-                "comments": comments,
-                "commented": False,
-                "liked": liked,
-                "comment_form": CommentForm()
-            },
-        )
-    
-    def post(self, request, slug, *args, **kwargs):
+    def get_etag_state(self):
+        queryset = self.get_queryset().select_related(None).only(
+            "id", "created_on", "updated_on", "like_count")
+        try:
+            page = self.paginate_queryset(queryset, self.paginate_by)[1]
+        except Http404:
+            return None
+        return self.page_state(page)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page_cache"] = page_cache.fragment_context(
+            *self.cache_scopes)
+        # Only queried when the popular posts fragment is not cached, which
+        # likes do not invalidate; re-ranking does.
+        context["popular_posts"] = SimpleLazyObject(popularity.popular_posts)
+        context["popular_cache"] = page_cache.fragment_context(
+            page_cache.POSTS, page_cache.POPULAR)
+        self.etag_state = self.page_state(context["page_obj"])
+        return context
+
+
+class CommentPageMixin:
+    """Approved comments of a post in keyset pages, newest first."""
+
+    comments_paginate_by = 10
+
+    def get_comment_page(self, post, cursor=None):
+        paginator = KeysetPaginator(
+            post.approved_comments(), self.comments_paginate_by)
+        try:
+            return paginator.page(cursor)
+        except InvalidCursor:
+            raise Http404("Invalid cursor")
+
+
+class PostDetail(ratelimit.RateLimitMixin, page_cache.CachedPageMixin,
+                 page_cache.ConditionalGetMixin, CommentPageMixin, View):
+    rate_limit = "comment"
+
+    def get_cache_scopes(self):
+        return (page_cache.POSTS, page_cache.post_scope(self.kwargs["slug"]),
+                page_cache.RELATED)
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        # Counted here so cached pages and 304s count too, but not the
+        # renders of firmsite/publishing.py warming the cache.
+        if (request.method == "GET" and response.status_code in (200, 304)
+                and not getattr(request, "cache_warming", False)):
+            popularity.record_view(request, kwargs["slug"])
+        return response
+
+    def get_post(self, slug):
+        queryset = Post.objects.for_detail(self.request.user)
+        return get_object_or_404(queryset, slug=slug)
+
+    def get_etag_state(self):
+        # updated_on moves with the post and its approved comments.
+        posts = Post.objects.for_detail(self.request.user).filter(
+            slug=self.kwargs["slug"])
+        state = posts.values_list(
+            "pk", "updated_on", "like_count", "approved_comment_count",
+            "liked").first()
+        return state and (*state, page_cache.version(page_cache.RELATED))
+
+    def get_detail_context(self, post, comment_form, commented):
+        return {
+            "post": post,
+            # Only queried when the comments fragment is not cached.
+            "comments": SimpleLazyObject(
+                lambda: self.get_comment_page(post)),
+            "related_posts": SimpleLazyObject(post.related_posts),
+            "commented": commented,
+            "liked": post.liked,
+            "comment_form": comment_form,
+            "page_cache": page_cache.fragment_context(
+                *self.get_cache_scopes()),
+        }
 
-        queryset = Post.objects.filter(status=1)
-        post = get_object_or_404(queryset, slug=slug)
-        comments = post.comments.filter(approved=True).order_by("-created_on")
-        liked = False
-        if post.likes.filter(id=self.request.user.id).exists():
-            liked = True
+    def render_detail(self, post, comment_form, commented):
+        return render(self.request, "post_detail.html",
+                      self.get_detail_context(post, comment_form, commented))
 
+    def get(self, request, slug, *args, **kwargs):
+        post = self.get_post(slug)
+        self.etag_state = (post.pk, post.updated_on, post.like_count,
+                           post.approved_comment_count, post.liked,
+                           page_cache.version(page_cache.RELATED))
+        return self.render_detail(post, CommentForm(), commented=False)
+
+    def post(self, request, slug, *args, **kwargs):
+        post = self.get_post(slug)
         comment_form = CommentForm(data=request.POST)
         if comment_form.is_valid():
             comment_form.instance.email = request.user.email
@@ -53,26 +139,103 @@ class PostDetail(View):
         else:
             comment_form = CommentForm()
 
-        return render(
-            request,
-            "post_detail.html",
-            {
-                "post": post,
-                "comments": comments,
-                "commented": True,
-                "comment_form": comment_form,
-                "liked": liked
-            },
-        )
-
-
-class PostLike(View):
-    
+        return self.render_detail(post, comment_form, commented=True)
+
+
+class PostComments(page_cache.CachedPageMixin, CommentPageMixin, View):
+    """Further pages of comments, as the fragment the detail page loads."""
+
+    def get_cache_scopes(self):
+        return (page_cache.POSTS, page_cache.post_scope(self.kwargs["slug"]))
+
+    def get(self, request, slug, *args, **kwargs):
+        post = get_object_or_404(
+            Post.objects.filter(status=1).only("pk", "slug"), slug=slug)
+        return render(request, "comment_list.html", {
+            "post": post,
+            "comments": self.get_comment_page(post, request.GET.get("cursor")),
+        })
+
+
+class PostSearch(generic.ListView):
+    template_name = "search.html"
+    context_object_name = "post_list"
+    paginate_by = 6
+
+    def get_query(self):
+        return self.request.GET.get("q", "").strip()[:200]
+
+    def get_queryset(self):
+        return SearchResults(self.get_query())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.get_query()
+        return context
+
+
+class PostLike(LoginRequiredMixin, ratelimit.RateLimitMixin, View):
+    rate_limit = "like"
+
+    def toggle(self, slug):
+        post = get_object_or_404(Post.objects.filter(status=1), slug=slug)
+        liked, like_count = post.toggle_like(self.request.user)
+        page_cache.invalidate_posts([post.slug], listed=True)
+        return liked, like_count
+
     def post(self, request, slug, *args, **kwargs):
-        post = get_object_or_404(Post, slug=slug)
-        if post.likes.filter(id=request.user.id).exists():
-            post.likes.remove(request.user)
-        else:
-            post.likes.add(request.user)
+        self.toggle(slug)
+        return HttpResponseRedirect(reverse('post_detail', args=[slug]))
+
+
+class PostLikeAPI(PostLike):
+    """JSON variant of PostLike for in-place updates from the detail page."""
+
+    raise_exception = True
+
+    def handle_no_permission(self):
+        return JsonResponse({"error": "login required"}, status=403)
+
+    def rate_limited(self, request):
+        return JsonResponse({"error": "too many requests"}, status=429)
+
+    def post(self, request, slug, *args, **kwargs):
+        liked, like_count = self.toggle(slug)
+        return JsonResponse({"liked": liked, "like_count": like_count})
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ProfilingStats(View):
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(profiling.stats.snapshot())
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class RateLimitStats(View):
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(ratelimit.snapshot())
+
+
+class SitemapIndex(feeds.DocumentMixin, View):
+
+    def build_document(self, base):
+        return feeds.build_index(base)
+
+
+class SitemapSection(feeds.DocumentMixin, View):
+
+    def get_cache_scopes(self):
+        return (page_cache.SITEMAP,
+                page_cache.sitemap_scope(self.kwargs["section"]))
+
+    def build_document(self, base):
+        return feeds.build_section(base, self.kwargs["section"])
+
+
+class PostFeed(feeds.DocumentMixin, View):
+    feed_type = "rss"
 
-        return HttpResponseRedirect(reverse('post_detail', args=[slug]))
\ No newline at end of file
+    def build_document(self, base):
+        return feeds.build_feed(base, self.feed_type)
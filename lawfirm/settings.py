@@ -84,29 +84,46 @@ ACCOUNT_FORMS = {'signup': 'users.forms.CustomSignUpForm', 'login': 'users.forms
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 MIDDLEWARE = [
+    'firmsite.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'firmsite.assets.StaticFilesMiddleware',
+    'firmsite.routers.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'firmsite.auth.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'lawfirm.urls'
 
+# Templates are compiled once per process by the cached loader, and the
+# static page sections and the comment form rendered once (see
+# firmsite/prerender.py). Set TEMPLATE_CACHE=0 in development to see
+# template edits without a restart.
+FIRMSITE_TEMPLATE_CACHE = os.environ.get('TEMPLATE_CACHE', '1') == '1'
+template_loaders = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if FIRMSITE_TEMPLATE_CACHE:
+    template_loaders = [
+        ('django.template.loaders.cached.Loader', template_loaders)]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'firmsite.profiling.ProfiledDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': template_loaders,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.media',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'firmsite.assets.pipeline',
             ],
         },
     },
@@ -114,6 +131,34 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'lawfirm.wsgi.application'
 
+# Request profiling
+# Adds Server-Timing headers and per-URL stats (see firmsite/profiling.py).
+# Budgets are SQL queries per request by URL name; tests enforce them.
+
+FIRMSITE_PROFILING = os.environ.get('PROFILING', '0') == '1'
+FIRMSITE_QUERY_BUDGETS = {
+    # Session, user, posts and popular posts, plus the SELECT and DELETE
+    # with which Django drops a session its user's password change ended.
+    'home': 6,
+    'post_detail': 6,
+    'post_like': 11,
+}
+FIRMSITE_QUERY_BUDGET_STRICT = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'firmsite': {
+            'handlers': ['console'],
+            'level': os.environ.get('LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -125,10 +170,126 @@ WSGI_APPLICATION = 'lawfirm.wsgi.application'
 #     }
 # }
 
+# CONN_MAX_AGE keeps connections open between requests (0 closes them per
+# request); firmsite pings reused ones that sat idle for DB_HEALTH_CHECK_IDLE
+# seconds before a request uses them, unless DB_HEALTH_CHECKS=0. Behind a
+# transaction-pooling PgBouncer set DB_POOLER=1.
+DB_CONN_MAX_AGE = int(os.environ.get('CONN_MAX_AGE', 60))
+
 DATABASES = {
-     'default': dj_database_url.parse(os.environ.get("DATABASE_URL"))
+     'default': dj_database_url.parse(
+         os.environ.get("DATABASE_URL"), conn_max_age=DB_CONN_MAX_AGE)
  }
 
+# Optional read replica: reads of firmsite models go to it, except during
+# and for REPLICA_STICKY_SECONDS after a client's own writes, and when
+# building pages for the shared cache.
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = dj_database_url.parse(
+        os.environ['REPLICA_DATABASE_URL'], conn_max_age=DB_CONN_MAX_AGE)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['firmsite.routers.ReplicaRouter']
+
+for database in DATABASES.values():
+    database['DISABLE_SERVER_SIDE_CURSORS'] = (
+        os.environ.get('DB_POOLER', '0') == '1')
+
+FIRMSITE_DB_HEALTH_CHECKS = os.environ.get('DB_HEALTH_CHECKS', '1') == '1'
+FIRMSITE_DB_HEALTH_CHECK_IDLE = int(
+    os.environ.get('DB_HEALTH_CHECK_IDLE', 30))
+FIRMSITE_REPLICA_STICKY_SECONDS = int(
+    os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+# Cache
+# Any Django cache backend works here, e.g. file-based or a Redis backend
+# such as django_redis.cache.RedisCache with CACHE_LOCATION=redis://...
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'lawfirm'),
+    }
+}
+
+FIRMSITE_CACHE_ALIAS = 'default'
+# Cached pages are invalidated by bumping generation counters in this cache.
+# A worker with its own local-memory cache would keep serving pages (and
+# ETags) another worker's write made stale, so the page cache is only on by
+# default with a shared CACHE_BACKEND; PAGE_CACHE=1 forces it on, e.g. for
+# a single worker.
+FIRMSITE_PAGE_CACHE = os.environ.get(
+    'PAGE_CACHE', '1' if 'CACHE_BACKEND' in os.environ else '0') == '1'
+FIRMSITE_PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 300))
+
+# Rate limits on comment and like writes (see firmsite/ratelimit.py): rules of
+# (key, limit, seconds) per endpoint, keyed by 'user', 'ip', 'post' or a
+# combination such as 'user+post'. The counters live in the cache above, so
+# set a shared CACHE_BACKEND with several workers. PROXY_COUNT is the number
+# of proxies in front of the app (1 on Heroku) whose X-Forwarded-For entry
+# gives the client IP.
+FIRMSITE_RATE_LIMITING = os.environ.get('RATE_LIMITING', '1') == '1'
+FIRMSITE_RATE_LIMITS = {
+    'comment': [('user', 5, 60), ('user', 30, 3600), ('ip', 20, 60)],
+    'like': [('user', 30, 60), ('user+post', 6, 60), ('ip', 60, 60)],
+}
+FIRMSITE_PROXY_COUNT = int(os.environ.get('PROXY_COUNT', 0))
+
+# Post views are buffered in process ('local') or in the shared cache
+# ('cache', for several workers) and written in batches every
+# VIEW_FLUSH_INTERVAL seconds (0: only by the rank_posts command, which
+# also re-ranks the popular posts; run it periodically, e.g. every 10
+# minutes). VIEW_DEDUP_SECONDS > 0 counts one view per session or client
+# in that window.
+FIRMSITE_VIEW_BUFFER = os.environ.get('VIEW_BUFFER', 'local')
+FIRMSITE_VIEW_FLUSH_INTERVAL = int(os.environ.get('VIEW_FLUSH_INTERVAL', 30))
+FIRMSITE_VIEW_DEDUP_SECONDS = int(os.environ.get('VIEW_DEDUP_SECONDS', 0))
+
+# Sessions: 'cached_db' reads them from the cache and writes through to the
+# database, 'signed_cookies' keeps them in the signed cookie, 'db' only in
+# the database. The default uses the cache only when it is shared
+# (CACHE_BACKEND set), as workers with their own local-memory cache would
+# serve each other's stale sessions. Nothing creates a session for
+# anonymous readers, and flash messages live in a cookie.
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get(
+    'SESSION_BACKEND', 'cached_db' if 'CACHE_BACKEND' in os.environ else 'db')
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Seconds a signed-in user's session verification is cached between
+# requests, as its pk and session hash only (0: the user is fetched and
+# checked on every request, as Django does). Saving a user only drops the
+# entry from the cache of the worker that saved it, so like the session
+# cache this is on by default only with a shared CACHE_BACKEND: otherwise
+# other workers would accept a session a password change ended.
+FIRMSITE_USER_CACHE_TIMEOUT = int(os.environ.get(
+    'USER_CACHE_TIMEOUT', 60 if 'CACHE_BACKEND' in os.environ else 0))
+
+# 'keyset' pages the post feed by cursor, 'offset' by ?page=N
+FIRMSITE_FEED_PAGINATION = os.environ.get('FEED_PAGINATION', 'keyset')
+
+# HTTP caching of anonymous blog pages: seconds browsers / shared caches may
+# reuse them before revalidating by ETag. Change ETAG_SALT to expire every
+# ETag, e.g. after a deploy that changes templates.
+FIRMSITE_HTTP_MAX_AGE = int(os.environ.get('HTTP_MAX_AGE', 0))
+FIRMSITE_HTTP_S_MAXAGE = int(os.environ.get('HTTP_S_MAXAGE', 60))
+FIRMSITE_ETAG_SALT = os.environ.get('ETAG_SALT', '')
+
+# The sitemap and RSS/Atom feeds (see firmsite/feeds.py) link to SITE_URL,
+# e.g. https://example.com, or to the requested host if it is unset. Set it
+# so publish_scheduled can also warm them. The sitemap is split into
+# sections of SITEMAP_SECTION_SIZE post ids.
+FIRMSITE_SITE_URL = os.environ.get('SITE_URL', '')
+FIRMSITE_SITEMAP_SECTION_SIZE = int(
+    os.environ.get('SITEMAP_SECTION_SIZE', 10000))
+
+# Async request path (see firmsite/async_views.py): set ASYNC_VIEWS=1 and
+# serve lawfirm.asgi through an ASGI worker, e.g.
+#   gunicorn lawfirm.asgi:application -k uvicorn.workers.UvicornWorker
+# ASYNC_DB_THREADS caps concurrent database work (and connections) per
+# worker process.
+FIRMSITE_ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+FIRMSITE_ASYNC_DB_THREADS = int(os.environ.get('ASYNC_DB_THREADS', 8))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -170,9 +331,22 @@ STATICFILES_STORAGE = 'cloudinary_storage.storage.StaticHashedCloudinaryStorage'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# STATIC_PIPELINE=1 serves vendored, bundled, fingerprinted and precompressed
+# static files from the app instead of Cloudinary and the CDNs (see
+# firmsite/assets.py). Run the build_static command before starting.
+FIRMSITE_STATIC_PIPELINE = os.environ.get('STATIC_PIPELINE', '0') == '1'
+if FIRMSITE_STATIC_PIPELINE:
+    STATICFILES_STORAGE = 'firmsite.assets.CompressedManifestStorage'
+
 MEDIA_URL = '/media/'
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
+# Featured image width variants (see firmsite/images.py): 'cloudinary'
+# transformations, or 'local' Pillow resizes of <IMAGE_ROOT>/originals/
+FIRMSITE_IMAGE_BACKEND = os.environ.get('IMAGE_BACKEND', 'cloudinary')
+FIRMSITE_IMAGE_ROOT = os.environ.get(
+    'IMAGE_ROOT', os.path.join(BASE_DIR, 'media'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
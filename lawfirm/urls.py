@@ -15,9 +15,18 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from firmsite import views as firmsite_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('sitemap.xml', firmsite_views.SitemapIndex.as_view(),
+         name='sitemap'),
+    path('sitemap-posts-<int:section>.xml',
+         firmsite_views.SitemapSection.as_view(), name='sitemap_section'),
+    path('feeds/rss.xml', firmsite_views.PostFeed.as_view(feed_type='rss'),
+         name='rss_feed'),
+    path('feeds/atom.xml',
+         firmsite_views.PostFeed.as_view(feed_type='atom'), name='atom_feed'),
     path('summernote/', include('django_summernote.urls')),
     path('', include('firmsite.urls'), name='firmsite_urls'),
     path("accounts/", include("allauth.urls")),